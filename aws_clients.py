@@ -0,0 +1,68 @@
+import logging
+import threading
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_POOL_CONNECTIONS = 50
+
+# boto3 sessions are not thread safe but the low level clients built from them are, so every
+# (profile, region) pair gets one lazily created session and every service one shared client
+_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+_client_factory = None
+
+def get_client_config():
+    # boto3 and botocore take most of the startup time, so they are only imported once a client is needed
+    from botocore.config import Config
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        retries={'max_attempts': 10, 'mode': 'adaptive'},
+        tcp_keepalive=True
+    )
+
+def get_session(aws_profile='default', region_name=None):
+    key = (aws_profile, region_name)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            logging.info("Creating boto3 session for profile %s, region %s", aws_profile, region_name)
+            import boto3
+            session = boto3.Session(profile_name=aws_profile, region_name=region_name)
+            _sessions[key] = session
+        return session
+
+def get_client(service_name, aws_profile='default', region_name=None):
+    key = (service_name, aws_profile, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    if _client_factory is not None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _client_factory(service_name, aws_profile, region_name)
+                _clients[key] = client
+            return client
+    session = get_session(aws_profile, region_name)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = session.client(service_name, config=get_client_config())
+            _clients[key] = client
+        return client
+
+def get_dynamodb_client(aws_profile='default', region_name=None):
+    return get_client('dynamodb', aws_profile, region_name)
+
+def set_client_factory(client_factory):
+    # Lets tests and offline benchmarks hand out stand-in clients, e.g. fake_dynamodb.FakeDynamoDBClient
+    global _client_factory
+    reset_clients()
+    _client_factory = client_factory
+
+def reset_clients():
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
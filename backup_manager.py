@@ -0,0 +1,154 @@
+import argparse
+import json
+import logging
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import aws_clients
+import restore_dynamodb
+import utils
+import waiters
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_BACKUP_NAME_PREFIX = "scheduled"
+BACKUP_NAME_TIME_FORMAT = "%Y%m%d%H%M%S"
+BACKUP_NAME_TIME_PATTERN = r"\d{14}"
+BACKUP_NAME_MAX_LENGTH = 255
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to take on-demand backups of the DynamoDB tables of many clients and prune old ones")
+    parser.add_argument("--clients", dest="clients", action="store", required=True, help="Comma separated client names, or a JSON file with a list of them")
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--backup-name-prefix", dest="backup_name_prefix", action="store", default=DEFAULT_BACKUP_NAME_PREFIX, help="Prefix of the backups taken, only backups with it are pruned")
+    parser.add_argument("--max-workers", dest="max_workers", action="store", type=int, default=DEFAULT_MAX_WORKERS, help="Number of create and delete calls made at the same time")
+    parser.add_argument("--skip-create", dest="skip_create", action="store_true", help="Only apply the retention policy")
+    parser.add_argument("--keep-last", dest="keep_last", action="store", type=int, default=None, help="Keep the N newest backups")
+    parser.add_argument("--keep-daily", dest="keep_daily", action="store", type=int, default=None, help="Keep the newest backup of each of the N most recent days with backups")
+    parser.add_argument("--keep-weekly", dest="keep_weekly", action="store", type=int, default=None, help="Keep the newest backup of each of the N most recent ISO weeks with backups")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true", help="Report the backups the retention policy would delete without deleting them")
+    parser.add_argument("--summary-output", dest="summary_output", action="store", default="backup_summary.json")
+    return parser
+
+def read_clients(clients):
+    if clients.endswith(".json"):
+        with open(clients) as clients_file:
+            return json.load(clients_file)
+    return [client.strip() for client in clients.split(",") if client.strip()]
+
+def get_backup_name_stem(table_name, backup_name_prefix):
+    # Backup names are limited to 255 characters, table names to 255 too, so for long table names the end of the
+    # table name is cut and the timestamp is always kept
+    return ("%s-%s" % (backup_name_prefix, table_name))[:BACKUP_NAME_MAX_LENGTH - len("-yyyymmddhhmmss")]
+
+def get_backup_name(table_name, backup_name_prefix, now):
+    return "%s-%s" % (get_backup_name_stem(table_name, backup_name_prefix), now.strftime(BACKUP_NAME_TIME_FORMAT))
+
+def is_managed_backup(backup_name, table_name, backup_name_prefix):
+    # Only names get_backup_name gives this table's backups, a longer prefix ("scheduled-weekly" next to "scheduled")
+    # or a manual backup that happens to start with the prefix is left alone
+    return re.fullmatch(re.escape(get_backup_name_stem(table_name, backup_name_prefix)) + "-" + BACKUP_NAME_TIME_PATTERN, backup_name) is not None
+
+def create_backup(table_name, backup_name, aws_profile):
+    try:
+        return {"table_name": table_name, "backup_name": backup_name, "backup_arn": restore_dynamodb.on_demand_backup(table_name, backup_name, aws_profile), "error": None}
+    except Exception as err:
+        logging.info("Failed to start backup of %s: %s", table_name, err)
+        return {"table_name": table_name, "backup_name": backup_name, "backup_arn": None, "error": str(err)}
+
+def create_backups(table_names, aws_profile='default', backup_name_prefix=DEFAULT_BACKUP_NAME_PREFIX, max_workers=DEFAULT_MAX_WORKERS):
+    # Backups are started in parallel, then a single event loop polls all of them instead of a waiter per table
+    now = datetime.now(timezone.utc)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        backups = list(executor.map(lambda table_name: create_backup(table_name, get_backup_name(table_name, backup_name_prefix, now), aws_profile), table_names))
+    started_backups = [backup for backup in backups if backup["backup_arn"]]
+    results = waiters.wait([waiters.backup_available(backup["backup_arn"], aws_profile) for backup in started_backups], max_workers)
+    for backup, result in zip(started_backups, results):
+        backup["status"] = result.state
+        if not result.succeeded:
+            backup["error"] = "%s: %s" % (result.status, result.error)
+    return backups
+
+def list_table_backups(table_name, aws_profile='default', backup_name_prefix=DEFAULT_BACKUP_NAME_PREFIX):
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    backups = []
+    for page in dynamodb_client.get_paginator('list_backups').paginate(TableName=table_name, BackupType='USER'):
+        for backup in page['BackupSummaries']:
+            if is_managed_backup(backup['BackupName'], table_name, backup_name_prefix):
+                backups.append(backup)
+    return backups
+
+def select_backups_to_keep(backups, keep_last=None, keep_daily=None, keep_weekly=None):
+    # A backup is kept if any rule keeps it, rules left unset keep nothing
+    backups = sorted(backups, key=lambda backup: utils.convert_datetime_to_utc_tz(backup['BackupCreationDateTime']), reverse=True)
+    keep = set(backup['BackupArn'] for backup in backups[:keep_last or 0])
+    for keep_count, get_period in ((keep_daily, lambda created_at: created_at.date()), (keep_weekly, lambda created_at: created_at.isocalendar()[:2])):
+        periods = set()
+        for backup in backups:
+            if len(periods) >= (keep_count or 0):
+                break
+            period = get_period(utils.convert_datetime_to_utc_tz(backup['BackupCreationDateTime']))
+            if period not in periods:
+                periods.add(period)
+                keep.add(backup['BackupArn'])
+    return keep
+
+def delete_backup(backup_arn, aws_profile):
+    try:
+        aws_clients.get_dynamodb_client(aws_profile).delete_backup(BackupArn=backup_arn)
+        return None
+    except Exception as err:
+        logging.info("Failed to delete backup %s: %s", backup_arn, err)
+        return str(err)
+
+def prune_backups(table_names, aws_profile='default', backup_name_prefix=DEFAULT_BACKUP_NAME_PREFIX, keep_last=None, keep_daily=None, keep_weekly=None,
+                  max_workers=DEFAULT_MAX_WORKERS, dry_run=False):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        table_backups = list(executor.map(lambda table_name: list_table_backups(table_name, aws_profile, backup_name_prefix), table_names))
+        to_delete = []
+        for table_name, backups in zip(table_names, table_backups):
+            keep = select_backups_to_keep(backups, keep_last, keep_daily, keep_weekly)
+            # Backups still being created are left alone, they are pruned by a later run if no rule keeps them
+            table_to_delete = [backup for backup in backups if backup['BackupArn'] not in keep and backup['BackupStatus'] == "AVAILABLE"]
+            logging.info("%s has %s backups named %s-%s-<timestamp>, keeping %s, deleting %s", table_name, len(backups), backup_name_prefix, table_name, len(keep), len(table_to_delete))
+            to_delete += [{"table_name": table_name, "backup_name": backup['BackupName'], "backup_arn": backup['BackupArn']} for backup in table_to_delete]
+        if not dry_run:
+            for backup, error in zip(to_delete, executor.map(lambda backup: delete_backup(backup["backup_arn"], aws_profile), to_delete)):
+                backup["error"] = error
+    return to_delete
+
+def manage_backups(clients, env, aws_profile='default', backup_name_prefix=DEFAULT_BACKUP_NAME_PREFIX, max_workers=DEFAULT_MAX_WORKERS, create=True,
+                   keep_last=None, keep_daily=None, keep_weekly=None, dry_run=False):
+    start = time.perf_counter()
+    table_names = [table_name for client in clients for table_name in utils.get_dynamodb_tables(client, env)]
+    created = create_backups(table_names, aws_profile, backup_name_prefix, max_workers) if create else []
+    pruned = []
+    if keep_last is not None or keep_daily is not None or keep_weekly is not None:
+        pruned = prune_backups(table_names, aws_profile, backup_name_prefix, keep_last, keep_daily, keep_weekly, max_workers, dry_run)
+    summary = {
+        "tables": len(table_names),
+        "created": created,
+        "pruned": pruned,
+        "dry_run": dry_run,
+        "failed": sum(1 for backup in created + pruned if backup.get("error")),
+        "duration_seconds": round(time.perf_counter() - start, 3)
+    }
+    logging.info("Backed up %s of %s tables, %s %s old backups, %s failures in %.1f seconds", sum(1 for backup in created if not backup["error"]), len(table_names) if create else 0,
+                 "would delete" if dry_run else "deleted", len(pruned), summary["failed"], summary["duration_seconds"])
+    return summary
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    summary = manage_backups(read_clients(args.clients), args.env, args.aws_profile, args.backup_name_prefix, args.max_workers, not args.skip_create,
+                             args.keep_last, args.keep_daily, args.keep_weekly, args.dry_run)
+    with open(args.summary_output, "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
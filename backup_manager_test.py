@@ -0,0 +1,95 @@
+import argparse
+import aws_clients
+import backup_manager
+import fake_dynamodb
+import logging
+import restore_dynamodb
+import sys
+from datetime import datetime, timezone
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test taking and pruning scheduled DynamoDB backups")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='backup-manager-test')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def create_table(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_dynamodb.delete_table_if_exist(table_name, aws_profile)
+    client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+def get_backup_names(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    return sorted(backup['BackupName'] for page in client.get_paginator('list_backups').paginate(TableName=table_name, BackupType='USER') for backup in page['BackupSummaries'])
+
+def test_long_table_name_keeps_timestamp(args):
+    try:
+        logging.info("############-test_long_table_name_keeps_timestamp-#############")
+        table_name = "t" * 255
+        now = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        backup_name = backup_manager.get_backup_name(table_name, backup_manager.DEFAULT_BACKUP_NAME_PREFIX, now)
+        if len(backup_name) != 255 or not backup_name.endswith("-20240102030405") or not backup_name.startswith("scheduled-ttt"):
+            raise Exception("Expected a 255 character name ending with the timestamp, got %s" % backup_name)
+        if not backup_manager.is_managed_backup(backup_name, table_name, backup_manager.DEFAULT_BACKUP_NAME_PREFIX):
+            raise Exception("Retention doesn't recognise the shortened name %s" % backup_name)
+        short_name = backup_manager.get_backup_name("table", "scheduled", now)
+        if short_name != "scheduled-table-20240102030405":
+            raise Exception("Expected scheduled-table-20240102030405, got %s" % short_name)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_prune_only_matching_names(args):
+    try:
+        logging.info("############-test_prune_only_matching_names-#############")
+        create_table(args.table_name, args.aws_profile)
+        client = aws_clients.get_dynamodb_client(args.aws_profile)
+        # Backups another schedule or a person took, which a "scheduled" retention run must not touch
+        other_backups = ["scheduled-weekly-%s-20240101000000" % args.table_name, "scheduled-%s-before-migration" % args.table_name,
+                         "scheduled-%s-20240101000000-copy" % args.table_name]
+        for backup_name in other_backups:
+            client.create_backup(TableName=args.table_name, BackupName=backup_name)
+        for _ in range(3):
+            client.create_backup(TableName=args.table_name, BackupName=backup_manager.get_backup_name(args.table_name, "scheduled", datetime.now(timezone.utc)))
+        pruned = backup_manager.prune_backups([args.table_name], args.aws_profile, "scheduled", keep_last=1)
+        if len(pruned) != 2 or any(backup["error"] for backup in pruned):
+            raise Exception("Expected 2 scheduled backups pruned, got %s" % pruned)
+        remaining_names = get_backup_names(args.table_name, args.aws_profile)
+        if len(remaining_names) != 4:
+            raise Exception("Expected the 3 other backups and 1 scheduled backup left, got %s" % remaining_names)
+        if not set(other_backups) <= set(remaining_names):
+            raise Exception("Backups %s were pruned although they don't match the scheduled names" % sorted(set(other_backups) - set(remaining_names)))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_long_table_name_keeps_timestamp(args)
+    test_2_status = test_prune_only_matching_names(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_long_table_name_keeps_timestamp")
+    log_test_status_successful_if_0(test_2_status, "test_prune_only_matching_names")
+
+    if test_1_status == 0 and test_2_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SOURCE_VALIDATED = "source_validated"
+# Marked just before the restore call, a rerun that finds it without RESTORE_ISSUED may have a target being created
+RESTORE_ISSUING = "restore_issuing"
+RESTORE_ISSUED = "restore_issued"
+TABLE_ACTIVE = "table_active"
+PITR_ENABLED = "pitr_enabled"
+TRUNCATED = "truncated"
+
+class RestoreCheckpoint:
+    """Durable progress of one restore, so a rerun resumes after the last completed step or scan page.
+
+    Without a path the checkpoint is only kept in memory, which is what library callers get by default.
+    """
+
+    def __init__(self, path=None, state=None):
+        self.path = path
+        self.state = state or {"steps": {}, "segments": {}}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, checkpoint_dir, source_table, target_table, restore_datetime):
+        if checkpoint_dir is None:
+            return cls()
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        file_name = re.sub(r"[^A-Za-z0-9_.-]", "_", "%s--%s--%s.json" % (source_table, target_table, restore_datetime))
+        path = os.path.join(checkpoint_dir, file_name)
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        logging.info("Resuming restore of %s from checkpoint %s, completed steps: %s", target_table, path, ", ".join(state["steps"]) or "none")
+        return cls(path, state)
+
+    def _save(self):
+        if self.path is None:
+            return
+        # Written to a temporary file and renamed so a crash never leaves a half written checkpoint
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(self.state, checkpoint_file, indent=2)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, self.path)
+
+    def is_done(self, step):
+        return step in self.state["steps"]
+
+    def get(self, step):
+        return self.state["steps"].get(step)
+
+    def mark_done(self, step, **values):
+        with self._lock:
+            self.state["steps"][step] = values
+            self._save()
+        logging.info("Checkpoint: %s done", step)
+
+    def get_segment(self, segment):
+        return self.state["segments"].get(str(segment), {"last_evaluated_key": None, "scanned": 0, "deleted": 0, "done": False})
+
+    def update_segment(self, segment, last_evaluated_key, scanned, deleted):
+        with self._lock:
+            self.state["segments"][str(segment)] = {"last_evaluated_key": last_evaluated_key, "scanned": scanned, "deleted": deleted,
+                                                    "done": last_evaluated_key is None}
+            self._save()
+
+    def remove(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+            logging.info("Checkpoint %s removed", self.path)
@@ -0,0 +1,546 @@
+import bisect
+import math
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone, timedelta
+from decimal import Decimal
+from botocore.exceptions import ClientError
+import aws_clients
+
+ACCOUNT_ID = "000000000000"
+REGION = "local"
+DEFAULT_PAGE_SIZE = 1000
+PITR_RETENTION = timedelta(days=35)
+
+COMPARISON_OPERATORS = ["<=", ">=", "<>", "=", "<", ">"]
+
+def make_exception(error_code):
+    def init(self, message="", operation_name="FakeDynamoDB"):
+        ClientError.__init__(self, {"Error": {"Code": error_code, "Message": message}}, operation_name)
+    return type(error_code, (ClientError,), {"__init__": init})
+
+class FakeExceptions:
+    ClientError = ClientError
+    ResourceNotFoundException = make_exception("ResourceNotFoundException")
+    ResourceInUseException = make_exception("ResourceInUseException")
+    TableNotFoundException = make_exception("TableNotFoundException")
+    TableAlreadyExistsException = make_exception("TableAlreadyExistsException")
+    TableInUseException = make_exception("TableInUseException")
+    BackupNotFoundException = make_exception("BackupNotFoundException")
+    BackupInUseException = make_exception("BackupInUseException")
+    PointInTimeRecoveryUnavailableException = make_exception("PointInTimeRecoveryUnavailableException")
+    InvalidRestoreTimeException = make_exception("InvalidRestoreTimeException")
+    ContinuousBackupsUnavailableException = make_exception("ContinuousBackupsUnavailableException")
+    ValidationException = make_exception("ValidationException")
+
+def copy_item(item):
+    return {name: dict(value) for name, value in item.items()}
+
+def item_size(item):
+    # Close enough to DynamoDB's item size rules to estimate consumed capacity and table size
+    size = 0
+    for name, value in item.items():
+        size += len(name)
+        for attribute_value in value.values():
+            size += len(attribute_value) if isinstance(attribute_value, (str, bytes)) else len(str(attribute_value))
+    return size
+
+def comparable(attribute_value):
+    if "N" in attribute_value:
+        return Decimal(attribute_value["N"])
+    if "S" in attribute_value:
+        return attribute_value["S"]
+    if "B" in attribute_value:
+        return attribute_value["B"]
+    raise FakeExceptions.ValidationException("Unsupported attribute value for comparison: %s" % attribute_value)
+
+def compare(left, operator, right):
+    if left is None or right is None:
+        return False
+    left, right = comparable(left), comparable(right)
+    if operator == "=":
+        return left == right
+    if operator == "<>":
+        return left != right
+    if operator == "<":
+        return left < right
+    if operator == "<=":
+        return left <= right
+    if operator == ">":
+        return left > right
+    return left >= right
+
+def resolve_name(token, names):
+    token = token.strip()
+    return names[token] if token.startswith("#") else token
+
+def parse_condition(expression, names):
+    """Parses `a <op> b AND c <op> d`, the only condition shape this repo sends, into (name, op, operand) tuples."""
+    conditions = []
+    for clause in re.split(r"\s+AND\s+", expression.strip(), flags=re.IGNORECASE):
+        for operator in COMPARISON_OPERATORS:
+            if operator in clause:
+                left, right = clause.split(operator, 1)
+                conditions.append((left.strip(), operator, right.strip()))
+                break
+        else:
+            raise FakeExceptions.ValidationException("Unsupported condition expression: %s" % clause)
+    return conditions
+
+def evaluate_conditions(item, conditions, names, values):
+    def operand(token):
+        if token.startswith(":"):
+            return values[token]
+        return item.get(resolve_name(token, names))
+    return all(compare(operand(left), operator, operand(right)) for left, operator, right in conditions)
+
+def project(item, projection_expression, names):
+    if not projection_expression:
+        return copy_item(item)
+    attributes = [resolve_name(token, names) for token in projection_expression.split(",")]
+    return {name: dict(item[name]) for name in attributes if name in item}
+
+class FakeTable:
+    def __init__(self, name, key_schema, attribute_definitions, billing_mode, provisioned_throughput, global_secondary_indexes, now):
+        self.name = name
+        self.key_schema = key_schema
+        self.attribute_definitions = attribute_definitions
+        self.billing_mode = billing_mode
+        self.provisioned_throughput = provisioned_throughput
+        self.global_secondary_indexes = global_secondary_indexes or []
+        self.key_names = [key["AttributeName"] for key in key_schema]
+        self.items = {}
+        self.size_bytes = 0
+        # Every write is appended here so point in time restores can replay the table up to any moment
+        self.history = []
+        self.created_at = now
+        self.active_at = now
+        self.deleting_until = None
+        self.pitr_enabled_at = None
+        self.lock = threading.RLock()
+
+    def key_of(self, item):
+        return tuple(comparable(item[name]) if name in item else None for name in self.key_names)
+
+    def status(self, now):
+        if self.deleting_until is not None:
+            return "DELETING"
+        return "ACTIVE" if now >= self.active_at else "CREATING"
+
+class FakeWaiter:
+    def __init__(self, client, waiter_name):
+        self.client = client
+        self.waiter_name = waiter_name
+
+    def wait(self, TableName, WaiterConfig=None):
+        config = WaiterConfig or {}
+        for _ in range(config.get("MaxAttempts", 25)):
+            try:
+                status = self.client.describe_table(TableName=TableName)["Table"]["TableStatus"]
+                if self.waiter_name == "table_exists" and status == "ACTIVE":
+                    return
+            except self.client.exceptions.ResourceNotFoundException:
+                if self.waiter_name == "table_not_exists":
+                    return
+            time.sleep(min(config.get("Delay", 0.1), 0.1))
+        raise Exception("Waiter %s failed for table %s" % (self.waiter_name, TableName))
+
+# Operations whose pages are linked by something other than LastEvaluatedKey/ExclusiveStartKey
+PAGINATION_TOKENS = {"list_backups": ("LastEvaluatedBackupArn", "ExclusiveStartBackupArn")}
+
+class FakePaginator:
+    def __init__(self, client, operation_name):
+        self.client = client
+        self.operation_name = operation_name
+
+    def paginate(self, **kwargs):
+        operation = getattr(self.client, self.operation_name)
+        output_token, input_token = PAGINATION_TOKENS.get(self.operation_name, ("LastEvaluatedKey", "ExclusiveStartKey"))
+        while True:
+            page = operation(**kwargs)
+            yield page
+            if output_token not in page:
+                return
+            kwargs = dict(kwargs, **{input_token: page[output_token]})
+
+class FakeDynamoDBClient:
+    """In-process stand-in for the DynamoDB client calls this repo makes.
+
+    Tables are CREATING for `creating_seconds` after create/restore and DELETING for `deleting_seconds`
+    after delete, backups take `backup_seconds` to become AVAILABLE and data plane calls on tables
+    that aren't ACTIVE fail like they do on DynamoDB. Point in time restores replay the source
+    table's write history up to the requested time.
+    """
+
+    exceptions = FakeExceptions
+
+    def __init__(self, creating_seconds=0, deleting_seconds=0, backup_seconds=0, page_size=DEFAULT_PAGE_SIZE, clock=time.time):
+        self.creating_seconds = creating_seconds
+        self.deleting_seconds = deleting_seconds
+        self.backup_seconds = backup_seconds
+        self.page_size = page_size
+        self.clock = clock
+        self.tables = {}
+        self.backups = {}
+        self.call_counts = {}
+        self._lock = threading.RLock()
+        # Scan cursors keyed by (table, segment, total segments, last returned key), see scan
+        self._scan_cursors = {}
+
+    def _count(self, operation_name):
+        with self._lock:
+            self.call_counts[operation_name] = self.call_counts.get(operation_name, 0) + 1
+
+    def _now(self):
+        return self.clock()
+
+    def _table_arn(self, table_name):
+        return "arn:aws:dynamodb:%s:%s:table/%s" % (REGION, ACCOUNT_ID, table_name)
+
+    def _get_table(self, table_name):
+        with self._lock:
+            table = self.tables.get(table_name)
+            if table is not None and table.deleting_until is not None and self._now() >= table.deleting_until:
+                del self.tables[table_name]
+                table = None
+        if table is None:
+            raise FakeExceptions.ResourceNotFoundException("Requested resource not found: Table: %s not found" % table_name)
+        return table
+
+    def _get_active_table(self, table_name):
+        table = self._get_table(table_name)
+        if table.status(self._now()) != "ACTIVE":
+            raise FakeExceptions.ResourceNotFoundException("Requested resource not found: Table %s is %s" % (table_name, table.status(self._now())))
+        return table
+
+    def _add_table(self, table):
+        with self._lock:
+            if table.name in self.tables:
+                try:
+                    self._get_table(table.name)
+                    raise FakeExceptions.ResourceInUseException("Table already exists: %s" % table.name)
+                except FakeExceptions.ResourceNotFoundException:
+                    pass
+            table.active_at = self._now() + self.creating_seconds
+            self.tables[table.name] = table
+
+    def _write(self, table, item=None, key=None):
+        with table.lock:
+            now = self._now()
+            key = table.key_of(item) if item is not None else key
+            previous_item = table.items.pop(key, None)
+            if previous_item is not None:
+                table.size_bytes -= item_size(previous_item)
+            if item is not None:
+                table.items[key] = copy_item(item)
+                table.size_bytes += item_size(item)
+            table.history.append((now, key, table.items.get(key)))
+
+    def _table_description(self, table):
+        now = self._now()
+        description = {
+            "TableName": table.name,
+            "TableArn": self._table_arn(table.name),
+            "TableStatus": table.status(now),
+            "KeySchema": table.key_schema,
+            "AttributeDefinitions": table.attribute_definitions,
+            "CreationDateTime": datetime.fromtimestamp(table.created_at, tz=timezone.utc),
+            "ItemCount": len(table.items),
+            "TableSizeBytes": table.size_bytes,
+            "BillingModeSummary": {"BillingMode": table.billing_mode},
+            "ProvisionedThroughput": table.provisioned_throughput
+        }
+        if table.global_secondary_indexes:
+            description["GlobalSecondaryIndexes"] = [dict(index, IndexStatus="ACTIVE") for index in table.global_secondary_indexes]
+        return description
+
+    def create_table(self, TableName, KeySchema, AttributeDefinitions, BillingMode="PROVISIONED", ProvisionedThroughput=None, GlobalSecondaryIndexes=None, **kwargs):
+        self._count("CreateTable")
+        throughput = ProvisionedThroughput or {"ReadCapacityUnits": 0, "WriteCapacityUnits": 0}
+        table = FakeTable(TableName, KeySchema, AttributeDefinitions, BillingMode, throughput, GlobalSecondaryIndexes, self._now())
+        self._add_table(table)
+        return {"TableDescription": self._table_description(table)}
+
+    def describe_table(self, TableName):
+        self._count("DescribeTable")
+        return {"Table": self._table_description(self._get_table(TableName))}
+
+    def delete_table(self, TableName):
+        self._count("DeleteTable")
+        table = self._get_table(TableName)
+        if table.deleting_until is not None:
+            raise FakeExceptions.ResourceInUseException("Table %s is being deleted" % TableName)
+        table.deleting_until = self._now() + self.deleting_seconds
+        return {"TableDescription": self._table_description(table)}
+
+    def update_continuous_backups(self, TableName, PointInTimeRecoverySpecification):
+        self._count("UpdateContinuousBackups")
+        table = self._get_active_table(TableName)
+        if PointInTimeRecoverySpecification["PointInTimeRecoveryEnabled"]:
+            table.pitr_enabled_at = table.pitr_enabled_at or self._now()
+        else:
+            table.pitr_enabled_at = None
+        return self.describe_continuous_backups(TableName)
+
+    def _earliest_restorable_time(self, table):
+        return max(table.pitr_enabled_at, self._now() - PITR_RETENTION.total_seconds())
+
+    def describe_continuous_backups(self, TableName):
+        self._count("DescribeContinuousBackups")
+        table = self._get_table(TableName)
+        pitr_description = {"PointInTimeRecoveryStatus": "ENABLED" if table.pitr_enabled_at is not None else "DISABLED"}
+        if table.pitr_enabled_at is not None:
+            pitr_description["EarliestRestorableDateTime"] = datetime.fromtimestamp(self._earliest_restorable_time(table), tz=timezone.utc)
+            pitr_description["LatestRestorableDateTime"] = datetime.fromtimestamp(self._now(), tz=timezone.utc)
+        return {"ContinuousBackupsDescription": {"ContinuousBackupsStatus": "ENABLED", "PointInTimeRecoveryDescription": pitr_description}}
+
+    def _restored_table(self, source_table, target_table_name, items):
+        table = FakeTable(target_table_name, source_table.key_schema, source_table.attribute_definitions, source_table.billing_mode,
+                          source_table.provisioned_throughput, source_table.global_secondary_indexes, self._now())
+        table.items = items
+        table.size_bytes = sum(item_size(item) for item in items.values())
+        table.history = [(self._now(), key, item) for key, item in items.items()]
+        self._add_table(table)
+        return table
+
+    def restore_table_to_point_in_time(self, SourceTableName, TargetTableName, RestoreDateTime=None, UseLatestRestorableTime=False, **kwargs):
+        self._count("RestoreTableToPointInTime")
+        source_table = self._get_table(SourceTableName)
+        if source_table.pitr_enabled_at is None:
+            raise FakeExceptions.PointInTimeRecoveryUnavailableException("Point in time recovery is not enabled for table %s" % SourceTableName)
+        restore_time = self._now() if UseLatestRestorableTime else RestoreDateTime.timestamp()
+        # A millisecond of slack for the float round trip of the restore time through datetime
+        if restore_time < self._earliest_restorable_time(source_table) - 0.001 or restore_time > self._now():
+            raise FakeExceptions.InvalidRestoreTimeException("Restore time %s is outside the restorable window" % RestoreDateTime)
+        items = {}
+        with source_table.lock:
+            for written_at, key, item in source_table.history:
+                if written_at > restore_time:
+                    break
+                if item is None:
+                    items.pop(key, None)
+                else:
+                    items[key] = item
+        table = self._restored_table(source_table, TargetTableName, items)
+        return {"TableDescription": self._table_description(table)}
+
+    def create_backup(self, TableName, BackupName):
+        self._count("CreateBackup")
+        table = self._get_active_table(TableName)
+        now = self._now()
+        backup_arn = "%s/backup/%d-%s" % (self._table_arn(TableName), int(now * 1000), uuid.uuid4().hex[:8])
+        with table.lock:
+            items = dict(table.items)
+        self.backups[backup_arn] = {"BackupName": BackupName, "TableName": TableName, "CreatedAt": now, "Items": items, "Table": table, "Deleted": False}
+        return {"BackupDetails": self._backup_details(backup_arn)}
+
+    def _get_backup(self, backup_arn):
+        backup = self.backups.get(backup_arn)
+        if backup is None or backup["Deleted"]:
+            raise FakeExceptions.BackupNotFoundException("Backup not found: %s" % backup_arn)
+        return backup
+
+    def _backup_details(self, backup_arn):
+        backup = self.backups[backup_arn]
+        if backup["Deleted"]:
+            status = "DELETED"
+        else:
+            status = "AVAILABLE" if self._now() >= backup["CreatedAt"] + self.backup_seconds else "CREATING"
+        return {
+            "BackupArn": backup_arn,
+            "BackupName": backup["BackupName"],
+            "BackupStatus": status,
+            "BackupType": "USER",
+            "BackupCreationDateTime": datetime.fromtimestamp(backup["CreatedAt"], tz=timezone.utc),
+            "BackupSizeBytes": sum(item_size(item) for item in backup["Items"].values())
+        }
+
+    def describe_backup(self, BackupArn):
+        self._count("DescribeBackup")
+        self._get_backup(BackupArn)
+        backup = self.backups[BackupArn]
+        return {"BackupDescription": {"BackupDetails": self._backup_details(BackupArn),
+                                      "SourceTableDetails": {"TableName": backup["TableName"], "TableArn": self._table_arn(backup["TableName"]), "ItemCount": len(backup["Items"])}}}
+
+    def list_backups(self, TableName=None, TimeRangeLowerBound=None, TimeRangeUpperBound=None, BackupType="ALL", ExclusiveStartBackupArn=None, Limit=None):
+        self._count("ListBackups")
+        summaries = []
+        for backup_arn, backup in sorted(self.backups.items(), key=lambda entry: entry[1]["CreatedAt"]):
+            if backup["Deleted"] or (TableName is not None and backup["TableName"] != TableName):
+                continue
+            if TimeRangeLowerBound is not None and backup["CreatedAt"] < TimeRangeLowerBound.timestamp():
+                continue
+            if TimeRangeUpperBound is not None and backup["CreatedAt"] >= TimeRangeUpperBound.timestamp():
+                continue
+            details = self._backup_details(backup_arn)
+            details.update({"TableName": backup["TableName"], "TableArn": self._table_arn(backup["TableName"])})
+            summaries.append(details)
+        if ExclusiveStartBackupArn is not None:
+            arns = [summary["BackupArn"] for summary in summaries]
+            summaries = summaries[arns.index(ExclusiveStartBackupArn) + 1:] if ExclusiveStartBackupArn in arns else []
+        limit = Limit or 100
+        response = {"BackupSummaries": summaries[:limit]}
+        if len(summaries) > limit:
+            response["LastEvaluatedBackupArn"] = summaries[limit - 1]["BackupArn"]
+        return response
+
+    def delete_backup(self, BackupArn):
+        self._count("DeleteBackup")
+        self._get_backup(BackupArn)
+        self.backups[BackupArn]["Deleted"] = True
+        return {"BackupDescription": {"BackupDetails": self._backup_details(BackupArn)}}
+
+    def restore_table_from_backup(self, TargetTableName, BackupArn, **kwargs):
+        self._count("RestoreTableFromBackup")
+        backup = self._get_backup(BackupArn)
+        table = self._restored_table(backup["Table"], TargetTableName, dict(backup["Items"]))
+        return {"TableDescription": self._table_description(table)}
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._count("PutItem")
+        self._write(self._get_active_table(TableName), item=Item)
+        return {}
+
+    def get_item(self, TableName, Key, **kwargs):
+        self._count("GetItem")
+        table = self._get_active_table(TableName)
+        item = table.items.get(table.key_of(Key))
+        return {"Item": copy_item(item)} if item is not None else {}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self._count("DeleteItem")
+        table = self._get_active_table(TableName)
+        self._write(table, key=table.key_of(Key))
+        return {}
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity="NONE"):
+        self._count("BatchWriteItem")
+        consumed_capacity = []
+        for table_name, requests in RequestItems.items():
+            if len(requests) > 25:
+                raise FakeExceptions.ValidationException("Too many items requested for the BatchWriteItem call")
+            table = self._get_active_table(table_name)
+            capacity_units = 0
+            for request in requests:
+                if "PutRequest" in request:
+                    self._write(table, item=request["PutRequest"]["Item"])
+                    capacity_units += max(1, math.ceil(item_size(request["PutRequest"]["Item"]) / 1024))
+                else:
+                    self._write(table, key=table.key_of(request["DeleteRequest"]["Key"]))
+                    capacity_units += 1
+            consumed_capacity.append({"TableName": table_name, "CapacityUnits": capacity_units})
+        response = {"UnprocessedItems": {}}
+        if ReturnConsumedCapacity != "NONE":
+            response["ConsumedCapacity"] = consumed_capacity
+        return response
+
+    def _page_response(self, table_name, items, scanned_count, read_bytes, consistent_read, return_consumed_capacity, select, last_key):
+        response = {"Count": len(items), "ScannedCount": scanned_count}
+        if select != "COUNT":
+            response["Items"] = items
+        if last_key is not None:
+            response["LastEvaluatedKey"] = last_key
+        if return_consumed_capacity and return_consumed_capacity != "NONE":
+            capacity_units = math.ceil(read_bytes / 4096) * (1 if consistent_read else 0.5)
+            response["ConsumedCapacity"] = {"TableName": table_name, "CapacityUnits": capacity_units}
+        return response
+
+    def scan(self, TableName, Segment=None, TotalSegments=None, ExclusiveStartKey=None, Limit=None, Select=None, ProjectionExpression=None,
+             FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, ConsistentRead=False, ReturnConsumedCapacity="NONE", **kwargs):
+        self._count("Scan")
+        table = self._get_active_table(TableName)
+        names = ExpressionAttributeNames or {}
+        conditions = parse_condition(FilterExpression, names) if FilterExpression else None
+        segment, total_segments = (Segment, TotalSegments) if TotalSegments else (0, 1)
+        cursor = None
+        if ExclusiveStartKey is not None:
+            start_key = table.key_of(ExclusiveStartKey)
+            with self._lock:
+                cursor = self._scan_cursors.pop((TableName, segment, total_segments, start_key), None)
+        if cursor is not None:
+            keys, position = cursor
+        else:
+            # Segments are scanned in key order, so a scan resumed from a LastEvaluatedKey of another process
+            # (or one whose item has since been deleted) continues right after that key
+            with table.lock:
+                keys = sorted(key for key in table.items if zlib.crc32(repr(key).encode()) % total_segments == segment)
+            position = bisect.bisect_right(keys, start_key) if ExclusiveStartKey is not None else 0
+        page_size = min(Limit or self.page_size, self.page_size)
+        page_keys = keys[position:position + page_size]
+        items = []
+        read_bytes = 0
+        scanned_count = 0
+        for key in page_keys:
+            item = table.items.get(key)
+            if item is None:
+                continue
+            scanned_count += 1
+            read_bytes += item_size(item)
+            if conditions is None or evaluate_conditions(item, conditions, names, ExpressionAttributeValues or {}):
+                items.append(project(item, ProjectionExpression, names))
+        last_key = None
+        if position + page_size < len(keys):
+            last_item_key = page_keys[-1]
+            last_key = {name: {"S": value} if isinstance(value, str) else {"N": str(value)} for name, value in zip(table.key_names, last_item_key)}
+            with self._lock:
+                self._scan_cursors[(TableName, segment, total_segments, last_item_key)] = (keys, position + page_size)
+        return self._page_response(TableName, items, scanned_count, read_bytes, ConsistentRead, ReturnConsumedCapacity, Select, last_key)
+
+    def query(self, TableName, KeyConditionExpression, IndexName=None, ExclusiveStartKey=None, Limit=None, Select=None, ProjectionExpression=None,
+              FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, ConsistentRead=False, ReturnConsumedCapacity="NONE", **kwargs):
+        self._count("Query")
+        table = self._get_active_table(TableName)
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        key_schema = table.key_schema
+        if IndexName is not None:
+            key_schema = [index for index in table.global_secondary_indexes if index["IndexName"] == IndexName][0]["KeySchema"]
+        range_names = [key["AttributeName"] for key in key_schema if key["KeyType"] == "RANGE"]
+        key_conditions = parse_condition(KeyConditionExpression, names)
+        filter_conditions = parse_condition(FilterExpression, names) if FilterExpression else None
+        with table.lock:
+            matches = [item for item in table.items.values() if evaluate_conditions(item, key_conditions, names, values)]
+        if range_names:
+            matches.sort(key=lambda item: comparable(item[range_names[0]]))
+        if ExclusiveStartKey is not None:
+            start_key = table.key_of(ExclusiveStartKey)
+            match_keys = [table.key_of(item) for item in matches]
+            matches = matches[match_keys.index(start_key) + 1:] if start_key in match_keys else []
+        page_size = min(Limit or self.page_size, self.page_size)
+        page = matches[:page_size]
+        items = [project(item, ProjectionExpression, names) for item in page
+                 if filter_conditions is None or evaluate_conditions(item, filter_conditions, names, values)]
+        last_key = {name: dict(page[-1][name]) for name in table.key_names} if len(matches) > page_size else None
+        return self._page_response(TableName, items, len(page), sum(item_size(item) for item in page), ConsistentRead, ReturnConsumedCapacity, Select, last_key)
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(self, operation_name)
+
+    def get_waiter(self, waiter_name):
+        return FakeWaiter(self, waiter_name)
+
+    def load_items(self, table_name, items):
+        """Bulk loads items without going through the API, for generating large benchmark tables."""
+        table = self._get_active_table(table_name)
+        now = self._now()
+        with table.lock:
+            for item in items:
+                key = table.key_of(item)
+                previous_item = table.items.get(key)
+                if previous_item is not None:
+                    table.size_bytes -= item_size(previous_item)
+                table.items[key] = item
+                table.size_bytes += item_size(item)
+                table.history.append((now, key, item))
+
+def install(fake_client=None):
+    """Makes every aws_clients lookup return the given (or a new) FakeDynamoDBClient."""
+    fake_client = fake_client or FakeDynamoDBClient()
+    aws_clients.set_client_factory(lambda service_name, aws_profile, region_name: fake_client)
+    return fake_client
+
+def uninstall():
+    aws_clients.set_client_factory(None)
@@ -0,0 +1,199 @@
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+class FakeWatchedApi:
+    """Resource versions and watch queues shared by the fake APIs, FakeWatch streams from them."""
+
+    def __init__(self):
+        self._resource_version = 0
+        self._watchers = {}
+        self._lock = threading.RLock()
+
+    def _next_resource_version(self):
+        self._resource_version += 1
+        return str(self._resource_version)
+
+    def _notify(self, namespace, event_type, resource):
+        for watcher_queue in list(self._watchers.get(namespace, [])):
+            watcher_queue.put({"type": event_type, "object": self._snapshot(resource)})
+
+    def _add_watcher(self, namespace, watcher_queue):
+        with self._lock:
+            self._watchers.setdefault(namespace, []).append(watcher_queue)
+
+    def _remove_watcher(self, namespace, watcher_queue):
+        with self._lock:
+            self._watchers.get(namespace, []).remove(watcher_queue)
+
+class FakeAppsV1Api(FakeWatchedApi):
+    """In-process stand-in for the AppsV1Api deployment calls k8s_control makes.
+
+    Scaling a deployment takes `transition_seconds` before its status catches up, and every status
+    change is delivered to the watches of its namespace like a real API server would. The pods of the
+    deployment live in `core_api`, pods removed by a scale down keep terminating for another
+    `pod_termination_seconds` after the status already shows them gone.
+    """
+
+    def __init__(self, transition_seconds=0.1, core_api=None, pod_termination_seconds=0.1):
+        super().__init__()
+        self.transition_seconds = transition_seconds
+        self.pod_termination_seconds = pod_termination_seconds
+        self.core_api = core_api or FakeCoreV1Api()
+        self.deployments = {}
+        self.call_counts = {}
+        # Deployments scaled up while pods of their previous replicas were still there
+        self.scaled_up_before_pods_deleted = []
+
+    def _count(self, operation_name):
+        with self._lock:
+            self.call_counts[operation_name] = self.call_counts.get(operation_name, 0) + 1
+
+    def _snapshot(self, deployment):
+        return SimpleNamespace(
+            metadata=SimpleNamespace(**vars(deployment.metadata)),
+            spec=SimpleNamespace(replicas=deployment.spec.replicas, selector=SimpleNamespace(**vars(deployment.spec.selector))),
+            status=SimpleNamespace(**vars(deployment.status))
+        )
+
+    def add_deployment(self, namespace, name, replicas=1, match_expressions=False):
+        # Pods are labelled app=<name>, selected through matchLabels or, with match_expressions, a matchExpressions In requirement
+        if match_expressions:
+            selector = SimpleNamespace(match_labels=None, match_expressions=[SimpleNamespace(key="app", operator="In", values=[name])])
+        else:
+            selector = SimpleNamespace(match_labels={"app": name}, match_expressions=None)
+        with self._lock:
+            self.deployments[(namespace, name)] = SimpleNamespace(
+                metadata=SimpleNamespace(name=name, namespace=namespace, generation=1, resource_version=self._next_resource_version()),
+                spec=SimpleNamespace(replicas=replicas, selector=selector),
+                status=SimpleNamespace(observed_generation=1, replicas=replicas, ready_replicas=replicas, updated_replicas=replicas),
+                pod_labels={"app": name}
+            )
+        self.core_api.set_pod_count(namespace, name, {"app": name}, replicas)
+
+    def list_namespaced_deployment(self, namespace, **kwargs):
+        self._count("list_namespaced_deployment")
+        with self._lock:
+            items = [self._snapshot(deployment) for (deployment_namespace, _), deployment in sorted(self.deployments.items()) if deployment_namespace == namespace]
+            return SimpleNamespace(items=items, metadata=SimpleNamespace(resource_version=str(self._resource_version)))
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body):
+        self._count("patch_namespaced_deployment_scale")
+        replicas = body["spec"]["replicas"]
+        with self._lock:
+            deployment = self.deployments[(namespace, name)]
+            if replicas and self.core_api.count_pods(namespace, deployment.pod_labels) > (deployment.spec.replicas or 0):
+                self.scaled_up_before_pods_deleted.append((namespace, name))
+            deployment.spec.replicas = replicas
+            deployment.metadata.generation += 1
+            deployment.metadata.resource_version = self._next_resource_version()
+            generation = deployment.metadata.generation
+            self._notify(namespace, "MODIFIED", deployment)
+
+        def converge():
+            with self._lock:
+                if deployment.metadata.generation != generation:
+                    return
+                deployment.status = SimpleNamespace(observed_generation=generation, replicas=replicas, ready_replicas=replicas, updated_replicas=replicas)
+                deployment.metadata.resource_version = self._next_resource_version()
+                self._notify(namespace, "MODIFIED", deployment)
+            if replicas:
+                self.core_api.set_pod_count(namespace, name, deployment.pod_labels, replicas)
+            else:
+                self.core_api.terminate_pods(namespace, deployment.pod_labels, self.pod_termination_seconds)
+
+        timer = threading.Timer(self.transition_seconds, converge)
+        timer.daemon = True
+        timer.start()
+        return {"spec": {"replicas": replicas}}
+
+class FakeWatch:
+    """Same stream()/stop() interface as kubernetes.watch.Watch, for the list functions of the fake APIs."""
+
+    def __init__(self):
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def stream(self, list_function, namespace, resource_version=None, timeout_seconds=None, **kwargs):
+        api = list_function.__self__
+        watcher_queue = queue.Queue()
+        api._add_watcher(namespace, watcher_queue)
+        deadline = time.monotonic() + (timeout_seconds or 3600)
+        try:
+            while not self._stopped:
+                remaining_seconds = deadline - time.monotonic()
+                if remaining_seconds <= 0:
+                    return
+                try:
+                    event = watcher_queue.get(timeout=min(remaining_seconds, 0.5))
+                except queue.Empty:
+                    continue
+                yield event
+        finally:
+            api._remove_watcher(namespace, watcher_queue)
+
+class FakeCoreV1Api(FakeWatchedApi):
+    """In-process stand-in for the CoreV1Api pod and pvc calls k8s_control makes."""
+
+    def __init__(self):
+        super().__init__()
+        self.pods = {}
+        self.pvcs = set()
+        self._pod_index = 0
+
+    def _snapshot(self, pod):
+        return SimpleNamespace(metadata=SimpleNamespace(name=pod.metadata.name, namespace=pod.metadata.namespace, labels=dict(pod.metadata.labels),
+                                                        resource_version=pod.metadata.resource_version))
+
+    def _matching_pods(self, namespace, labels):
+        return [pod for (pod_namespace, _), pod in sorted(self.pods.items())
+                if pod_namespace == namespace and all(pod.metadata.labels.get(key) == value for key, value in labels.items())]
+
+    def count_pods(self, namespace, labels):
+        with self._lock:
+            return len(self._matching_pods(namespace, labels))
+
+    def set_pod_count(self, namespace, deployment_name, labels, count):
+        with self._lock:
+            for _ in range(count - len(self._matching_pods(namespace, labels))):
+                self._pod_index += 1
+                name = "%s-%s" % (deployment_name, self._pod_index)
+                self.pods[(namespace, name)] = SimpleNamespace(metadata=SimpleNamespace(name=name, namespace=namespace, labels=dict(labels),
+                                                                                        resource_version=self._next_resource_version()))
+                self._notify(namespace, "ADDED", self.pods[(namespace, name)])
+
+    def terminate_pods(self, namespace, labels, termination_seconds):
+        names = [pod.metadata.name for pod in self._matching_pods(namespace, labels)]
+
+        def delete():
+            with self._lock:
+                for name in names:
+                    pod = self.pods.pop((namespace, name), None)
+                    if pod is not None:
+                        pod.metadata.resource_version = self._next_resource_version()
+                        self._notify(namespace, "DELETED", pod)
+
+        timer = threading.Timer(termination_seconds, delete)
+        timer.daemon = True
+        timer.start()
+
+    def list_namespaced_pod(self, namespace, **kwargs):
+        with self._lock:
+            items = [self._snapshot(pod) for (pod_namespace, _), pod in sorted(self.pods.items()) if pod_namespace == namespace]
+            return SimpleNamespace(items=items, metadata=SimpleNamespace(resource_version=str(self._resource_version)))
+
+    def delete_namespaced_persistent_volume_claim(self, name, namespace, **kwargs):
+        self.pvcs.discard((namespace, name))
+        return {"status": "Success"}
+
+def install(kubeconfig, apps_api=None, core_api=None):
+    """Route k8s_control calls for kubeconfig to the fakes, returns the fake apps and core APIs."""
+    import k8s_control
+    apps_api = apps_api or FakeAppsV1Api(core_api=core_api)
+    core_api = apps_api.core_api
+    k8s_control.set_apis(kubeconfig, apps_api, core_api)
+    k8s_control.set_watch_factory(FakeWatch)
+    return apps_api, core_api
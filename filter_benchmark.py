@@ -0,0 +1,60 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+import restore_dynamodb
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Microbenchmark of the lastUpdatedTime cutoff check run for every record while truncating")
+    parser.add_argument("--items", dest="items", action="store", type=int, default=1000000)
+    parser.add_argument("--other-format-percent", dest="other_format_percent", action="store", type=float, default=1, help="Share of timestamps written without fraction of seconds, which take the parsing path")
+    parser.add_argument("--output", dest="output", action="store", default=None, help="File the JSON result is also written to")
+    return parser
+
+def generate_timestamps(item_count, other_format_percent):
+    # Same formats insert_N_records_every_2_seconds_and_return_kth_record_time writes, str() drops the fraction on whole seconds
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    other_format_every = int(100 / other_format_percent) if other_format_percent else 0
+    timestamps = []
+    for index in range(item_count):
+        last_updated_time = start + timedelta(seconds=index, microseconds=index % 1000000)
+        if other_format_every and index % other_format_every == 0:
+            timestamps.append(str(last_updated_time.replace(microsecond=0)).replace(" ", "T").replace("+00:00", "Z"))
+        else:
+            timestamps.append(last_updated_time.strftime(restore_dynamodb.LAST_UPDATED_TIME_FORMAT))
+    return timestamps, start + timedelta(seconds=item_count // 2)
+
+def time_filter(name, check, timestamps):
+    start = time.perf_counter()
+    matched = [last_updated_time for last_updated_time in timestamps if check(last_updated_time)]
+    seconds = time.perf_counter() - start
+    logging.info("%s: %.0f records/s", name, len(timestamps) / seconds)
+    return {"seconds": round(seconds, 3), "items_per_second": round(len(timestamps) / seconds), "matched": len(matched)}
+
+def run_benchmark(item_count, other_format_percent):
+    timestamps, recovery_point_utc = generate_timestamps(item_count, other_format_percent)
+    cutoff = restore_dynamodb.get_last_updated_time_cutoff(recovery_point_utc)
+    results = {
+        "items": item_count,
+        "other_format_percent": other_format_percent,
+        "parse": time_filter("parse", lambda last_updated_time: restore_dynamodb.is_updated_after_recovery_point(last_updated_time, recovery_point_utc), timestamps),
+        "lexical": time_filter("lexical", lambda last_updated_time: restore_dynamodb.is_updated_after_cutoff(last_updated_time, cutoff, recovery_point_utc), timestamps)
+    }
+    if results["parse"]["matched"] != results["lexical"]["matched"]:
+        raise Exception("Lexical filter matched %s records, parsing matched %s" % (results["lexical"]["matched"], results["parse"]["matched"]))
+    results["speedup"] = round(results["lexical"]["items_per_second"] / results["parse"]["items_per_second"], 1)
+    return results
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    results = run_benchmark(args.items, args.other_format_percent)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    sys.exit(0)
@@ -0,0 +1,218 @@
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ORCHESTRATOR_DEPLOYMENT = "orchestrator-deployment"
+OFFLINE_QUERY_DEPLOYMENT = "offline-query-data-sync-deployment"
+DEFAULT_DEPLOYMENT_PATTERNS = [ORCHESTRATOR_DEPLOYMENT, OFFLINE_QUERY_DEPLOYMENT]
+DEFAULT_TIMEOUT_SECONDS = 600
+DEFAULT_MAX_WORKERS = 8
+
+_apis = {}
+_watch_factory = None
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to restart the orchestrator and offline query deployments of many namespaces")
+    parser.add_argument("--kubeconfig", dest="kubeconfig", action="store", required=True)
+    parser.add_argument("--namespace", dest="namespaces", action="append", required=True, help="Namespace (client) to restart, can be repeated")
+    parser.add_argument("--deployment-pattern", dest="deployment_patterns", action="append", default=None, help="Substring of the deployment names to restart, can be repeated")
+    parser.add_argument("--replicas", dest="replicas", action="store", type=int, default=1)
+    parser.add_argument("--timeout-seconds", dest="timeout_seconds", action="store", type=int, default=DEFAULT_TIMEOUT_SECONDS)
+    parser.add_argument("--max-workers", dest="max_workers", action="store", type=int, default=DEFAULT_MAX_WORKERS)
+    return parser
+
+def import_kubernetes():
+    try:
+        import kubernetes
+    except ImportError:
+        raise Exception("Kubernetes operations require the kubernetes package, install it with: pip install kubernetes")
+    return kubernetes
+
+def get_apis(kubeconfig):
+    # One API client per kubeconfig for the whole process, it keeps its connection pool between calls
+    if kubeconfig not in _apis:
+        kubernetes = import_kubernetes()
+        api_client = kubernetes.config.new_client_from_config(config_file=kubeconfig)
+        _apis[kubeconfig] = (kubernetes.client.AppsV1Api(api_client), kubernetes.client.CoreV1Api(api_client))
+    return _apis[kubeconfig]
+
+def set_apis(kubeconfig, apps_api, core_api):
+    _apis[kubeconfig] = (apps_api, core_api)
+
+def get_watch_factory():
+    return _watch_factory or import_kubernetes().watch.Watch
+
+def set_watch_factory(watch_factory):
+    global _watch_factory
+    _watch_factory = watch_factory
+
+def list_deployments(apps_api, namespace):
+    return [deployment.metadata.name for deployment in apps_api.list_namespaced_deployment(namespace).items]
+
+def select_deployments(deployment_names, patterns):
+    return [name for name in deployment_names if any(pattern in name for pattern in patterns)]
+
+def list_pods(core_api, namespace, pattern):
+    return [pod.metadata.name for pod in core_api.list_namespaced_pod(namespace).items if pattern in pod.metadata.name]
+
+def delete_pvc(core_api, namespace, pvc):
+    logging.info("Deleting pvc %s in %s", pvc, namespace)
+    core_api.delete_namespaced_persistent_volume_claim(pvc, namespace)
+
+def scale_deployment(apps_api, namespace, deployment, replicas):
+    logging.info("Scaling deployment %s in %s to %s replicas", deployment, namespace, replicas)
+    apps_api.patch_namespaced_deployment_scale(deployment, namespace, {"spec": {"replicas": replicas}})
+
+def is_scaled_down(deployment):
+    return not deployment.status.replicas
+
+def get_pod_selectors(apps_api, namespace, deployments):
+    selectors = []
+    for deployment in apps_api.list_namespaced_deployment(namespace).items:
+        if deployment.metadata.name not in deployments:
+            continue
+        selector = deployment.spec.selector
+        # An empty selector would match every pod of the namespace
+        if selector is None or not (selector.match_labels or selector.match_expressions):
+            logging.info("Deployment %s in %s has no pod selector, its pods are not waited for", deployment.metadata.name, namespace)
+            continue
+        selectors.append(selector)
+    return selectors
+
+def matches_expression(labels, expression):
+    if expression.operator == "In":
+        return expression.key in labels and labels[expression.key] in (expression.values or [])
+    if expression.operator == "NotIn":
+        return expression.key not in labels or labels[expression.key] not in (expression.values or [])
+    if expression.operator == "Exists":
+        return expression.key in labels
+    if expression.operator == "DoesNotExist":
+        return expression.key not in labels
+    raise Exception("Unsupported label selector operator %s" % expression.operator)
+
+def matches_selector(labels, selector):
+    return (all(labels.get(key) == value for key, value in (selector.match_labels or {}).items())
+            and all(matches_expression(labels, expression) for expression in selector.match_expressions or []))
+
+def matches_selectors(pod, selectors):
+    labels = pod.metadata.labels or {}
+    return any(matches_selector(labels, selector) for selector in selectors)
+
+def is_ready(deployment):
+    status = deployment.status
+    replicas = deployment.spec.replicas or 0
+    return ((status.observed_generation or 0) >= (deployment.metadata.generation or 0)
+            and (status.updated_replicas or 0) == replicas and (status.ready_replicas or 0) == replicas
+            and (status.replicas or 0) == replicas)
+
+def list_pending_deployments(apps_api, namespace, pending, condition):
+    deployment_list = apps_api.list_namespaced_deployment(namespace)
+    for deployment in deployment_list.items:
+        if deployment.metadata.name in pending and condition(deployment):
+            pending.discard(deployment.metadata.name)
+    return deployment_list.metadata.resource_version
+
+def wait_for_deployments(apps_api, namespace, deployments, condition, timeout_seconds, watch_factory):
+    # Current state comes from one list call, after which the watch only delivers changes
+    pending = set(deployments)
+    deadline = time.monotonic() + timeout_seconds
+    resource_version = list_pending_deployments(apps_api, namespace, pending, condition)
+    while pending:
+        remaining_seconds = int(deadline - time.monotonic())
+        if remaining_seconds <= 0:
+            raise Exception("Deployments %s in %s did not pass %s after %s seconds" % (sorted(pending), namespace, condition.__name__, timeout_seconds))
+        watch = watch_factory()
+        for event in watch.stream(apps_api.list_namespaced_deployment, namespace, resource_version=resource_version, timeout_seconds=remaining_seconds):
+            if event["type"] == "ERROR":
+                # Usually 410 Gone for an expired resource version, start over from a fresh list
+                watch.stop()
+                resource_version = list_pending_deployments(apps_api, namespace, pending, condition)
+                break
+            deployment = event["object"]
+            resource_version = deployment.metadata.resource_version
+            if deployment.metadata.name in pending and condition(deployment):
+                pending.discard(deployment.metadata.name)
+                logging.info("Deployment %s in %s passed %s", deployment.metadata.name, namespace, condition.__name__)
+            if not pending:
+                watch.stop()
+                break
+
+def list_remaining_pods(core_api, namespace, pending, selectors):
+    pod_list = core_api.list_namespaced_pod(namespace)
+    pending.clear()
+    pending.update(pod.metadata.name for pod in pod_list.items if matches_selectors(pod, selectors))
+    return pod_list.metadata.resource_version
+
+def wait_for_pods_deleted(core_api, namespace, selectors, timeout_seconds, watch_factory):
+    # The deployment status drops to 0 replicas while its pods are still terminating, they are only gone once deleted
+    pending = set()
+    deadline = time.monotonic() + timeout_seconds
+    resource_version = list_remaining_pods(core_api, namespace, pending, selectors)
+    while pending:
+        remaining_seconds = int(deadline - time.monotonic())
+        if remaining_seconds <= 0:
+            raise Exception("Pods %s in %s were not deleted after %s seconds" % (sorted(pending), namespace, timeout_seconds))
+        watch = watch_factory()
+        for event in watch.stream(core_api.list_namespaced_pod, namespace, resource_version=resource_version, timeout_seconds=remaining_seconds):
+            if event["type"] == "ERROR":
+                watch.stop()
+                resource_version = list_remaining_pods(core_api, namespace, pending, selectors)
+                break
+            pod = event["object"]
+            resource_version = pod.metadata.resource_version
+            if event["type"] == "DELETED" and pod.metadata.name in pending:
+                pending.discard(pod.metadata.name)
+                logging.info("Pod %s in %s deleted", pod.metadata.name, namespace)
+            if not pending:
+                watch.stop()
+                break
+
+def restart_deployments(apps_api, core_api, namespace, deployments, replicas=1, timeout_seconds=DEFAULT_TIMEOUT_SECONDS, watch_factory=None, max_workers=DEFAULT_MAX_WORKERS):
+    watch_factory = watch_factory or get_watch_factory()
+    deployments = [deployment for deployment in deployments if deployment]
+    if not deployments:
+        return {"namespace": namespace, "deployments": [], "downtime_seconds": 0}
+    selectors = get_pod_selectors(apps_api, namespace, deployments)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda deployment: scale_deployment(apps_api, namespace, deployment, 0), deployments))
+        try:
+            wait_for_deployments(apps_api, namespace, deployments, is_scaled_down, timeout_seconds, watch_factory)
+            wait_for_pods_deleted(core_api, namespace, selectors, timeout_seconds, watch_factory)
+        finally:
+            # Pods stuck terminating slow the restart down, the deployments are never left at 0 replicas
+            list(executor.map(lambda deployment: scale_deployment(apps_api, namespace, deployment, replicas), deployments))
+        wait_for_deployments(apps_api, namespace, deployments, is_ready, timeout_seconds, watch_factory)
+    downtime_seconds = round(time.monotonic() - start, 3)
+    logging.info("Namespace %s restarted %s in %s seconds", namespace, deployments, downtime_seconds)
+    return {"namespace": namespace, "deployments": deployments, "downtime_seconds": downtime_seconds}
+
+def restart_namespace(apps_api, core_api, namespace, patterns=DEFAULT_DEPLOYMENT_PATTERNS, replicas=1, timeout_seconds=DEFAULT_TIMEOUT_SECONDS, watch_factory=None,
+                      max_workers=DEFAULT_MAX_WORKERS):
+    deployments = select_deployments(list_deployments(apps_api, namespace), patterns)
+    logging.info("Deployments to restart in %s: %s", namespace, deployments)
+    return restart_deployments(apps_api, core_api, namespace, deployments, replicas, timeout_seconds, watch_factory, max_workers)
+
+def restart_namespaces(apps_api, core_api, namespaces, patterns=DEFAULT_DEPLOYMENT_PATTERNS, replicas=1, timeout_seconds=DEFAULT_TIMEOUT_SECONDS, watch_factory=None,
+                       max_workers=DEFAULT_MAX_WORKERS):
+    watch_factory = watch_factory or get_watch_factory()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(restart_namespace, apps_api, core_api, namespace, patterns, replicas, timeout_seconds, watch_factory, max_workers) for namespace in namespaces]
+        return [future.result() for future in futures]
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    apps_api, core_api = get_apis(args.kubeconfig)
+    results = restart_namespaces(apps_api, core_api, args.namespaces, args.deployment_patterns or DEFAULT_DEPLOYMENT_PATTERNS, args.replicas, args.timeout_seconds,
+                                 max_workers=args.max_workers)
+    for result in results:
+        logging.info("Namespace %s was down for %s seconds", result["namespace"], result["downtime_seconds"])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import argparse
+import fake_kubernetes
+import k8s_control
+import logging
+import sys
+import utils
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test restarting the deployments of many namespaces")
+    parser.add_argument("--kubeconfig", dest="kubeconfig", action="store", default='fake-kubeconfig')
+    parser.add_argument("--namespace-count", dest="namespace_count", action="store", type=int, default=5)
+    parser.add_argument("--transition-seconds", dest="transition_seconds", action="store", type=float, default=1)
+    parser.add_argument("--pod-termination-seconds", dest="pod_termination_seconds", action="store", type=float, default=2)
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process Kubernetes stand-in instead of a cluster")
+    return parser
+
+def get_namespaces(args):
+    return ["k8s-control-test-%s" % index for index in range(args.namespace_count)]
+
+def add_deployments(apps_api, namespaces):
+    for namespace in namespaces:
+        apps_api.add_deployment(namespace, "adapter-" + k8s_control.ORCHESTRATOR_DEPLOYMENT)
+        apps_api.add_deployment(namespace, "adapter-" + k8s_control.OFFLINE_QUERY_DEPLOYMENT)
+        apps_api.add_deployment(namespace, "unrelated-deployment")
+
+def test_restart_namespaces_in_parallel(args, apps_api, core_api):
+    try:
+        logging.info("############-test_restart_namespaces_in_parallel-#############")
+        namespaces = get_namespaces(args)
+        results = k8s_control.restart_namespaces(apps_api, core_api, namespaces)
+        for result in results:
+            logging.info("Namespace %s was down for %s seconds", result["namespace"], result["downtime_seconds"])
+            if len(result["deployments"]) != 2:
+                raise Exception("Expected 2 deployments restarted in %s, got %s" % (result["namespace"], result["deployments"]))
+        # Down and up transitions of every deployment in every namespace overlap, so the run takes about two transitions and one pod termination
+        slowest_seconds = max(result["downtime_seconds"] for result in results)
+        if slowest_seconds > 4 * args.transition_seconds + args.pod_termination_seconds + 2:
+            raise Exception("Restart took %s seconds, deployments were not restarted concurrently" % slowest_seconds)
+        for namespace in namespaces:
+            for deployment in apps_api.list_namespaced_deployment(namespace).items:
+                if not k8s_control.is_ready(deployment):
+                    raise Exception("Deployment %s in %s is not ready after restart" % (deployment.metadata.name, namespace))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_scale_up_waits_for_pods_deleted(args):
+    try:
+        logging.info("############-test_scale_up_waits_for_pods_deleted-#############")
+        # The status reports 0 replicas right away while the pods take a while to terminate
+        apps_api = fake_kubernetes.FakeAppsV1Api(transition_seconds=0.1, pod_termination_seconds=1)
+        core_api = apps_api.core_api
+        namespace = "k8s-control-test-pods"
+        apps_api.add_deployment(namespace, "adapter-" + k8s_control.ORCHESTRATOR_DEPLOYMENT, replicas=2)
+        old_pods = k8s_control.list_pods(core_api, namespace, k8s_control.ORCHESTRATOR_DEPLOYMENT)
+        result = k8s_control.restart_namespace(apps_api, core_api, namespace, replicas=2, watch_factory=fake_kubernetes.FakeWatch)
+        if apps_api.scaled_up_before_pods_deleted:
+            raise Exception("Deployments %s were scaled up while their old pods were still terminating" % apps_api.scaled_up_before_pods_deleted)
+        if result["downtime_seconds"] < 1:
+            raise Exception("Restart took %s seconds, it did not wait for the pods to terminate" % result["downtime_seconds"])
+        new_pods = k8s_control.list_pods(core_api, namespace, k8s_control.ORCHESTRATOR_DEPLOYMENT)
+        if len(new_pods) != 2 or set(new_pods) & set(old_pods):
+            raise Exception("Expected 2 new pods replacing %s, got %s" % (old_pods, new_pods))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_scale_up_after_failed_wait(args):
+    try:
+        logging.info("############-test_scale_up_after_failed_wait-#############")
+        # Pods stuck terminating longer than the timeout
+        apps_api = fake_kubernetes.FakeAppsV1Api(transition_seconds=0.1, pod_termination_seconds=5)
+        core_api = apps_api.core_api
+        namespace = "k8s-control-test-stuck"
+        deployment_name = "adapter-" + k8s_control.ORCHESTRATOR_DEPLOYMENT
+        apps_api.add_deployment(namespace, deployment_name, replicas=2)
+        try:
+            k8s_control.restart_deployments(apps_api, core_api, namespace, [deployment_name], replicas=2, timeout_seconds=2, watch_factory=fake_kubernetes.FakeWatch)
+            raise Exception("Expected the restart to fail while the pods are stuck terminating")
+        except Exception as error:
+            if "were not deleted" not in str(error):
+                raise
+        replicas = [deployment.spec.replicas for deployment in apps_api.list_namespaced_deployment(namespace).items]
+        if replicas != [2]:
+            raise Exception("Expected %s scaled back up to 2 replicas after the failed wait, got %s" % (deployment_name, replicas))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_selector_with_match_expressions(args):
+    try:
+        logging.info("############-test_selector_with_match_expressions-#############")
+        apps_api = fake_kubernetes.FakeAppsV1Api(transition_seconds=0.1, pod_termination_seconds=0.5)
+        core_api = apps_api.core_api
+        namespace = "k8s-control-test-expressions"
+        deployment_name = "adapter-" + k8s_control.ORCHESTRATOR_DEPLOYMENT
+        apps_api.add_deployment(namespace, deployment_name, replicas=2, match_expressions=True)
+        # Pods of a deployment that is not restarted stay, the wait must not count them
+        apps_api.add_deployment(namespace, "unrelated-deployment", replicas=2)
+        selectors = k8s_control.get_pod_selectors(apps_api, namespace, [deployment_name])
+        selected_pods = [pod.metadata.name for pod in core_api.list_namespaced_pod(namespace).items if k8s_control.matches_selectors(pod, selectors)]
+        if sorted(selected_pods) != sorted(k8s_control.list_pods(core_api, namespace, deployment_name)):
+            raise Exception("Expected only the pods of %s selected, got %s" % (deployment_name, selected_pods))
+        k8s_control.restart_deployments(apps_api, core_api, namespace, [deployment_name], replicas=2, timeout_seconds=5, watch_factory=fake_kubernetes.FakeWatch)
+        if apps_api.scaled_up_before_pods_deleted:
+            raise Exception("Deployments %s were scaled up while their old pods were still terminating" % apps_api.scaled_up_before_pods_deleted)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_restart_pods(args):
+    try:
+        logging.info("############-test_restart_pods-#############")
+        namespace = get_namespaces(args)[0]
+        deployments = utils.get_orchestrator_deployments(namespace, args.kubeconfig) + utils.get_offline_query_deployments(namespace, args.kubeconfig)
+        result = utils.restart_pods(namespace, deployments, args.kubeconfig)
+        if sorted(result["deployments"]) != sorted(deployments):
+            raise Exception("Expected %s restarted, got %s" % (deployments, result["deployments"]))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_kubernetes.install(args.kubeconfig, fake_kubernetes.FakeAppsV1Api(transition_seconds=args.transition_seconds, pod_termination_seconds=args.pod_termination_seconds))
+    apps_api, core_api = k8s_control.get_apis(args.kubeconfig)
+    if args.offline:
+        add_deployments(apps_api, get_namespaces(args))
+
+    test_1_status = test_restart_namespaces_in_parallel(args, apps_api, core_api)
+    test_2_status = test_restart_pods(args)
+    test_3_status = test_scale_up_waits_for_pods_deleted(args) if args.offline else 0
+    test_4_status = test_scale_up_after_failed_wait(args) if args.offline else 0
+    test_5_status = test_selector_with_match_expressions(args) if args.offline else 0
+
+    log_test_status_successful_if_0(test_1_status, "test_restart_namespaces_in_parallel")
+    log_test_status_successful_if_0(test_2_status, "test_restart_pods")
+    log_test_status_successful_if_0(test_3_status, "test_scale_up_waits_for_pods_deleted")
+    log_test_status_successful_if_0(test_4_status, "test_scale_up_after_failed_wait")
+    log_test_status_successful_if_0(test_5_status, "test_selector_with_match_expressions")
+
+    if test_1_status == 0 and test_2_status == 0 and test_3_status == 0 and test_4_status == 0 and test_5_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
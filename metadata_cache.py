@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+import aws_clients
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_TTL_SECONDS = 60
+
+TABLE = "describe_table"
+CONTINUOUS_BACKUPS = "describe_continuous_backups"
+
+class MetadataCache:
+    """Caches describe-table and describe-continuous-backups responses for the duration of a run.
+
+    Entries expire after ttl_seconds, callers invalidate a table after any call that changes it, and
+    concurrent lookups of the same entry share a single fetch.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = {}
+        self._fetch_locks = {}
+        self._lock = threading.Lock()
+
+    def _get_fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry
+        return None
+
+    def _get(self, kind, table_name, aws_profile, fetch):
+        key = (kind, aws_profile, table_name)
+        with self._lock:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:
+            with self._lock:
+                entry = self._get_fresh(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+            value = fetch()
+            with self._lock:
+                self._entries[key] = (time.monotonic(), value)
+            return value
+
+    def describe_table(self, table_name, aws_profile='default'):
+        dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+        return self._get(TABLE, table_name, aws_profile, lambda: dynamodb_client.describe_table(TableName=table_name)["Table"])
+
+    def describe_continuous_backups(self, table_name, aws_profile='default'):
+        dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+        return self._get(CONTINUOUS_BACKUPS, table_name, aws_profile,
+                         lambda: dynamodb_client.describe_continuous_backups(TableName=table_name)["ContinuousBackupsDescription"])
+
+    def invalidate(self, table_name, aws_profile='default'):
+        with self._lock:
+            for kind in (TABLE, CONTINUOUS_BACKUPS):
+                if self._entries.pop((kind, aws_profile, table_name), None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+# Shared by every operation in the process, a run that needs a fresh view calls reset()
+_run_cache = MetadataCache()
+
+def describe_table(table_name, aws_profile='default'):
+    return _run_cache.describe_table(table_name, aws_profile)
+
+def describe_continuous_backups(table_name, aws_profile='default'):
+    return _run_cache.describe_continuous_backups(table_name, aws_profile)
+
+def invalidate(table_name, aws_profile='default'):
+    _run_cache.invalidate(table_name, aws_profile)
+
+def get_stats():
+    return _run_cache.get_stats()
+
+def reset(ttl_seconds=DEFAULT_TTL_SECONDS):
+    global _run_cache
+    _run_cache = MetadataCache(ttl_seconds)
@@ -0,0 +1,136 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import logging
+import metadata_cache
+import restore_dynamodb
+import sys
+import threading
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test the cache of table descriptions")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='metadata-cache-test')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def create_table(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_dynamodb.delete_table_if_exist(table_name, aws_profile)
+    client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+def count_calls(client, method_names):
+    """Counts the calls to the given client methods until the returned function restores them."""
+    calls = dict.fromkeys(method_names, 0)
+    wrappers = {}
+
+    def make_wrapper(method_name, method):
+        def wrapper(*args, **kwargs):
+            calls[method_name] += 1
+            # Slow enough that concurrent lookups overlap the fetch
+            time.sleep(0.1)
+            return method(*args, **kwargs)
+        return wrapper
+
+    for method_name in method_names:
+        wrappers[method_name] = make_wrapper(method_name, getattr(client, method_name))
+        setattr(client, method_name, wrappers[method_name])
+
+    def restore():
+        for method_name, wrapper in wrappers.items():
+            if client.__dict__.get(method_name) is wrapper:
+                delattr(client, method_name)
+
+    return calls, restore
+
+def reset_calls(calls):
+    for method_name in calls:
+        calls[method_name] = 0
+
+def expect_calls(calls, expected_calls, description):
+    if calls != expected_calls:
+        raise Exception("%s: expected calls %s, got %s" % (description, expected_calls, calls))
+
+def test_cache_hits_and_invalidation(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    calls, restore = count_calls(client, ["describe_table", "describe_continuous_backups"])
+    try:
+        logging.info("############-test_cache_hits_and_invalidation-#############")
+        create_table(args.table_name, args.aws_profile)
+        metadata_cache.reset()
+        reset_calls(calls)
+        for _ in range(3):
+            metadata_cache.describe_table(args.table_name, args.aws_profile)
+            restore_dynamodb.get_pitr_status(args.table_name, args.aws_profile)
+        expect_calls(calls, {"describe_table": 1, "describe_continuous_backups": 1}, "Repeated lookups")
+        if metadata_cache.get_stats() != {"hits": 4, "misses": 2, "invalidations": 0}:
+            raise Exception("Expected 4 hits and 2 misses, got %s" % metadata_cache.get_stats())
+        # Enabling PITR changes the table, the next lookups have to see it
+        restore_dynamodb.enable_point_in_time_recovery_on_table(args.table_name, args.aws_profile)
+        if metadata_cache.get_stats()["invalidations"] != 2:
+            raise Exception("Expected both entries of %s invalidated, got %s" % (args.table_name, metadata_cache.get_stats()))
+        reset_calls(calls)
+        if restore_dynamodb.get_pitr_status(args.table_name, args.aws_profile) != "ENABLED":
+            raise Exception("Expected PITR ENABLED after enabling it, the cache returned the old description")
+        expect_calls(calls, {"describe_table": 0, "describe_continuous_backups": 1}, "Lookup after enabling PITR")
+        metadata_cache.invalidate(args.table_name, args.aws_profile)
+        threads = [threading.Thread(target=metadata_cache.describe_table, args=(args.table_name, args.aws_profile)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        expect_calls(calls, {"describe_table": 1, "describe_continuous_backups": 1}, "Concurrent lookups after invalidating")
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        restore()
+
+def test_entries_expire(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    calls, restore = count_calls(client, ["describe_table"])
+    try:
+        logging.info("############-test_entries_expire-#############")
+        metadata_cache.reset(ttl_seconds=1)
+        metadata_cache.describe_table(args.table_name, args.aws_profile)
+        metadata_cache.describe_table(args.table_name, args.aws_profile)
+        time.sleep(1.5)
+        metadata_cache.describe_table(args.table_name, args.aws_profile)
+        expect_calls(calls, {"describe_table": 2}, "Lookups around the expiry")
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        restore()
+        metadata_cache.reset()
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_cache_hits_and_invalidation(args)
+    test_2_status = test_entries_expire(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_cache_hits_and_invalidation")
+    log_test_status_successful_if_0(test_2_status, "test_entries_expire")
+
+    if test_1_status == 0 and test_2_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
@@ -0,0 +1,135 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ITEMS_SCANNED = "items_scanned"
+ITEMS_DELETED = "items_deleted"
+ITEMS_WRITTEN = "items_written"
+READ_CAPACITY_UNITS = "read_capacity_units"
+WRITE_CAPACITY_UNITS = "write_capacity_units"
+THROTTLES = "throttles"
+RETRIES = "retries"
+PHASE_FAILURES = "phase_failures"
+
+PROMETHEUS_PREFIX = "dynamodb_restore"
+
+class RestoreMetrics:
+    """Span timings per restore phase and counters per table, exported as a JSON report or Prometheus text.
+
+    Safe to share between the threads of a batch restore, every value is labelled with the table it belongs to.
+    """
+
+    def __init__(self):
+        self._spans = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, phase, table_name):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(PHASE_FAILURES, table_name, phase=phase)
+            raise
+        finally:
+            elapsed_seconds = time.perf_counter() - start
+            with self._lock:
+                span = self._spans.setdefault((phase, table_name), {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+                span["count"] += 1
+                span["total_seconds"] += elapsed_seconds
+                span["max_seconds"] = max(span["max_seconds"], elapsed_seconds)
+            logging.info("Phase %s of %s took %.3f seconds", phase, table_name, elapsed_seconds)
+
+    def increment(self, name, table_name, value=1, phase=None):
+        if not value:
+            return
+        key = (name, table_name, phase)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_response(self, table_name, response, capacity_counter):
+        # ConsumedCapacity is a dict for scan and query and a list with one entry per table for batch calls
+        consumed_capacity = response.get("ConsumedCapacity") or []
+        if isinstance(consumed_capacity, dict):
+            consumed_capacity = [consumed_capacity]
+        self.increment(capacity_counter, table_name, sum(capacity.get("CapacityUnits", 0) for capacity in consumed_capacity))
+        retry_attempts = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        self.increment(RETRIES, table_name, retry_attempts)
+        # The SDK retries throttled reads and writes on its own, so retries are the only sign of a throttled scan or query.
+        # Batch writes are also throttled by handing back unprocessed items. Either way the response counts once
+        if retry_attempts or response.get("UnprocessedItems"):
+            self.increment(THROTTLES, table_name)
+
+    def get_report(self):
+        with self._lock:
+            return {
+                "spans": [dict(span, phase=phase, table=table_name, total_seconds=round(span["total_seconds"], 3), max_seconds=round(span["max_seconds"], 3))
+                          for (phase, table_name), span in sorted(self._spans.items())],
+                "counters": [{"name": name, "table": table_name, "phase": phase, "value": value}
+                             for (name, table_name, phase), value in sorted(self._counters.items(), key=lambda entry: tuple(str(part) for part in entry[0]))]
+            }
+
+    def to_prometheus(self):
+        report = self.get_report()
+        lines = [
+            "# HELP %s_phase_seconds_total Time spent in each restore phase." % PROMETHEUS_PREFIX,
+            "# TYPE %s_phase_seconds_total counter" % PROMETHEUS_PREFIX
+        ]
+        for span in report["spans"]:
+            lines.append('%s_phase_seconds_total{phase="%s",table="%s"} %s' % (PROMETHEUS_PREFIX, span["phase"], span["table"], span["total_seconds"]))
+        lines.extend([
+            "# HELP %s_phase_runs_total Number of times each restore phase ran." % PROMETHEUS_PREFIX,
+            "# TYPE %s_phase_runs_total counter" % PROMETHEUS_PREFIX
+        ])
+        for span in report["spans"]:
+            lines.append('%s_phase_runs_total{phase="%s",table="%s"} %s' % (PROMETHEUS_PREFIX, span["phase"], span["table"], span["count"]))
+        written_types = set()
+        for counter in report["counters"]:
+            metric_name = "%s_%s_total" % (PROMETHEUS_PREFIX, counter["name"])
+            if metric_name not in written_types:
+                lines.append("# TYPE %s counter" % metric_name)
+                written_types.add(metric_name)
+            labels = 'table="%s"' % counter["table"]
+            if counter["phase"] is not None:
+                labels += ',phase="%s"' % counter["phase"]
+            lines.append("%s{%s} %s" % (metric_name, labels, counter["value"]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, metrics_output):
+        with open(metrics_output, "w") as metrics_file:
+            if metrics_output.endswith(".prom"):
+                metrics_file.write(self.to_prometheus())
+            else:
+                json.dump(self.get_report(), metrics_file, indent=2)
+        logging.info("Metrics written to %s", metrics_output)
+
+# Shared by every operation in the process, a run that needs its own numbers calls reset()
+_run_metrics = RestoreMetrics()
+
+def span(phase, table_name):
+    return _run_metrics.span(phase, table_name)
+
+def increment(name, table_name, value=1, phase=None):
+    _run_metrics.increment(name, table_name, value, phase)
+
+def record_response(table_name, response, capacity_counter):
+    _run_metrics.record_response(table_name, response, capacity_counter)
+
+def get_report():
+    return _run_metrics.get_report()
+
+def to_prometheus():
+    return _run_metrics.to_prometheus()
+
+def write(metrics_output):
+    _run_metrics.write(metrics_output)
+
+def reset():
+    global _run_metrics
+    _run_metrics = RestoreMetrics()
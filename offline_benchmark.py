@@ -0,0 +1,120 @@
+import argparse
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+import fake_dynamodb
+import restore_dynamodb
+import table_transfer
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+LRO_STATES = ["RUNNING", "SUCCEEDED", "FAILED", "CANCELLED"]
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Benchmark scan, truncate, export and import throughput against an in-process DynamoDB stand-in")
+    parser.add_argument("--items", dest="items", action="store", type=int, default=1000000, help="Number of synthetic LRO records in the source table")
+    parser.add_argument("--truncate-percent", dest="truncate_percent", action="store", type=float, default=10, help="Percentage of records updated after the requested restore time")
+    parser.add_argument("--segments", dest="segments", action="store", type=int, default=restore_dynamodb.DEFAULT_SCAN_SEGMENTS)
+    parser.add_argument("--workers", dest="workers", action="store", type=int, default=restore_dynamodb.DEFAULT_SCAN_WORKERS)
+    parser.add_argument("--export-format", dest="export_format", action="store", choices=table_transfer.FORMATS, default="ndjson")
+    parser.add_argument("--export-compression", dest="export_compression", action="store", choices=table_transfer.COMPRESSIONS, default="gzip")
+    parser.add_argument("--output", dest="output", action="store", default="offline_benchmark.json", help="File the JSON results are written to")
+    return parser
+
+def generate_lro_items(count, first_updated_time, last_updated_time):
+    # Records are spread evenly between the two times, in the format the LRO store writes lastUpdatedTime
+    step = (last_updated_time - first_updated_time) / max(count - 1, 1)
+    for index in range(count):
+        last_updated = first_updated_time + step * index
+        yield {
+            'name': {'S': "operations/lro-%09d" % index},
+            'lastUpdatedTime': {'S': last_updated.strftime(restore_dynamodb.LAST_UPDATED_TIME_FORMAT)},
+            'state': {'S': LRO_STATES[index % len(LRO_STATES)]},
+            'payload': {'S': "x" * 200}
+        }
+
+def create_lro_table(fake_client, table_name):
+    fake_client.create_table(TableName=table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}],
+                             KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+
+def timed_phase(results, phase_name, item_count_function, function, *args, **kwargs):
+    logging.info("Benchmark phase %s started", phase_name)
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    item_count = item_count_function(value)
+    results[phase_name] = {"seconds": round(seconds, 3), "items": item_count, "items_per_second": round(item_count / max(seconds, 0.000001), 1)}
+    logging.info("Benchmark phase %s: %s", phase_name, results[phase_name])
+    return value
+
+def scan_table(table_name, total_segments, max_workers):
+    # Scans through the same segment fan-out truncation uses, with a filter nothing matches
+    never = datetime(9999, 1, 1)
+    return restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(table_name, never, 'default', total_segments, max_workers)
+
+def run_benchmark(item_count, truncate_percent, total_segments, max_workers, export_format, export_compression):
+    fake_client = fake_dynamodb.install()
+    source_table = "adapter-lro-store-benchmark-source-offline"
+    target_table = "adapter-lro-store-benchmark-target-offline"
+    import_table = "adapter-lro-store-benchmark-import-offline"
+    results = {"items": item_count, "truncate_percent": truncate_percent, "segments": total_segments, "workers": max_workers,
+               "export_format": export_format, "export_compression": export_compression}
+
+    now = datetime.now(tz=timezone.utc)
+    first_updated_time = now - timedelta(hours=2)
+    last_updated_time = now - timedelta(hours=1)
+    # Whole seconds, the precision restore_dynamodb accepts for the requested restore time
+    restore_datetime = (last_updated_time - (last_updated_time - first_updated_time) * (truncate_percent / 100)).replace(microsecond=0)
+
+    create_lro_table(fake_client, source_table)
+    timed_phase(results, "generate", lambda value: item_count, fake_client.load_items, source_table, generate_lro_items(item_count, first_updated_time, last_updated_time))
+    restore_dynamodb.enable_point_in_time_recovery_on_table(source_table, 'default')
+    time.sleep(0.01)
+
+    timed_phase(results, "scan", lambda stats: sum(stats_entry["scanned"] for stats_entry in stats), scan_table, source_table, total_segments, max_workers)
+    # The requested time is before the earliest restorable point, so this is the restore + truncate path
+    status = timed_phase(results, "restore", lambda value: item_count, restore_dynamodb.recover_table, source_table, target_table,
+                         restore_datetime.strftime("%Y-%m-%d %H:%M:%S"), 'default', scan_segments=total_segments, scan_workers=max_workers)
+    if status != 0:
+        raise Exception("Offline restore failed")
+    restored_count = fake_client.describe_table(TableName=target_table)["Table"]["ItemCount"]
+    results["restored_items"] = restored_count
+
+    # Truncation on its own, against a second restore of the source table
+    restore_dynamodb.delete_table_if_exist(target_table, 'default')
+    restore_dynamodb.restore_table_to_point_in_time(source_table, target_table, str(time.time()), 'default')
+    restore_dynamodb.wait_for_table_to_be_in_active_status(target_table, 'default')
+    timed_phase(results, "truncate", lambda stats: sum(stats_entry["scanned"] for stats_entry in stats),
+                restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point, target_table,
+                restore_datetime.replace(tzinfo=None), 'default', total_segments, max_workers)
+
+    export_dir = tempfile.mkdtemp(prefix="offline-benchmark-export-")
+    try:
+        timed_phase(results, "export", lambda manifest: manifest["items"], table_transfer.export_table, target_table, export_dir, 'default',
+                    export_format, export_compression, total_segments, max_workers)
+        create_lro_table(fake_client, import_table)
+        timed_phase(results, "import", lambda summary: summary["items"], table_transfer.import_table, import_table, export_dir, 'default', max_workers)
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+
+    imported_count = fake_client.describe_table(TableName=import_table)["Table"]["ItemCount"]
+    if restored_count != imported_count:
+        raise Exception("Imported %s records but the restored table has %s" % (imported_count, restored_count))
+    results["api_calls"] = dict(fake_client.call_counts)
+    fake_dynamodb.uninstall()
+    return results
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    # Per record logging of the restore helpers would dominate the measurements
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run_benchmark(args.items, args.truncate_percent, args.segments, args.workers, args.export_format, args.export_compression)
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(json.dumps(results, indent=2))
+    sys.exit(0)
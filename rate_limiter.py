@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+import metadata_cache
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+READ = "read"
+WRITE = "write"
+DEFAULT_TARGET_PERCENT = 80
+ADJUST_INTERVAL_SECONDS = 1
+DECREASE_FACTOR = 0.7
+INCREASE_FRACTION = 0.1
+MIN_RATE_FRACTION = 0.05
+
+class CapacityRateLimiter:
+    """Token bucket of capacity units shared by every worker reading or writing one table.
+
+    Workers take an estimate before a request and settle it with the ConsumedCapacity DynamoDB reports, so
+    the bucket tracks real usage. The refill rate is cut when requests get throttled and grows back towards
+    the target once they stop. Without a target (on-demand tables with no maximum) nothing is limited until
+    the first throttle, after which the rate starts from half of what was being consumed.
+    """
+
+    def __init__(self, name, units_per_second=None):
+        self.name = name
+        self.target_units_per_second = units_per_second
+        self.units_per_second = units_per_second
+        self.throttles = 0
+        self._configured = units_per_second is not None
+        self._tokens = units_per_second or 0
+        self._last_refill = time.monotonic()
+        self._last_adjustment = 0
+        self._window_start = time.monotonic()
+        self._window_units = 0
+        self._observed_units_per_second = 0
+        self._lock = threading.Lock()
+
+    def set_target(self, units_per_second):
+        # Cuts made after throttles are kept, the rate only grows back towards the new target
+        with self._lock:
+            if units_per_second is None:
+                if self._configured:
+                    self.target_units_per_second = None
+                    self.units_per_second = None
+            elif not self.units_per_second:
+                self.target_units_per_second = units_per_second
+                self.units_per_second = units_per_second
+                self._tokens = units_per_second
+                self._last_refill = time.monotonic()
+            else:
+                self.target_units_per_second = units_per_second
+                self.units_per_second = min(self.units_per_second, units_per_second)
+                self._tokens = min(self._tokens, self.units_per_second)
+            self._configured = units_per_second is not None
+
+    def _refill(self, now):
+        self._tokens = min(self.units_per_second, self._tokens + (now - self._last_refill) * self.units_per_second)
+        self._last_refill = now
+
+    def acquire(self, units=0):
+        # With units=0 this only waits until the capacity consumed beyond earlier estimates has been paid back
+        while True:
+            with self._lock:
+                if not self.units_per_second:
+                    return
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= units or self._tokens >= self.units_per_second:
+                    self._tokens -= units
+                    return
+                wait_seconds = (min(units, self.units_per_second) - self._tokens) / self.units_per_second
+            time.sleep(wait_seconds)
+
+    def record(self, consumed_units, estimated_units=0, throttled=False):
+        with self._lock:
+            now = time.monotonic()
+            if self.units_per_second:
+                self._tokens -= consumed_units - estimated_units
+            self._window_units += consumed_units
+            if now - self._window_start >= ADJUST_INTERVAL_SECONDS:
+                self._observed_units_per_second = self._window_units / (now - self._window_start)
+                self._window_start = now
+                self._window_units = 0
+            if throttled:
+                self.throttles += 1
+            # Adjusted at most once per interval, so a burst of throttles from concurrent workers counts as one
+            if now - self._last_adjustment < ADJUST_INTERVAL_SECONDS:
+                return
+            if throttled:
+                self._decrease(now)
+            elif self.units_per_second and self.units_per_second < self.target_units_per_second:
+                self.units_per_second = min(self.target_units_per_second, self.units_per_second + self.target_units_per_second * INCREASE_FRACTION)
+                self._last_adjustment = now
+
+    def _decrease(self, now):
+        if not self.units_per_second:
+            observed_units_per_second = self._observed_units_per_second or (self._window_units / max(now - self._window_start, 0.001))
+            self.target_units_per_second = max(observed_units_per_second, 1)
+            self.units_per_second = self.target_units_per_second * 0.5
+            self._tokens = 0
+            self._last_refill = now
+        else:
+            self.units_per_second = max(self.target_units_per_second * MIN_RATE_FRACTION, self.units_per_second * DECREASE_FACTOR)
+        self._last_adjustment = now
+        logging.info("Requests to %s are throttled, limiting to %.1f capacity units per second", self.name, self.units_per_second)
+
+def get_consumed_units(response):
+    consumed_capacity = response.get("ConsumedCapacity") or []
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    return sum(capacity.get("CapacityUnits", 0) for capacity in consumed_capacity)
+
+def is_throttled(response):
+    # The SDK retries throttled requests on its own, a response that needed retries is the sign of throttling
+    return response.get("ResponseMetadata", {}).get("RetryAttempts", 0) > 0
+
+def get_table_capacity(table_name, aws_profile='default'):
+    table = metadata_cache.describe_table(table_name, aws_profile)
+    if table.get("BillingModeSummary", {}).get("BillingMode") == "PAY_PER_REQUEST":
+        on_demand_throughput = table.get("OnDemandThroughput", {})
+        read_units = on_demand_throughput.get("MaxReadRequestUnits", -1)
+        write_units = on_demand_throughput.get("MaxWriteRequestUnits", -1)
+        return (read_units if read_units > 0 else None), (write_units if write_units > 0 else None)
+    provisioned_throughput = table["ProvisionedThroughput"]
+    return provisioned_throughput["ReadCapacityUnits"], provisioned_throughput["WriteCapacityUnits"]
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def configure(table_name, aws_profile='default', target_percent=DEFAULT_TARGET_PERCENT, read_units_per_second=None, write_units_per_second=None):
+    # Explicit budgets win, otherwise the limits are target_percent of the table's provisioned or maximum on-demand capacity
+    read_capacity, write_capacity = get_table_capacity(table_name, aws_profile)
+    if read_units_per_second is None and read_capacity is not None:
+        read_units_per_second = read_capacity * target_percent / 100
+    if write_units_per_second is None and write_capacity is not None:
+        write_units_per_second = write_capacity * target_percent / 100
+    logging.info("Table %s read limit: %s, write limit: %s capacity units per second", table_name, read_units_per_second or "adaptive", write_units_per_second or "adaptive")
+    # A table configured again (a resumed truncation, an export after an import) keeps its limiters, so workers
+    # holding them stay on one budget and what was learned from throttles isn't lost
+    with _limiters_lock:
+        for kind, units_per_second in ((READ, read_units_per_second), (WRITE, write_units_per_second)):
+            limiter = _limiters.get((table_name, kind))
+            if limiter is None:
+                _limiters[(table_name, kind)] = CapacityRateLimiter("%s (%s)" % (table_name, kind), units_per_second)
+            else:
+                limiter.set_target(units_per_second)
+
+def get(table_name, kind):
+    # Tables nobody configured get an adaptive limiter, so they still back off once they are throttled
+    with _limiters_lock:
+        if (table_name, kind) not in _limiters:
+            _limiters[(table_name, kind)] = CapacityRateLimiter("%s (%s)" % (table_name, kind))
+        return _limiters[(table_name, kind)]
+
+def limit_pages(pages, table_name):
+    # Paginators send the next request when the loop asks for the next page, so waiting before that paces the reads
+    limiter = get(table_name, READ)
+    for page in pages:
+        limiter.record(get_consumed_units(page), throttled=is_throttled(page))
+        yield page
+        limiter.acquire()
+
+def reset():
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,91 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import logging
+import rate_limiter
+import restore_dynamodb
+import sys
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test the per table capacity limiters")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='rate-limiter-test')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def create_table(table_name, aws_profile, read_capacity_units, write_capacity_units):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_dynamodb.delete_table_if_exist(table_name, aws_profile)
+    client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}],
+                        BillingMode="PROVISIONED", ProvisionedThroughput={'ReadCapacityUnits': read_capacity_units, 'WriteCapacityUnits': write_capacity_units})
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+def test_configure_keeps_limiters(args):
+    try:
+        logging.info("############-test_configure_keeps_limiters-#############")
+        rate_limiter.reset()
+        create_table(args.table_name, args.aws_profile, 100, 50)
+        rate_limiter.configure(args.table_name, args.aws_profile, 80)
+        read_limiter = rate_limiter.get(args.table_name, rate_limiter.READ)
+        write_limiter = rate_limiter.get(args.table_name, rate_limiter.WRITE)
+        # A throttle cuts the write rate to 70% of the 40 units target
+        write_limiter.record(10, 10, throttled=True)
+        rate_limiter.configure(args.table_name, args.aws_profile, 50)
+        if rate_limiter.get(args.table_name, rate_limiter.READ) is not read_limiter or rate_limiter.get(args.table_name, rate_limiter.WRITE) is not write_limiter:
+            raise Exception("Configuring %s again replaced its limiters" % args.table_name)
+        if read_limiter.target_units_per_second != 50 or read_limiter.units_per_second != 50:
+            raise Exception("Expected the read limit lowered to 50 units, got %s of %s" % (read_limiter.units_per_second, read_limiter.target_units_per_second))
+        if write_limiter.target_units_per_second != 25 or write_limiter.units_per_second != 25 or write_limiter.throttles != 1:
+            raise Exception("Expected the write limit lowered to 25 units with the throttle kept, got %s of %s" % (write_limiter.units_per_second, write_limiter.target_units_per_second))
+        rate_limiter.configure(args.table_name, args.aws_profile, 100)
+        if write_limiter.target_units_per_second != 50 or write_limiter.units_per_second != 25:
+            raise Exception("Expected the write rate to stay at 25 units and grow back towards 50, got %s of %s" % (write_limiter.units_per_second, write_limiter.target_units_per_second))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_configure_keeps_adaptive_rate(args):
+    try:
+        logging.info("############-test_configure_keeps_adaptive_rate-#############")
+        rate_limiter.reset()
+        limiter = rate_limiter.get(args.table_name + "-on-demand", rate_limiter.WRITE)
+        limiter.record(100, 100, throttled=True)
+        learned_units_per_second = limiter.units_per_second
+        if not learned_units_per_second:
+            raise Exception("Expected a rate limit after the first throttle")
+        # An on-demand table without a maximum has no target, the rate learned from throttles stays
+        limiter.set_target(None)
+        if limiter.units_per_second != learned_units_per_second:
+            raise Exception("Expected the learned rate %s kept, got %s" % (learned_units_per_second, limiter.units_per_second))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_configure_keeps_limiters(args)
+    test_2_status = test_configure_keeps_adaptive_rate(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_configure_keeps_limiters")
+    log_test_status_successful_if_0(test_2_status, "test_configure_keeps_adaptive_rate")
+
+    if test_1_status == 0 and test_2_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
@@ -0,0 +1,95 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import aws_clients
+import metrics
+import restore_dynamodb
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Benchmark a DynamoDB restore: wall time, processes started and AWS API calls")
+    parser.add_argument("--source-client-name", dest="source_client_name", action="store", required=True)
+    parser.add_argument("--target-client-name", dest="target_client_name", action="store", required=True)
+    parser.add_argument("--restore-datetime", dest="restore_datetime", action="store", help="Format: yyyy-mm-dd hh:mm:ss in UTC", required=True)
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--output", dest="output", action="store", default=None, help="Write the JSON result to this file instead of stdout")
+    return parser
+
+class ProcessCounter:
+    """Counts child processes started through subprocess and os.system while active."""
+
+    def __init__(self):
+        self.count = 0
+        self.commands = []
+
+    def __enter__(self):
+        self._popen_init = subprocess.Popen.__init__
+        self._os_system = os.system
+        counter = self
+
+        def counting_popen_init(popen_self, args, *popen_args, **popen_kwargs):
+            counter.count += 1
+            counter.commands.append(args if isinstance(args, str) else " ".join(str(arg) for arg in args))
+            return counter._popen_init(popen_self, args, *popen_args, **popen_kwargs)
+
+        def counting_os_system(command):
+            counter.count += 1
+            counter.commands.append(command)
+            return counter._os_system(command)
+
+        subprocess.Popen.__init__ = counting_popen_init
+        os.system = counting_os_system
+        return self
+
+    def __exit__(self, *exc_info):
+        subprocess.Popen.__init__ = self._popen_init
+        os.system = self._os_system
+        return False
+
+def count_api_calls(aws_profile):
+    # Clients inherit the session's event hooks, so this has to run before the first client is created
+    api_calls = {}
+
+    def on_before_call(model, **kwargs):
+        api_calls[model.name] = api_calls.get(model.name, 0) + 1
+
+    aws_clients.get_session(aws_profile).events.register('before-call', on_before_call)
+    return api_calls
+
+def benchmark_restore(source_client, target_client, restore_datetime, env, aws_profile):
+    api_calls = count_api_calls(aws_profile)
+    with ProcessCounter() as process_counter:
+        start = time.perf_counter()
+        status = restore_dynamodb.recover_lro_store(source_client, target_client, restore_datetime, env, aws_profile)
+        wall_seconds = time.perf_counter() - start
+    return {
+        "status": status,
+        "wall_seconds": round(wall_seconds, 3),
+        "processes_started": process_counter.count,
+        "process_commands": process_counter.commands,
+        "api_calls": api_calls,
+        "api_calls_total": sum(api_calls.values()),
+        "phases": metrics.get_report()["spans"]
+    }
+
+def write_result(result, output):
+    result_json = json.dumps(result, indent=2, sort_keys=True)
+    if output is None:
+        print(result_json)
+    else:
+        with open(output, "w") as output_file:
+            output_file.write(result_json + "\n")
+        logging.info("Benchmark result written to %s", output)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    result = benchmark_restore(args.source_client_name, args.target_client_name, args.restore_datetime, args.env, args.aws_profile)
+    write_result(result, args.output)
+    sys.exit(result["status"])
@@ -0,0 +1,70 @@
+import argparse
+import importlib
+import logging
+import shlex
+import sys
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Commands map to the module whose main() runs them, modules are only imported once their command runs
+COMMANDS = {
+    "restore": "restore_dynamodb",
+    "restore-batch": "restore_dynamodb_batch",
+    "plan": "restore_planner",
+    "verify": "verify_restore",
+    "transfer": "table_transfer",
+    "backup": "backup_manager",
+    "restart": "k8s_control",
+    "service": "restore_service"
+}
+RUN_COMMAND = "run"
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Single entry point for the restore tools, runs one command or a file of commands in one process",
+                                     epilog="Run '%(prog)s <command> --help' for the arguments of a command")
+    parser.add_argument("command", choices=sorted(COMMANDS) + [RUN_COMMAND], help="'%s <file>' runs one command per line, '-' reads them from stdin" % RUN_COMMAND)
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    return parser
+
+def run_command(command, arguments):
+    if command not in COMMANDS:
+        logging.info("Unknown command %s, expected one of %s", command, ", ".join(sorted(COMMANDS)))
+        return 2
+    try:
+        return importlib.import_module(COMMANDS[command]).main(arguments) or 0
+    except SystemExit as exit:
+        # argparse exits on --help and argument errors, which only ends this step
+        return exit.code if isinstance(exit.code, int) else 1
+
+def read_steps(steps_path):
+    steps_file = sys.stdin if steps_path == "-" else open(steps_path)
+    try:
+        lines = [line.strip() for line in steps_file]
+    finally:
+        if steps_file is not sys.stdin:
+            steps_file.close()
+    return [shlex.split(line) for line in lines if line and not line.startswith("#")]
+
+def run_steps(steps):
+    # Steps share the process, so AWS clients, the metadata cache and metrics carry over from one to the next
+    for index, step in enumerate(steps):
+        start = time.perf_counter()
+        status = run_command(step[0], step[1:])
+        logging.info("Step %s/%s '%s' exited with %s after %.1f seconds", index + 1, len(steps), " ".join(step), status, time.perf_counter() - start)
+        if status != 0:
+            return status
+    return 0
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    if args.command == RUN_COMMAND:
+        if len(args.arguments) != 1:
+            logging.info("%s takes a single steps file", RUN_COMMAND)
+            return 2
+        return run_steps(read_steps(args.arguments[0]))
+    return run_command(args.command, args.arguments)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,40 @@
 import argparse
-import json
 import logging
-import os
+import random
+import re
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-import boto3
 import sys
+import aws_clients
+import checkpoints
+import metadata_cache
+import metrics
+import rate_limiter
+import restore_planner
 import utils
+import waiters
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+DEFAULT_SCAN_SEGMENTS = 8
+DEFAULT_SCAN_WORKERS = 8
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_RETRIES = 8
+DEFAULT_DELETE_WORKERS = 8
+MAX_REPORTED_DELETE_FAILURES = 1000
+LAST_UPDATED_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+LAST_UPDATED_TIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}Z")
+# Timestamps with an offset west of UTC carry a local date up to 12 hours behind UTC
+LAST_UPDATED_TIME_FILTER_MARGIN = timedelta(hours=14)
+DEFAULT_CHECKPOINT_DIR = "restore_checkpoints"
+
+# Share of scanned records logged while truncating, logging every record is a hot path cost on large tables
+item_log_sample_rate = 0.0
+
 def get_args_parser():
     parser = argparse.ArgumentParser(description="Utility to restore DynamoDB for given client")
     parser.add_argument("--source-client-name", dest="source_client_name", action="store", required=True)
@@ -18,83 +42,113 @@ def get_args_parser():
     parser.add_argument("--restore-datetime", dest="restore_datetime", action="store", help="Format: yyyy-mm-dd hh:mm:ss in UTC", required=True)
     parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
     parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--scan-segments", dest="scan_segments", action="store", type=int, default=DEFAULT_SCAN_SEGMENTS, help="Number of parallel scan segments used while truncating the restored table")
+    parser.add_argument("--scan-workers", dest="scan_workers", action="store", type=int, default=DEFAULT_SCAN_WORKERS, help="Number of worker threads scanning segments and deleting records")
+    parser.add_argument("--last-updated-time-index", dest="last_updated_time_index", action="store", default=None, help="GSI with lastUpdatedTime as sort key, queried instead of scanning the table while truncating. Only records in the GSI partition given by --last-updated-time-index-partition-value are truncated")
+    parser.add_argument("--last-updated-time-index-partition-value", dest="index_partition_value", action="store", default=None, help="Partition key value queried on --last-updated-time-index, required with it")
+    parser.add_argument("--checkpoint-dir", dest="checkpoint_dir", action="store", default=DEFAULT_CHECKPOINT_DIR, help="Directory for restore checkpoints, a rerun with the same arguments resumes from the last completed step")
+    parser.add_argument("--target-capacity-percent", dest="target_capacity_percent", action="store", type=float, default=rate_limiter.DEFAULT_TARGET_PERCENT, help="Share of the table's provisioned (or maximum on-demand) read and write capacity truncation may use")
+    parser.add_argument("--aws-backup-role-arn", dest="aws_backup_role_arn", action="store", default=None, help="IAM role AWS Backup restores with, recovery points in backup vaults are only considered when it is set")
+    parser.add_argument("--max-backup-staleness-seconds", dest="max_backup_staleness_seconds", action="store", type=int, default=0, help="How long before the restore time a backup may have been taken and still be restored without truncation")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true", help="Print the restore plan and exit without restoring")
+    parser.add_argument("--metrics-output", dest="metrics_output", action="store", default=None, help="File phase timings and counters are written to, Prometheus text if it ends with .prom and JSON otherwise")
+    parser.add_argument("--item-log-sample-rate", dest="item_log_sample_rate", action="store", type=float, default=0.0, help="Share of scanned records logged while truncating, between 0 (none) and 1 (all)")
     return parser
 
-def on_demand_backup(source_table_name, source_table_backup_name):
+def on_demand_backup(source_table_name, source_table_backup_name, aws_profile='default'):
     logging.info("Starting OnDemand backup of " + source_table_name + " table, backup name is %s" %source_table_backup_name)
-    backup_output=os.popen("aws dynamodb create-backup --table-name " + source_table_name + " --backup-name " + source_table_backup_name).read()
-    logging.info(backup_output)
-    backup_details = json.loads(backup_output)
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    backup_details = dynamodb_client.create_backup(TableName=source_table_name, BackupName=source_table_backup_name)
+    logging.info(backup_details)
     backup_arn = backup_details["BackupDetails"]["BackupArn"]
     logging.info("%s table backup ARN: %s", source_table_name, backup_arn)
     return backup_arn
 
-def wait_for_backup_to_be_available(backup_name, backup_arn):
-    describe_backup_output = os.popen("aws dynamodb describe-backup --backup-arn " + backup_arn).read()
-    describe_backup_json = json.loads(describe_backup_output)
-    actual_backup_status = describe_backup_json["BackupDescription"]["BackupDetails"]["BackupStatus"]
-    expected_backup_status = "AVAILABLE"
-
-    while expected_backup_status != actual_backup_status:
-        time.sleep(5)
-        describe_backup_output = os.popen("aws dynamodb describe-backup --backup-arn " + backup_arn).read()
-        describe_backup_json = json.loads(describe_backup_output)
-        actual_backup_status = describe_backup_json["BackupDescription"]["BackupDetails"]["BackupStatus"]
-        logging.info("%s backup status is %s", backup_name, actual_backup_status)
+def get_backup_status(backup_arn, aws_profile='default'):
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    describe_backup_json = dynamodb_client.describe_backup(BackupArn=backup_arn)
+    return describe_backup_json["BackupDescription"]["BackupDetails"]["BackupStatus"]
 
-    logging.info("OnDemand Backup %s is %s now", backup_name, actual_backup_status)
+def wait_for_backup_to_be_available(backup_name, backup_arn, aws_profile='default'):
+    result = waiters.wait_or_raise([waiters.backup_available(backup_arn, aws_profile)])[0]
+    logging.info("OnDemand Backup %s is %s now", backup_name, result.state)
 
-def restore_table_to_point_in_time(source_table_name, target_table_name, restoration_point):
+def restore_table_to_point_in_time(source_table_name, target_table_name, restoration_point, aws_profile='default'):
     logging.info("Starting point in time recovery of table %s to %s", source_table_name, target_table_name)
-    output = os.popen("aws dynamodb restore-table-to-point-in-time --source-table-name " + source_table_name + " --target-table-name " + target_table_name + " --restore-date-time " + restoration_point).read()
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    output = dynamodb_client.restore_table_to_point_in_time(
+        SourceTableName=source_table_name,
+        TargetTableName=target_table_name,
+        RestoreDateTime=datetime.fromtimestamp(float(restoration_point), tz=timezone.utc)
+    )
     logging.info(output)
-    # It will poll every 20 seconds until a successful state has been reached. This will exit with a return code of 255 after 25 failed checks.
-    table_exist_response = os.popen("aws dynamodb wait table-exists --table-name " + target_table_name).read()
-    logging.info(table_exist_response)
-
-def wait_for_table_to_be_in_active_status(table_name):
-    describe_table_output = os.popen("aws dynamodb describe-table --table-name " + table_name).read()
-    describe_table_output_json = json.loads(describe_table_output)
-    actual_table_status = describe_table_output_json["Table"]["TableStatus"]
-    expected_table_status = "ACTIVE"
-
-    while expected_table_status != actual_table_status:
-        describe_table_output = os.popen("aws dynamodb describe-table --table-name " + table_name).read()
-        describe_table_output_json = json.loads(describe_table_output)
-        actual_table_status = describe_table_output_json["Table"]["TableStatus"]
-        logging.info("%s table status is %s", table_name, actual_table_status)
-        time.sleep(5) #5 sec
+    metadata_cache.invalidate(target_table_name, aws_profile)
+    # The target table is visible in CREATING status as soon as the call returns, callers wait for ACTIVE status
+    # with wait_for_table_to_be_in_active_status which has a deadline per table instead of a fixed number of checks
+
+def get_table_status(table_name, aws_profile='default'):
+    # Status changes while waiting, so it's always read from DynamoDB instead of the metadata cache
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    return dynamodb_client.describe_table(TableName=table_name)["Table"]["TableStatus"]
+
+def get_table_status_if_exist(table_name, aws_profile='default'):
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    try:
+        return get_table_status(table_name, aws_profile)
+    except dynamodb_client.exceptions.ResourceNotFoundException:
+        return None
+
+def wait_for_table_to_be_in_active_status(table_name, aws_profile='default'):
+    waiters.wait_or_raise([waiters.table_active(table_name, aws_profile)])
+    metadata_cache.invalidate(table_name, aws_profile)
+
+def wait_for_pitr_to_be_enabled(table_name, aws_profile='default'):
+    waiters.wait_or_raise([waiters.pitr_enabled(table_name, aws_profile)])
+    metadata_cache.invalidate(table_name, aws_profile)
 
 def delete_table_if_exist(table_name, aws_profile):
-    session = boto3.Session(profile_name=aws_profile)
-    dynamodb_client = session.client('dynamodb')
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
     try:
         dynamodb_client.delete_table(TableName=table_name)
-        os.system("aws dynamodb wait table-not-exists --table-name " + table_name)
+        metadata_cache.invalidate(table_name, aws_profile)
+        waiters.wait_or_raise([waiters.table_not_exists(table_name, aws_profile)])
         logging.info("Table %s deleted", table_name)
     except dynamodb_client.exceptions.ResourceNotFoundException:
         logging.info("Table %s doesn't exist", table_name)
 
-def delete_table_using_aws_cli(table_name):
-    delete_table_output = os.popen("aws dynamodb delete-table --table-name " + table_name).read()
-    logging.info(delete_table_output)
-    os.system("aws dynamodb wait table-not-exists --table-name " + table_name)
-    logging.info("%s table successfully deleted!" %table_name)
-
-def restore_table_from_backup(target_table_name, backup_arn):
-    restore_table_output = os.popen("aws dynamodb restore-table-from-backup --target-table-name " +target_table_name+ " --backup-arn " + backup_arn).read()
+def start_restore_table_from_backup(target_table_name, backup_arn, aws_profile='default'):
+    logging.info("Starting restore of backup %s to table %s", backup_arn, target_table_name)
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_table_output = dynamodb_client.restore_table_from_backup(TargetTableName=target_table_name, BackupArn=backup_arn)
     logging.info(restore_table_output)
-    os.system("aws dynamodb wait table-exists --table-name " + target_table_name)
+    metadata_cache.invalidate(target_table_name, aws_profile)
+
+def restore_table_from_backup(target_table_name, backup_arn, aws_profile='default'):
+    start_restore_table_from_backup(target_table_name, backup_arn, aws_profile)
+    wait_for_table_to_be_in_active_status(target_table_name, aws_profile)
+
+def start_aws_backup_restore(target_table_name, recovery_point_arn, iam_role_arn, aws_profile='default', idempotency_token=None):
+    logging.info("Starting AWS Backup restore of %s to table %s", recovery_point_arn, target_table_name)
+    backup_client = aws_clients.get_client('backup', aws_profile)
+    # Calls with the same idempotency token return the job the first one started
+    token_kwargs = {"IdempotencyToken": idempotency_token} if idempotency_token else {}
+    restore_job_id = backup_client.start_restore_job(RecoveryPointArn=recovery_point_arn, IamRoleArn=iam_role_arn, ResourceType="DynamoDB",
+                                                     Metadata={"targetTableName": target_table_name}, **token_kwargs)["RestoreJobId"]
+    metadata_cache.invalidate(target_table_name, aws_profile)
+    logging.info("AWS Backup restore job %s started", restore_job_id)
+    return restore_job_id
 
-def describe_table(table_name):
-    os.popen("aws dynamodb describe-table --table-name " + table_name).read()
+def wait_for_restore_job_to_complete(restore_job_id, aws_profile='default'):
+    waiters.wait_or_raise([waiters.restore_job_completed(restore_job_id, aws_profile)])
+
+def describe_table(table_name, aws_profile='default'):
+    return metadata_cache.describe_table(table_name, aws_profile)
 
 def is_table_exist(table_name, aws_profile):
-    session = boto3.Session(profile_name=aws_profile)
-    dynamodb_client = session.client('dynamodb')
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
     is_table_exist = True
     try:
-        dynamodb_client.describe_table(TableName=table_name)
+        describe_table(table_name, aws_profile)
     except dynamodb_client.exceptions.ResourceNotFoundException:
         is_table_exist = False
 
@@ -102,140 +156,419 @@ def is_table_exist(table_name, aws_profile):
         logging.info("Source table %s does not exist!", table_name)
         raise Exception("Source table doesn't exist")
 
-def delete_record_by_lro_name(table_name, name):
+def write_batch(client, table_name, write_requests):
+    # Anything DynamoDB couldn't process is retried with backoff, what is still unprocessed after that is returned
+    request_items = {table_name: write_requests}
+    attempt = 0
+    write_limiter = rate_limiter.get(table_name, rate_limiter.WRITE)
+    while True:
+        requested_count = len(request_items[table_name])
+        # Every write consumes at least one WCU, the difference to the real item size is settled after the call
+        write_limiter.acquire(requested_count)
+        response = client.batch_write_item(RequestItems=request_items, ReturnConsumedCapacity='TOTAL')
+        metrics.record_response(table_name, response, metrics.WRITE_CAPACITY_UNITS)
+        request_items = response.get('UnprocessedItems') or {}
+        write_limiter.record(rate_limiter.get_consumed_units(response), requested_count, bool(request_items) or rate_limiter.is_throttled(response))
+        if not request_items:
+            return []
+        # Unprocessed items are what DynamoDB hands back when the table's write capacity is exceeded, record_response
+        # counted them as a throttle
+        attempt += 1
+        if attempt > BATCH_WRITE_MAX_RETRIES:
+            return request_items[table_name]
+        time.sleep(min(0.05 * (2 ** attempt), 5))
+
+def batch_write_records(client, table_name, write_requests):
+    # BatchWriteItem accepts at most 25 requests
+    written_count = 0
+    for start in range(0, len(write_requests), BATCH_WRITE_MAX_ITEMS):
+        batch = write_requests[start:start + BATCH_WRITE_MAX_ITEMS]
+        unprocessed = write_batch(client, table_name, batch)
+        if unprocessed:
+            raise Exception("Unable to write %s records to %s after %s retries" % (len(unprocessed), table_name, BATCH_WRITE_MAX_RETRIES))
+        written_count += len(batch)
+    return written_count
+
+def delete_batch(client, table_name, keys):
+    try:
+        unprocessed = write_batch(client, table_name, [{'DeleteRequest': {'Key': key}} for key in keys])
+    except Exception as error:
+        # botocore's ClientError carries the error code in its response, checked here without importing botocore
+        error_code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        if error_code != "ValidationException" or len(keys) == 1:
+            return 0, [{"key": key, "error": str(error)} for key in keys]
+        # One invalid or duplicated key fails the whole batch, so the keys are retried one by one to find it
+        results = [delete_batch(client, table_name, [key]) for key in keys]
+        return sum(deleted_count for deleted_count, _ in results), [failure for _, failures in results for failure in failures]
+    failures = [{"key": request['DeleteRequest']['Key'], "error": "Unprocessed after %s retries" % BATCH_WRITE_MAX_RETRIES} for request in unprocessed]
+    return len(keys) - len(unprocessed), failures
+
+def get_batches(keys, batch_size):
+    batch = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def bulk_delete_records(table_name, keys, aws_profile='default', max_workers=DEFAULT_DELETE_WORKERS, client=None, executor=None):
+    """Deletes the keys (an iterable of DynamoDB key dicts) in concurrent BatchWriteItem calls of 25.
+
+    Keys that still fail after retries are collected into the returned report instead of stopping the run.
+    The batches run on `executor` when one is given, so callers deleting from many threads can share one
+    bounded pool, otherwise on a pool of `max_workers` threads created for this call. Returns once every
+    batch of this call is done.
+    """
+    client = client or aws_clients.get_dynamodb_client(aws_profile)
+    report = {"table_name": table_name, "requested": 0, "deleted": 0, "failed_count": 0, "failures": []}
+    # Notified as batches finish, the executor may be shared so its shutdown can't tell when this call's batches are done
+    batches_done = threading.Condition()
+    batches_in_flight = 0
+    # Bounds the batches read ahead of the workers, so keys can be streamed from a generator of any size
+    pending_batches = threading.BoundedSemaphore(max_workers * 2)
+    start = time.perf_counter()
+
+    def on_batch_done(future):
+        nonlocal batches_in_flight
+        deleted_count, failures = future.result()
+        metrics.increment(metrics.ITEMS_DELETED, table_name, deleted_count)
+        with batches_done:
+            report["deleted"] += deleted_count
+            report["failed_count"] += len(failures)
+            report["failures"].extend(failures[:MAX_REPORTED_DELETE_FAILURES - len(report["failures"])])
+            batches_in_flight -= 1
+            batches_done.notify_all()
+        pending_batches.release()
+
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=max_workers)
     try:
-        client = boto3.client('dynamodb')
-        response = client.delete_item(TableName=table_name, Key={"name": { 'S': name}})
-        logging.info("name: %s successfully deleted. Response: %s", name, response)
-    except client.ClientError as err:
-        logging.info(err)
-        sys.exit()
+        for batch in get_batches(keys, BATCH_WRITE_MAX_ITEMS):
+            report["requested"] += len(batch)
+            pending_batches.acquire()
+            with batches_done:
+                batches_in_flight += 1
+            executor.submit(delete_batch, client, table_name, batch).add_done_callback(on_batch_done)
+        with batches_done:
+            batches_done.wait_for(lambda: batches_in_flight == 0)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    report["duration_seconds"] = round(time.perf_counter() - start, 3)
+    if report["failed_count"]:
+        logging.info("Deleted %s of %s records from %s, %s failed", report["deleted"], report["requested"], table_name, report["failed_count"])
+    return report
+
+def delete_record_by_lro_name(table_name, name, aws_profile='default'):
+    report = bulk_delete_records(table_name, [{'name': {'S': name}}], aws_profile)
+    if report["failed_count"]:
+        logging.info("name: %s could not be deleted: %s", name, report["failures"][0]["error"])
     else:
-        return response
+        logging.info("name: %s successfully deleted from %s", name, table_name)
+    return report
 
-def delete_records_with_last_updated_time_after_recovery_point(table_name, recovery_point, aws_profile):
+def delete_records_by_lro_names(table_name, names, aws_profile='default', max_workers=DEFAULT_DELETE_WORKERS):
+    return bulk_delete_records(table_name, ({'name': {'S': name}} for name in names), aws_profile, max_workers)
+
+def get_last_updated_time_cutoff(recovery_point):
+    return recovery_point.strftime(LAST_UPDATED_TIME_FORMAT)
+
+def get_last_updated_time_filter_bound(recovery_point):
+    # DynamoDB compares the timestamps as strings. Every timestamp starting with this date or a later one sorts
+    # after it whatever its separator, fraction or offset, so the scan or query can only return too many records
+    return (recovery_point - LAST_UPDATED_TIME_FILTER_MARGIN).strftime("%Y-%m-%d")
+
+def is_updated_after_recovery_point(last_updated_time_str, recovery_point_utc):
     try:
-        session = boto3.Session(profile_name=aws_profile)
-        client = session.client('dynamodb')
-        dynamopaginator = client.get_paginator('scan')
-        dynamoresponse = dynamopaginator.paginate(
-            TableName = table_name,
-            Select='ALL_ATTRIBUTES',
-            ReturnConsumedCapacity='NONE',
-            ConsistentRead=True
-        )
-        for page in dynamoresponse:
-            for item in page['Items']:
-                if item.get('lastUpdatedTime') == None:
-                    continue
-                logging.info(item)
-                name = item.get('name').get('S')
-                last_updated_time_str = item.get('lastUpdatedTime').get('S')
-                last_updated_time = datetime.strptime(last_updated_time_str, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
-                if recovery_point.replace(tzinfo=timezone.utc) < last_updated_time.replace(tzinfo=timezone.utc):
-                    logging.info("Last Updated Time %s greater than recovery point %s", last_updated_time, recovery_point)
-                    delete_record_by_lro_name(table_name, name)
+        last_updated_time = datetime.strptime(last_updated_time_str, LAST_UPDATED_TIME_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        last_updated_time = utils.convert_datetime_to_utc_tz(last_updated_time_str)
+    return recovery_point_utc < last_updated_time
+
+def is_updated_after_cutoff(last_updated_time_str, cutoff, recovery_point_utc):
+    # Fixed width UTC timestamps sort like the times they represent, so a string comparison settles them
+    # without parsing, anything written in another format is parsed
+    if LAST_UPDATED_TIME_PATTERN.fullmatch(last_updated_time_str):
+        return last_updated_time_str > cutoff
+    return is_updated_after_recovery_point(last_updated_time_str, recovery_point_utc)
+
+def is_item_logged():
+    return item_log_sample_rate > 0 and random.random() < item_log_sample_rate
+
+def delete_records_from_pages(client, table_name, recovery_point, pages, on_page_done=None, delete_executor=None):
+    # The scan or query only filters by date (see get_last_updated_time_filter_bound), so every returned
+    # record is checked against the recovery point before it is deleted
+    recovery_point_utc = recovery_point.replace(tzinfo=timezone.utc)
+    cutoff = get_last_updated_time_cutoff(recovery_point)
+    scanned_count = 0
+    deleted_count = 0
+    for page in pages:
+        scanned_count += page['ScannedCount']
+        metrics.increment(metrics.ITEMS_SCANNED, table_name, page['ScannedCount'])
+        metrics.record_response(table_name, page, metrics.READ_CAPACITY_UNITS)
+        keys_to_delete = []
+        for item in page['Items']:
+            last_updated_time_str = item.get('lastUpdatedTime').get('S')
+            updated_after_recovery_point = is_updated_after_cutoff(last_updated_time_str, cutoff, recovery_point_utc)
+            if updated_after_recovery_point:
+                keys_to_delete.append({'name': item.get('name')})
+            if is_item_logged():
+                logging.info("Record %s, updated after recovery point %s: %s", item, recovery_point, updated_after_recovery_point)
+        # Deletes are flushed every page, so once on_page_done has seen a page's LastEvaluatedKey it is fully processed
+        if keys_to_delete:
+            report = bulk_delete_records(table_name, keys_to_delete, client=client, executor=delete_executor)
+            if report["failed_count"]:
+                raise Exception("Unable to delete %s records from %s: %s" % (report["failed_count"], table_name, report["failures"][:10]))
+            deleted_count += report["deleted"]
+        if on_page_done is not None:
+            on_page_done(page.get('LastEvaluatedKey'), scanned_count, deleted_count)
+    return scanned_count, deleted_count
+
+def delete_records_with_checkpoint(client, table_name, recovery_point, operation_name, operation_kwargs, checkpoint, segment, delete_executor=None):
+    progress = checkpoint.get_segment(segment)
+    if progress["done"]:
+        logging.info("Segment %s of %s already truncated, skipping", segment, table_name)
+        return progress["scanned"], progress["deleted"]
+    if progress["last_evaluated_key"] is not None:
+        logging.info("Resuming segment %s of %s from %s", segment, table_name, progress["last_evaluated_key"])
+        operation_kwargs = dict(operation_kwargs, ExclusiveStartKey=progress["last_evaluated_key"])
+
+    def on_page_done(last_evaluated_key, scanned_count, deleted_count):
+        checkpoint.update_segment(segment, last_evaluated_key, progress["scanned"] + scanned_count, progress["deleted"] + deleted_count)
+
+    pages = rate_limiter.limit_pages(client.get_paginator(operation_name).paginate(**operation_kwargs), table_name)
+    scanned_count, deleted_count = delete_records_from_pages(client, table_name, recovery_point, pages, on_page_done, delete_executor)
+    return progress["scanned"] + scanned_count, progress["deleted"] + deleted_count
+
+def scan_segment_and_delete(client, table_name, recovery_point, segment, total_segments, checkpoint, delete_executor=None):
+    scan_kwargs = dict(
+        TableName = table_name,
+        ProjectionExpression='#name, #lastUpdatedTime',
+        FilterExpression='#lastUpdatedTime > :cutoff',
+        ExpressionAttributeNames={'#name': 'name', '#lastUpdatedTime': 'lastUpdatedTime'},
+        ExpressionAttributeValues={':cutoff': {'S': get_last_updated_time_filter_bound(recovery_point)}},
+        ReturnConsumedCapacity='TOTAL',
+        ConsistentRead=True,
+        Segment=segment,
+        TotalSegments=total_segments
+    )
+    scanned_count, deleted_count = delete_records_with_checkpoint(client, table_name, recovery_point, 'scan', scan_kwargs, checkpoint, segment, delete_executor)
+    logging.info("Segment %s/%s of %s: scanned %s records, deleted %s records", segment, total_segments, table_name, scanned_count, deleted_count)
+    return {"segment": segment, "scanned": scanned_count, "deleted": deleted_count}
+
+def get_last_updated_time_index_partition_key(table, index_name):
+    table_name = table["TableName"]
+    for index in table.get("GlobalSecondaryIndexes", []):
+        if index["IndexName"] != index_name:
+            continue
+        key_schema = {key["KeyType"]: key["AttributeName"] for key in index["KeySchema"]}
+        if key_schema.get("RANGE") != "lastUpdatedTime":
+            raise Exception("Index %s of table %s doesn't have lastUpdatedTime as sort key" % (index_name, table_name))
+        return key_schema["HASH"]
+    raise Exception("Index %s doesn't exist on table %s" % (index_name, table_name))
+
+def validate_last_updated_time_index(table_name, last_updated_time_index, index_partition_value, aws_profile):
+    # Returns the index's partition key, or None when truncation scans the table
+    if last_updated_time_index is None and index_partition_value is None:
+        return None
+    if last_updated_time_index is None or index_partition_value is None:
+        raise Exception("The last updated time index and its partition value have to be given together")
+    return get_last_updated_time_index_partition_key(metadata_cache.describe_table(table_name, aws_profile), last_updated_time_index)
+
+def query_index_and_delete(client, table_name, recovery_point, index_name, partition_key, partition_value, checkpoint, delete_executor=None):
+    # Only the records updated from the day before the recovery point on are read, so the cost scales with the records deleted.
+    # A query reads one partition, records in other partitions of the index (or missing from it) are not truncated
+    query_kwargs = dict(
+        TableName = table_name,
+        IndexName = index_name,
+        KeyConditionExpression='#partitionKey = :partitionValue AND #lastUpdatedTime > :cutoff',
+        ProjectionExpression='#name, #lastUpdatedTime',
+        ExpressionAttributeNames={'#partitionKey': partition_key, '#name': 'name', '#lastUpdatedTime': 'lastUpdatedTime'},
+        ExpressionAttributeValues={':partitionValue': {'S': partition_value}, ':cutoff': {'S': get_last_updated_time_filter_bound(recovery_point)}},
+        ReturnConsumedCapacity='TOTAL'
+    )
+    scanned_count, deleted_count = delete_records_with_checkpoint(client, table_name, recovery_point, 'query', query_kwargs, checkpoint, index_name, delete_executor)
+    logging.info("Index %s of %s: read %s records, deleted %s records", index_name, table_name, scanned_count, deleted_count)
+    return {"index": index_name, "scanned": scanned_count, "deleted": deleted_count}
+
+def delete_records_with_last_updated_time_after_recovery_point(table_name, recovery_point, aws_profile, total_segments=DEFAULT_SCAN_SEGMENTS, max_workers=DEFAULT_SCAN_WORKERS,
+                                                               last_updated_time_index=None, index_partition_value=None, checkpoint=None,
+                                                               target_capacity_percent=rate_limiter.DEFAULT_TARGET_PERCENT):
+    checkpoint = checkpoint or checkpoints.RestoreCheckpoint()
+    try:
+        # Scans and deletes of all workers share one read and one write budget, so the table keeps room for production traffic
+        rate_limiter.configure(table_name, aws_profile, target_capacity_percent)
+        # Low level clients are thread safe, so the pooled client is shared by all workers
+        client = aws_clients.get_dynamodb_client(aws_profile)
+        partition_key = validate_last_updated_time_index(table_name, last_updated_time_index, index_partition_value, aws_profile)
+        # All segments hand their deletes to one pool, so scan workers plus delete workers bound the connections in use
+        # whatever the number of segments
+        with ThreadPoolExecutor(max_workers=DEFAULT_DELETE_WORKERS) as delete_executor:
+            if partition_key is not None:
+                segment_stats = [query_index_and_delete(client, table_name, recovery_point, last_updated_time_index, partition_key, index_partition_value, checkpoint,
+                                                        delete_executor)]
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(scan_segment_and_delete, client, table_name, recovery_point, segment, total_segments, checkpoint, delete_executor)
+                               for segment in range(total_segments)]
+                    segment_stats = [future.result() for future in futures]
+        logging.info("Truncation of %s done: scanned %s records, deleted %s records", table_name,
+                     sum(stats["scanned"] for stats in segment_stats), sum(stats["deleted"] for stats in segment_stats))
+        return segment_stats
     except Exception:
-        logging.info("Error while deleting records")
+        logging.exception("Error while deleting records")
         raise Exception("Error while deleting records!")
 
-def log_arguments(source_client_name, target_client_name, aws_profile, restore_datetime_epoch, env):
+def log_arguments(source_table, target_table, aws_profile, restore_datetime_epoch):
     logging.info("Restore datetime epoch: %s", restore_datetime_epoch)
-    logging.info("Source client Name: %s", source_client_name)
-    logging.info("Target client Name: %s", target_client_name)
     logging.info("Aws profile: %s", aws_profile)
-    logging.info("Source table name: %s", utils.get_lro_store_table_name(source_client_name, env))
-    logging.info("Target table name: %s", utils.get_lro_store_table_name(target_client_name, env))
-
-def enable_point_in_time_recovery_on_table_using_aws_cli(table_name):
-    output = os.popen("aws dynamodb update-continuous-backups --table-name " + table_name + " --point-in-time-recovery-specification PointInTimeRecoveryEnabled=true").read()
-    logging.info("PITR enabled on table %s, Response: %s", table_name, output)
+    logging.info("Source table name: %s", source_table)
+    logging.info("Target table name: %s", target_table)
 
 def enable_point_in_time_recovery_on_table(table_name, aws_profile):
-    session = boto3.Session(profile_name=aws_profile)
-    client = session.client('dynamodb')
+    client = aws_clients.get_dynamodb_client(aws_profile)
     response = client.update_continuous_backups(
         TableName=table_name,
         PointInTimeRecoverySpecification={
             'PointInTimeRecoveryEnabled': True
         }
     )
+    metadata_cache.invalidate(table_name, aws_profile)
     logging.info("PITR enabled on table %s, Response: %s", table_name, response)
 
 def table_arn(table_name, aws_profile):
-    session = boto3.Session(profile_name=aws_profile)
-    resource = session.resource('dynamodb')
-    return resource.Table(table_name).table_arn
+    return describe_table(table_name, aws_profile)["TableArn"]
 
 def get_pitr_status(table_name, aws_profile):
-    session = boto3.Session(profile_name=aws_profile)
-    dynamodb_client = session.client('dynamodb')
-    continuous_backup_json_response = json.loads(json.dumps(dynamodb_client.describe_continuous_backups(TableName=table_name), default=str))
-    pitr_status = continuous_backup_json_response['ContinuousBackupsDescription']['PointInTimeRecoveryDescription']['PointInTimeRecoveryStatus']
+    continuous_backups_description = metadata_cache.describe_continuous_backups(table_name, aws_profile)
+    pitr_status = continuous_backups_description['PointInTimeRecoveryDescription']['PointInTimeRecoveryStatus']
     logging.info("PointInTimeRecoveryStatus: %s", pitr_status)
     return pitr_status
 
 def get_earliest_restorable_point(table_name, aws_profile):
-    session = boto3.Session(profile_name=aws_profile)
-    dynamodb_client = session.client('dynamodb')
-    continuous_backup_json_response = json.loads(json.dumps(dynamodb_client.describe_continuous_backups(TableName=table_name), default=str))
-    earliest_restorable_datetime = continuous_backup_json_response['ContinuousBackupsDescription']['PointInTimeRecoveryDescription']['EarliestRestorableDateTime']
+    continuous_backups_description = metadata_cache.describe_continuous_backups(table_name, aws_profile)
+    earliest_restorable_datetime = continuous_backups_description['PointInTimeRecoveryDescription']['EarliestRestorableDateTime']
     logging.info("EarliestRestorableDateTime: %s", earliest_restorable_datetime)
     return earliest_restorable_datetime
 
-def recover_lro_store(source_client, dest_client, restore_datetime, env, aws_profile, seconds_to_add_in_erp = 0):
+def recover_table(source_table, target_table, restore_datetime, aws_profile, seconds_to_add_in_erp = 0, scan_segments = DEFAULT_SCAN_SEGMENTS, scan_workers = DEFAULT_SCAN_WORKERS,
+                  last_updated_time_index = None, index_partition_value = None, checkpoint_dir = None, target_capacity_percent = rate_limiter.DEFAULT_TARGET_PERCENT,
+                  aws_backup_role_arn = None, max_backup_staleness_seconds = 0, dry_run = False):
     try:
-        source_table = utils.get_lro_store_table_name(source_client, env)
-        target_table = utils.get_lro_store_table_name(dest_client, env)
-        is_table_exist(source_table, aws_profile)
-        source_table_pitr_status = get_pitr_status(source_table, aws_profile)
-
-        if source_table_pitr_status == "DISABLED":
-            logging.info("Source table %s Point in time recovery is DISABLED, so we can't proceed with recovery", source_table)
-            raise Exception("Source table PITR is Disabled!")
-
-        restore_datetime = datetime.strptime(restore_datetime, "%Y-%m-%d %H:%M:%S")
-        restore_datetime_utc = restore_datetime.replace(tzinfo=timezone.utc)
-        log_arguments(source_client, dest_client, aws_profile,  restore_datetime_utc.timestamp(), env)
-
-        earliest_restorable_point = utils.convert_datetime_to_utc_tz(get_earliest_restorable_point(source_table, aws_profile)) + timedelta(seconds=seconds_to_add_in_erp)
-
-        truncate_table_required = False
-        if (restore_datetime_utc > earliest_restorable_point):
-            logging.info("Recovery point %s is after earliest restorable point %s", restore_datetime_utc, earliest_restorable_point)
-            actual_restoration_point = restore_datetime_utc.timestamp()
-        else:
-            logging.info("Recovery point %s is before earliest restorable point %s", restore_datetime_utc, earliest_restorable_point)
-            actual_restoration_point = earliest_restorable_point.timestamp()
-            truncate_table_required =True
-
-        delete_table_if_exist(target_table, aws_profile)
-        restore_table_to_point_in_time(source_table, target_table, str(actual_restoration_point))
-        wait_for_table_to_be_in_active_status(target_table)
-        enable_point_in_time_recovery_on_table(target_table, aws_profile)
-        if truncate_table_required:
-            delete_records_with_last_updated_time_after_recovery_point(target_table, restore_datetime, aws_profile)
-
+        # Checked on the source before anything is restored, the restored table gets the source's indexes
+        validate_last_updated_time_index(source_table, last_updated_time_index, index_partition_value, aws_profile)
+        if dry_run:
+            plan = restore_planner.plan_restore(source_table, restore_datetime, aws_profile, seconds_to_add_in_erp, scan_segments, aws_backup_role_arn, max_backup_staleness_seconds)
+            print(restore_planner.format_plan(plan))
+            return 0 if plan["chosen"] else 1
+        checkpoint = checkpoints.RestoreCheckpoint.load(checkpoint_dir, source_table, target_table, restore_datetime)
+        if not checkpoint.is_done(checkpoints.SOURCE_VALIDATED):
+            with metrics.span("validate", target_table):
+                is_table_exist(source_table, aws_profile)
+                restore_datetime_utc = datetime.strptime(restore_datetime, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+                log_arguments(source_table, target_table, aws_profile, restore_datetime_utc.timestamp())
+
+                # Considers PITR as well as the table's backups, and picks the source needing the least truncation
+                plan = restore_planner.plan_restore(source_table, restore_datetime, aws_profile, seconds_to_add_in_erp, scan_segments, aws_backup_role_arn,
+                                                    max_backup_staleness_seconds)
+                logging.info(restore_planner.format_plan(plan))
+                restore_source = plan["chosen"]
+                if restore_source is None:
+                    if get_pitr_status(source_table, aws_profile) == "DISABLED":
+                        logging.info("Source table %s Point in time recovery is DISABLED and it has no usable backup, so we can't proceed with recovery", source_table)
+                        raise Exception("Source table PITR is Disabled!")
+                    raise Exception("No restore source for table %s at %s" % (source_table, restore_datetime))
+            # The earliest restorable point moves over time, so a resumed run has to reuse this decision
+            checkpoint.mark_done(checkpoints.SOURCE_VALIDATED, restore_source=restore_source, actual_restoration_point=restore_source["restore_time"],
+                                 truncate_table_required=restore_source["truncate"], scan_segments=scan_segments)
+
+        restore_plan = checkpoint.get(checkpoints.SOURCE_VALIDATED)
+        restore_source = restore_plan.get("restore_source") or {"source": restore_planner.PITR}
+        recovery_point = datetime.strptime(restore_datetime, "%Y-%m-%d %H:%M:%S")
+
+        if not checkpoint.is_done(checkpoints.RESTORE_ISSUED):
+            issuing = checkpoint.get(checkpoints.RESTORE_ISSUING)
+            # The target is deleted before RESTORE_ISSUING is marked, so a target found after it is the one an earlier run
+            # started restoring before it stopped. It is waited for instead of deleted. An AWS Backup job creates the table
+            # late, so for it the idempotency token is what finds the earlier job
+            issued_before = issuing is not None and (restore_source["source"] == restore_planner.AWS_BACKUP
+                                                     or get_table_status_if_exist(target_table, aws_profile) is not None)
+            if issued_before:
+                logging.info("Restore of %s was issued by an earlier run, waiting for it instead of restoring again", target_table)
+            else:
+                with metrics.span("delete_target", target_table):
+                    delete_table_if_exist(target_table, aws_profile)
+                issuing = {"idempotency_token": str(uuid.uuid4())}
+                checkpoint.mark_done(checkpoints.RESTORE_ISSUING, **issuing)
+            restore_job_id = None
+            if restore_source["source"] == restore_planner.AWS_BACKUP:
+                with metrics.span("backup_restore", target_table):
+                    restore_job_id = start_aws_backup_restore(target_table, restore_source["arn"], aws_backup_role_arn, aws_profile, issuing["idempotency_token"])
+            elif issued_before:
+                metadata_cache.invalidate(target_table, aws_profile)
+            elif restore_source["source"] == restore_planner.BACKUP:
+                with metrics.span("backup_restore", target_table):
+                    start_restore_table_from_backup(target_table, restore_source["arn"], aws_profile)
+            else:
+                with metrics.span("pitr_restore", target_table):
+                    restore_table_to_point_in_time(source_table, target_table, str(restore_plan["actual_restoration_point"]), aws_profile)
+            checkpoint.mark_done(checkpoints.RESTORE_ISSUED, restore_job_id=restore_job_id)
+        if not checkpoint.is_done(checkpoints.TABLE_ACTIVE):
+            with metrics.span("wait_active", target_table):
+                restore_job_id = (checkpoint.get(checkpoints.RESTORE_ISSUED) or {}).get("restore_job_id")
+                if restore_job_id is not None:
+                    wait_for_restore_job_to_complete(restore_job_id, aws_profile)
+                wait_for_table_to_be_in_active_status(target_table, aws_profile)
+            checkpoint.mark_done(checkpoints.TABLE_ACTIVE)
+        if not checkpoint.is_done(checkpoints.PITR_ENABLED):
+            with metrics.span("enable_pitr", target_table):
+                enable_point_in_time_recovery_on_table(target_table, aws_profile)
+            checkpoint.mark_done(checkpoints.PITR_ENABLED)
+        if restore_plan["truncate_table_required"] and not checkpoint.is_done(checkpoints.TRUNCATED):
+            with metrics.span("truncate", target_table):
+                delete_records_with_last_updated_time_after_recovery_point(target_table, recovery_point, aws_profile, restore_plan["scan_segments"], scan_workers,
+                                                                           last_updated_time_index, index_partition_value, checkpoint, target_capacity_percent)
+            checkpoint.mark_done(checkpoints.TRUNCATED)
+
+        checkpoint.remove()
         logging.info("Point in Time Recovery is successfully done! in table %s", target_table)
+        logging.info("Metadata cache: %s", metadata_cache.get_stats())
         return 0
     except Exception:
+        logging.exception("Point in Time Recovery of table %s to %s failed", source_table, target_table)
         return 1
 
+def recover_lro_store(source_client, dest_client, restore_datetime, env, aws_profile, seconds_to_add_in_erp = 0, scan_segments = DEFAULT_SCAN_SEGMENTS, scan_workers = DEFAULT_SCAN_WORKERS,
+                      last_updated_time_index = None, index_partition_value = None, checkpoint_dir = None, target_capacity_percent = rate_limiter.DEFAULT_TARGET_PERCENT,
+                      aws_backup_role_arn = None, max_backup_staleness_seconds = 0, dry_run = False):
+    logging.info("Source client Name: %s", source_client)
+    logging.info("Target client Name: %s", dest_client)
+    source_table = utils.get_lro_store_table_name(source_client, env)
+    target_table = utils.get_lro_store_table_name(dest_client, env)
+    return recover_table(source_table, target_table, restore_datetime, aws_profile, seconds_to_add_in_erp, scan_segments, scan_workers,
+                         last_updated_time_index, index_partition_value, checkpoint_dir, target_capacity_percent, aws_backup_role_arn, max_backup_staleness_seconds, dry_run)
+
 def enable_pitr(table_name, aws_profile):
     enable_point_in_time_recovery_on_table(table_name, aws_profile)
 
-if __name__ == "__main__":
-    args = get_args_parser().parse_args()
-    sys.exit(recover_lro_store(args.source_client_name, args.target_client_name, args.restore_datetime, args.env, args.aws_profile))
-
-
-
-
-
-        
-
-
-
-
-
+def main(argv=None):
+    global item_log_sample_rate
+    parser = get_args_parser()
+    args = parser.parse_args(argv)
+    if (args.last_updated_time_index is None) != (args.index_partition_value is None):
+        parser.error("--last-updated-time-index and --last-updated-time-index-partition-value have to be given together")
+    item_log_sample_rate = args.item_log_sample_rate
+    status = recover_lro_store(args.source_client_name, args.target_client_name, args.restore_datetime, args.env, args.aws_profile,
+                               scan_segments=args.scan_segments, scan_workers=args.scan_workers,
+                               last_updated_time_index=args.last_updated_time_index, index_partition_value=args.index_partition_value,
+                               checkpoint_dir=args.checkpoint_dir, target_capacity_percent=args.target_capacity_percent,
+                               aws_backup_role_arn=args.aws_backup_role_arn, max_backup_staleness_seconds=args.max_backup_staleness_seconds, dry_run=args.dry_run)
+    if args.metrics_output:
+        metrics.write(args.metrics_output)
+    return status
 
+if __name__ == "__main__":
+    sys.exit(main())
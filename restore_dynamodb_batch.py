@@ -0,0 +1,125 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metadata_cache
+import metrics
+import rate_limiter
+import restore_dynamodb
+import utils
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_IN_FLIGHT_RESTORES = 10
+MANIFEST_FIELDS = ["source_client", "target_client", "restore_datetime"]
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to restore all DynamoDB tables of many clients concurrently")
+    parser.add_argument("--manifest", dest="manifest", action="store", required=True, help="JSON list or CSV file with source_client, target_client and restore_datetime (yyyy-mm-dd hh:mm:ss in UTC) per entry")
+    parser.add_argument("--summary-output", dest="summary_output", action="store", default="restore_summary.json", help="File the JSON summary is written to")
+    parser.add_argument("--max-in-flight", dest="max_in_flight", action="store", type=int, default=DEFAULT_MAX_IN_FLIGHT_RESTORES, help="Maximum number of table restores running at the same time")
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--scan-segments", dest="scan_segments", action="store", type=int, default=restore_dynamodb.DEFAULT_SCAN_SEGMENTS)
+    parser.add_argument("--scan-workers", dest="scan_workers", action="store", type=int, default=restore_dynamodb.DEFAULT_SCAN_WORKERS)
+    parser.add_argument("--checkpoint-dir", dest="checkpoint_dir", action="store", default=restore_dynamodb.DEFAULT_CHECKPOINT_DIR)
+    parser.add_argument("--target-capacity-percent", dest="target_capacity_percent", action="store", type=float, default=rate_limiter.DEFAULT_TARGET_PERCENT)
+    parser.add_argument("--metrics-output", dest="metrics_output", action="store", default=None, help="File phase timings and counters of every table are written to, Prometheus text if it ends with .prom and JSON otherwise")
+    parser.add_argument("--item-log-sample-rate", dest="item_log_sample_rate", action="store", type=float, default=0.0)
+    return parser
+
+def read_manifest(manifest_path):
+    with open(manifest_path) as manifest_file:
+        if manifest_path.endswith(".csv"):
+            entries = list(csv.DictReader(manifest_file))
+        else:
+            entries = json.load(manifest_file)
+    for entry in entries:
+        missing_fields = [field for field in MANIFEST_FIELDS if not entry.get(field)]
+        if missing_fields:
+            raise Exception("Manifest entry %s is missing %s" % (entry, ", ".join(missing_fields)))
+    logging.info("Read %s entries from manifest %s", len(entries), manifest_path)
+    return entries
+
+def expand_manifest(entries, env):
+    # utils.get_dynamodb_tables returns the tables of a client in a fixed order, so source and target tables pair up
+    restores = []
+    for entry in entries:
+        source_tables = utils.get_dynamodb_tables(entry["source_client"], env)
+        target_tables = utils.get_dynamodb_tables(entry["target_client"], env)
+        for source_table, target_table in zip(source_tables, target_tables):
+            restores.append({
+                "source_client": entry["source_client"],
+                "target_client": entry["target_client"],
+                "restore_datetime": entry["restore_datetime"],
+                "source_table": source_table,
+                "target_table": target_table
+            })
+    check_restore_targets(restores)
+    return restores
+
+def check_restore_targets(restores):
+    # Every restore starts by deleting its target, so two restores into one table would delete each other's work,
+    # and restoring into a table another entry restores from would change that entry's source
+    restores_by_target = {}
+    for restore in restores:
+        earlier_restore = restores_by_target.setdefault(restore["target_table"], restore)
+        if earlier_restore is not restore:
+            raise Exception("Manifest entries %s -> %s and %s -> %s both restore table %s" % (earlier_restore["source_client"], earlier_restore["target_client"],
+                                                                                          restore["source_client"], restore["target_client"], restore["target_table"]))
+    source_tables = {restore["source_table"] for restore in restores}
+    overwritten_sources = sorted(source_tables & set(restores_by_target))
+    if overwritten_sources:
+        raise Exception("Manifest restores into tables it also restores from: %s" % ", ".join(overwritten_sources))
+
+def run_restore(restore, aws_profile, scan_segments, scan_workers, checkpoint_dir, target_capacity_percent):
+    logging.info("Restoring %s to %s at %s", restore["source_table"], restore["target_table"], restore["restore_datetime"])
+    start = time.perf_counter()
+    status = restore_dynamodb.recover_table(restore["source_table"], restore["target_table"], restore["restore_datetime"], aws_profile,
+                                            scan_segments=scan_segments, scan_workers=scan_workers, checkpoint_dir=checkpoint_dir,
+                                            target_capacity_percent=target_capacity_percent)
+    result = dict(restore)
+    result["status"] = "SUCCEEDED" if status == 0 else "FAILED"
+    result["duration_seconds"] = round(time.perf_counter() - start, 3)
+    logging.info("Restore of %s %s in %s seconds", restore["target_table"], result["status"], result["duration_seconds"])
+    return result
+
+def recover_batch(entries, env, aws_profile, max_in_flight=DEFAULT_MAX_IN_FLIGHT_RESTORES, scan_segments=restore_dynamodb.DEFAULT_SCAN_SEGMENTS, scan_workers=restore_dynamodb.DEFAULT_SCAN_WORKERS,
+                  checkpoint_dir=None, target_capacity_percent=rate_limiter.DEFAULT_TARGET_PERCENT):
+    restores = expand_manifest(entries, env)
+    logging.info("Starting %s table restores, at most %s in flight", len(restores), max_in_flight)
+    start = time.perf_counter()
+    # The pool size is the global limit on in-flight restores since every worker runs one restore end to end
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = [executor.submit(run_restore, restore, aws_profile, scan_segments, scan_workers, checkpoint_dir, target_capacity_percent) for restore in restores]
+        results = [future.result() for future in futures]
+    return {
+        "total": len(results),
+        "succeeded": sum(1 for result in results if result["status"] == "SUCCEEDED"),
+        "failed": sum(1 for result in results if result["status"] == "FAILED"),
+        "duration_seconds": round(time.perf_counter() - start, 3),
+        "metadata_cache": metadata_cache.get_stats(),
+        "restores": results
+    }
+
+def write_summary(summary, summary_output):
+    with open(summary_output, "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    logging.info("Restore summary written to %s: %s succeeded, %s failed", summary_output, summary["succeeded"], summary["failed"])
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    restore_dynamodb.item_log_sample_rate = args.item_log_sample_rate
+    summary = recover_batch(read_manifest(args.manifest), args.env, args.aws_profile, args.max_in_flight, args.scan_segments, args.scan_workers, args.checkpoint_dir,
+                            args.target_capacity_percent)
+    write_summary(summary, args.summary_output)
+    if args.metrics_output:
+        metrics.write(args.metrics_output)
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
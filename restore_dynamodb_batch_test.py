@@ -0,0 +1,98 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import logging
+import restore_dynamodb
+import restore_dynamodb_batch
+import sys
+import time
+import utils
+from datetime import datetime, timezone
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test restoring the tables of many clients from a manifest")
+    parser.add_argument("--source-client-name", dest="source_client_name", action="store", default='test-batch')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def manifest_entry(source_client, target_client, restore_datetime="2024-01-01 00:00:00"):
+    return {"source_client": source_client, "target_client": target_client, "restore_datetime": restore_datetime}
+
+def expect_rejected(entries, env, description):
+    try:
+        restore_dynamodb_batch.expand_manifest(entries, env)
+    except Exception as error:
+        logging.info("%s rejected: %s", description, error)
+        return
+    raise Exception("Expected the manifest to be rejected: %s" % description)
+
+def test_conflicting_targets_rejected(args):
+    try:
+        logging.info("############-test_conflicting_targets_rejected-#############")
+        expect_rejected([manifest_entry("client1", "restored"), manifest_entry("client1", "restored", "2024-01-02 00:00:00")], args.env,
+                        "Same target client twice")
+        expect_rejected([manifest_entry("client1", "restored"), manifest_entry("client2", "restored")], args.env, "Two sources restored to one target")
+        expect_rejected([manifest_entry("client1", "client2"), manifest_entry("client2", "restored")], args.env, "Target that another entry restores from")
+        expect_rejected([manifest_entry("client1", "client1")], args.env, "Client restored onto itself")
+        restores = restore_dynamodb_batch.expand_manifest([manifest_entry("client1", "restored1"), manifest_entry("client1", "restored2")], args.env)
+        if len(restores) != 4:
+            raise Exception("Expected one source restored to two targets to give 4 table restores, got %s" % restores)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_recover_batch(args):
+    try:
+        logging.info("############-test_recover_batch-#############")
+        client = aws_clients.get_dynamodb_client(args.aws_profile)
+        target_clients = [args.source_client_name + "-restored1", args.source_client_name + "-restored2"]
+        for table_name in utils.get_dynamodb_tables(args.source_client_name, args.env):
+            restore_dynamodb.delete_table_if_exist(table_name, args.aws_profile)
+            client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+            client.get_waiter('table_exists').wait(TableName=table_name)
+            restore_dynamodb.enable_point_in_time_recovery_on_table(table_name, args.aws_profile)
+            client.put_item(TableName=table_name, Item={'name': {'S': 'record1'}, 'lastUpdatedTime': {'S': '2024-01-01T00:00:00.000000Z'}})
+        time.sleep(2)
+        restore_datetime = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        entries = [manifest_entry(args.source_client_name, target_client, restore_datetime) for target_client in target_clients]
+        summary = restore_dynamodb_batch.recover_batch(entries, args.env, args.aws_profile, max_in_flight=4)
+        if summary["total"] != 4 or summary["succeeded"] != 4:
+            raise Exception("Expected 4 table restores to succeed, got %s" % summary)
+        for target_client in target_clients:
+            for table_name in utils.get_dynamodb_tables(target_client, args.env):
+                if client.get_item(TableName=table_name, Key={'name': {'S': 'record1'}}).get('Item') is None:
+                    raise Exception("record1 missing from restored table %s" % table_name)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_conflicting_targets_rejected(args)
+    test_2_status = test_recover_batch(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_conflicting_targets_rejected")
+    log_test_status_successful_if_0(test_2_status, "test_recover_batch")
+
+    if test_1_status == 0 and test_2_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
@@ -0,0 +1,413 @@
+import argparse
+import aws_clients
+import botocore.exceptions
+import checkpoints
+import fake_dynamodb
+import logging
+import metadata_cache
+import metrics
+import restore_dynamodb
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RESTORE_DATETIME = "2024-01-01 12:00:00"
+INDEX_NAME = "tenant-lastUpdatedTime-index"
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test the truncation, bulk delete and checkpoint building blocks of the restore")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='restore-dynamodb-test')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def get_recovery_point():
+    return datetime.strptime(RESTORE_DATETIME, "%Y-%m-%d %H:%M:%S")
+
+def make_record(name, seconds_from_restore_time, tenant="tenant-a"):
+    last_updated_time = (get_recovery_point() + timedelta(seconds=seconds_from_restore_time)).strftime(restore_dynamodb.LAST_UPDATED_TIME_FORMAT)
+    return {'name': {'S': name}, 'lastUpdatedTime': {'S': last_updated_time}, 'tenant': {'S': tenant}}
+
+def create_table(table_name, records, aws_profile, with_index=False):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_dynamodb.delete_table_if_exist(table_name, aws_profile)
+    metadata_cache.invalidate(table_name, aws_profile)
+    attribute_definitions = [{'AttributeName': 'name', 'AttributeType': 'S'}]
+    kwargs = {}
+    if with_index:
+        attribute_definitions += [{'AttributeName': 'tenant', 'AttributeType': 'S'}, {'AttributeName': 'lastUpdatedTime', 'AttributeType': 'S'}]
+        kwargs["GlobalSecondaryIndexes"] = [{'IndexName': INDEX_NAME, 'KeySchema': [{'AttributeName': 'tenant', 'KeyType': 'HASH'}, {'AttributeName': 'lastUpdatedTime', 'KeyType': 'RANGE'}],
+                                             'Projection': {'ProjectionType': 'ALL'}}]
+    client.create_table(TableName = table_name, AttributeDefinitions=attribute_definitions, KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST", **kwargs)
+    client.get_waiter('table_exists').wait(TableName=table_name)
+    for record in records:
+        client.put_item(TableName=table_name, Item=record)
+
+def table_exists(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    try:
+        client.describe_table(TableName=table_name)
+        return True
+    except client.exceptions.ResourceNotFoundException:
+        return False
+
+def get_record_names(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    names = set()
+    for page in client.get_paginator('scan').paginate(TableName=table_name, ConsistentRead=True):
+        names.update(item['name']['S'] for item in page['Items'])
+    return names
+
+def expect_records(table_name, expected_names, aws_profile):
+    names = get_record_names(table_name, aws_profile)
+    if names != set(expected_names):
+        raise Exception("Expected records %s in %s, got %s" % (sorted(expected_names), table_name, sorted(names)))
+
+def test_index_arguments_checked_before_restore(args):
+    try:
+        logging.info("############-test_index_arguments_checked_before_restore-#############")
+        target_table = args.table_name + "-restored"
+        create_table(args.table_name, [make_record("record1", -60)], args.aws_profile, with_index=True)
+        restore_dynamodb.enable_point_in_time_recovery_on_table(args.table_name, args.aws_profile)
+        restore_dynamodb.delete_table_if_exist(target_table, args.aws_profile)
+        for index_name, partition_value in ((INDEX_NAME, None), (None, "tenant-a"), ("missing-index", "tenant-a")):
+            status = restore_dynamodb.recover_table(args.table_name, target_table, RESTORE_DATETIME, args.aws_profile, last_updated_time_index=index_name,
+                                                    index_partition_value=partition_value)
+            if status != 1:
+                raise Exception("Expected the restore with index %s and partition value %s to fail" % (index_name, partition_value))
+            if table_exists(target_table, args.aws_profile):
+                raise Exception("Table %s was restored although the index arguments are invalid" % target_table)
+        try:
+            restore_dynamodb.main(["--source-client-name", "client", "--target-client-name", "client-restored", "--restore-datetime", RESTORE_DATETIME,
+                                   "--last-updated-time-index", INDEX_NAME])
+            raise Exception("Expected --last-updated-time-index without a partition value to be rejected")
+        except SystemExit as exit:
+            if exit.code != 2:
+                raise Exception("Expected an argument error, got exit code %s" % exit.code)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_truncate_with_index(args):
+    try:
+        logging.info("############-test_truncate_with_index-#############")
+        records = [make_record("a-before", -60), make_record("a-after", 60), make_record("b-after", 60, tenant="tenant-b")]
+        create_table(args.table_name, records, args.aws_profile, with_index=True)
+        restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(args.table_name, get_recovery_point(), args.aws_profile,
+                                                                                   last_updated_time_index=INDEX_NAME, index_partition_value="tenant-a")
+        # The query only reads the partition it was given
+        expect_records(args.table_name, ["a-before", "b-after"], args.aws_profile)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_segmented_truncation(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    page_size = getattr(client, "page_size", None)
+    try:
+        logging.info("############-test_segmented_truncation-#############")
+        # Small pages give every segment several of them, so the deletes of one segment span pages
+        if page_size is not None:
+            client.page_size = 7
+        records = [make_record("before-%s" % index, -1 - index) for index in range(100)] + [make_record("after-%s" % index, 1 + index) for index in range(150)]
+        create_table(args.table_name, records, args.aws_profile)
+        segment_stats = restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(args.table_name, get_recovery_point(), args.aws_profile,
+                                                                                                   total_segments=5, max_workers=3)
+        if sorted(stats["segment"] for stats in segment_stats) != list(range(5)):
+            raise Exception("Expected stats for segments 0 to 4, got %s" % segment_stats)
+        # The filter runs in DynamoDB, scanned counts every record read and deleted only the ones after the restore time
+        if sum(stats["scanned"] for stats in segment_stats) != 250 or sum(stats["deleted"] for stats in segment_stats) != 150:
+            raise Exception("Expected 250 records scanned and 150 deleted, got %s" % segment_stats)
+        expect_records(args.table_name, ["before-%s" % index for index in range(100)], args.aws_profile)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        if page_size is not None:
+            client.page_size = page_size
+
+def test_bulk_delete_reports_failures(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    batch_write_item = client.batch_write_item
+    invalid_name = "invalid-key"
+
+    def rejecting_batch_write_item(RequestItems, **kwargs):
+        # DynamoDB rejects a whole batch over one invalid key, the same way it does for a key of the wrong type
+        for requests in RequestItems.values():
+            if any(request['DeleteRequest']['Key']['name']['S'] == invalid_name for request in requests):
+                raise botocore.exceptions.ClientError({"Error": {"Code": "ValidationException", "Message": "The provided key element does not match the schema"}}, "BatchWriteItem")
+        return batch_write_item(RequestItems=RequestItems, **kwargs)
+
+    try:
+        logging.info("############-test_bulk_delete_reports_failures-#############")
+        names = ["record%s" % index for index in range(60)]
+        create_table(args.table_name, [make_record(name, 60) for name in names], args.aws_profile)
+        client.batch_write_item = rejecting_batch_write_item
+        report = restore_dynamodb.delete_records_by_lro_names(args.table_name, names[:30] + [invalid_name] + names[30:], args.aws_profile, max_workers=2)
+        if report["requested"] != 61 or report["deleted"] != 60 or report["failed_count"] != 1:
+            raise Exception("Expected 60 of 61 keys deleted and 1 failure, got %s" % report)
+        if report["failures"][0]["key"] != {'name': {'S': invalid_name}} or "ValidationException" not in report["failures"][0]["error"]:
+            raise Exception("Expected the invalid key reported with its error, got %s" % report["failures"])
+        expect_records(args.table_name, [], args.aws_profile)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        if client.__dict__.get("batch_write_item") is rejecting_batch_write_item:
+            del client.batch_write_item
+
+def test_deletes_share_one_pool(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    batch_write_item = client.batch_write_item
+    calls = {"in_flight": 0, "max_in_flight": 0}
+    calls_lock = threading.Lock()
+
+    def counting_batch_write_item(**kwargs):
+        with calls_lock:
+            calls["in_flight"] += 1
+            calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+        try:
+            # Slow enough for the deletes of all segments to overlap
+            time.sleep(0.01)
+            return batch_write_item(**kwargs)
+        finally:
+            with calls_lock:
+                calls["in_flight"] -= 1
+
+    try:
+        logging.info("############-test_deletes_share_one_pool-#############")
+        records = [make_record("before-%s" % index, -60) for index in range(50)] + [make_record("after-%s" % index, 60) for index in range(2000)]
+        create_table(args.table_name, records, args.aws_profile)
+        client.batch_write_item = counting_batch_write_item
+        segment_stats = restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(args.table_name, get_recovery_point(), args.aws_profile,
+                                                                                                   total_segments=16, max_workers=16)
+        if sum(stats["deleted"] for stats in segment_stats) != 2000:
+            raise Exception("Expected 2000 records deleted, got %s" % segment_stats)
+        expect_records(args.table_name, ["before-%s" % index for index in range(50)], args.aws_profile)
+        if calls["max_in_flight"] > restore_dynamodb.DEFAULT_DELETE_WORKERS:
+            raise Exception("%s BatchWriteItem calls ran at once, more than the %s delete workers" % (calls["max_in_flight"], restore_dynamodb.DEFAULT_DELETE_WORKERS))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        if client.__dict__.get("batch_write_item") is counting_batch_write_item:
+            del client.batch_write_item
+
+def test_resume_after_crash_while_issuing_restore(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    restore_table_to_point_in_time = restore_dynamodb.restore_table_to_point_in_time
+    checkpoint_dir = tempfile.mkdtemp()
+
+    def restore_then_crash(*restore_args, **restore_kwargs):
+        restore_table_to_point_in_time(*restore_args, **restore_kwargs)
+        raise Exception("Stopped after issuing the restore")
+
+    try:
+        logging.info("############-test_resume_after_crash_while_issuing_restore-#############")
+        target_table = args.table_name + "-restored"
+        create_table(args.table_name, [make_record("record1", -60)], args.aws_profile)
+        restore_dynamodb.enable_point_in_time_recovery_on_table(args.table_name, args.aws_profile)
+        restore_dynamodb.delete_table_if_exist(target_table, args.aws_profile)
+        time.sleep(2)
+        restore_datetime = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        restore_dynamodb.restore_table_to_point_in_time = restore_then_crash
+        try:
+            if restore_dynamodb.recover_table(args.table_name, target_table, restore_datetime, args.aws_profile, checkpoint_dir=checkpoint_dir) != 1:
+                raise Exception("Expected the first run to stop after issuing the restore")
+        finally:
+            restore_dynamodb.restore_table_to_point_in_time = restore_table_to_point_in_time
+        if not table_exists(target_table, args.aws_profile):
+            raise Exception("Expected the first run to leave %s being restored" % target_table)
+        call_counts = dict(getattr(client, "call_counts", {}))
+        if restore_dynamodb.recover_table(args.table_name, target_table, restore_datetime, args.aws_profile, checkpoint_dir=checkpoint_dir) != 0:
+            raise Exception("Expected the resumed restore to succeed")
+        # The resumed run waits for the table the first run is restoring, instead of deleting it and restoring again
+        for operation_name in ("DeleteTable", "RestoreTableToPointInTime"):
+            if getattr(client, "call_counts", {}).get(operation_name, 0) != call_counts.get(operation_name, 0):
+                raise Exception("The resumed restore called %s" % operation_name)
+        expect_records(target_table, ["record1"], args.aws_profile)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+def test_cutoff_boundary(args):
+    try:
+        logging.info("############-test_cutoff_boundary-#############")
+        cutoff = restore_dynamodb.get_last_updated_time_cutoff(get_recovery_point())
+        recovery_point_utc = get_recovery_point().replace(tzinfo=timezone.utc)
+        # The string comparison and the parsed comparison have to agree on both sides of the recovery point
+        expected_results = {
+            "2024-01-01T12:00:00.000000Z": False,
+            "2024-01-01T12:00:00.000001Z": True,
+            "2024-01-01T11:59:59.999999Z": False,
+            "2024-01-01T12:00:00Z": False,
+            "2024-01-01T12:00:01Z": True,
+            "2024-01-01T13:00:00+01:00": False,
+            "2024-01-01T13:00:00.000001+01:00": True,
+            "2024-01-01T11:30:00-01:00": True,
+            "2024-01-01T00:00:00-12:00": False,
+            "2024-01-01 12:30:00.000000+00:00": True
+        }
+        for last_updated_time_str, expected_result in expected_results.items():
+            if restore_dynamodb.is_updated_after_cutoff(last_updated_time_str, cutoff, recovery_point_utc) != expected_result:
+                raise Exception("Expected %s to be %s the recovery point" % (last_updated_time_str, "after" if expected_result else "at or before"))
+        records = [make_record("at-cutoff", 0), make_record("just-after", 0.000001), make_record("just-before", -0.000001)]
+        # Written in other formats, the server side filter returns them and they are parsed. With an offset west
+        # of UTC a later timestamp sorts before the cutoff as a string and still has to be deleted
+        for name, last_updated_time_str in [("no-fraction-at-cutoff", "2024-01-01T12:00:00Z"), ("no-fraction-after", "2024-01-01T12:00:01Z"),
+                                            ("offset-at-cutoff", "2024-01-01T13:00:00+01:00"), ("offset-after", "2024-01-01T13:00:00.000001+01:00"),
+                                            ("space-before", "2024-01-01 11:30:00.000000+00:00"), ("space-after", "2024-01-01 12:30:00.000000+00:00"),
+                                            ("west-offset-at-cutoff", "2024-01-01T00:00:00-12:00"), ("west-offset-after", "2024-01-01T11:30:00-01:00")]:
+            records.append({'name': {'S': name}, 'lastUpdatedTime': {'S': last_updated_time_str}, 'tenant': {'S': "tenant-a"}})
+        create_table(args.table_name, records, args.aws_profile)
+        restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(args.table_name, get_recovery_point(), args.aws_profile)
+        expect_records(args.table_name, ["at-cutoff", "just-before", "no-fraction-at-cutoff", "offset-at-cutoff", "space-before", "west-offset-at-cutoff"], args.aws_profile)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_truncation_resumes_from_checkpoint(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    scan = client.scan
+    page_size = client.page_size
+    checkpoint_dir = tempfile.mkdtemp()
+    scan_calls = []
+    failures = []
+
+    def failing_scan(**kwargs):
+        # Segment 0 fails once on its third page, after two pages are deleted and checkpointed
+        scan_calls.append(kwargs)
+        if not failures and kwargs["Segment"] == 0 and len([call for call in scan_calls if call["Segment"] == 0]) == 3:
+            failures.append(kwargs)
+            raise Exception("Connection lost")
+        return scan(**kwargs)
+
+    try:
+        logging.info("############-test_truncation_resumes_from_checkpoint-#############")
+        client.page_size = 5
+        records = [make_record("before-%s" % index, -60) for index in range(20)] + [make_record("after-%s" % index, 60) for index in range(40)]
+        create_table(args.table_name, records, args.aws_profile)
+        checkpoint = checkpoints.RestoreCheckpoint.load(checkpoint_dir, args.table_name, args.table_name, RESTORE_DATETIME)
+        client.scan = failing_scan
+        try:
+            restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(args.table_name, get_recovery_point(), args.aws_profile, total_segments=2, max_workers=2,
+                                                                                       checkpoint=checkpoint)
+            raise Exception("Expected the truncation to fail")
+        except Exception as error:
+            if str(error) != "Error while deleting records!":
+                raise
+        # The next run reads the progress back from the file like a restarted process would
+        checkpoint = checkpoints.RestoreCheckpoint.load(checkpoint_dir, args.table_name, args.table_name, RESTORE_DATETIME)
+        progress = checkpoint.get_segment(0)
+        if progress["done"] or progress["last_evaluated_key"] is None or not checkpoint.get_segment(1)["done"]:
+            raise Exception("Expected segment 0 stopped after a checkpointed page and segment 1 done, got %s" % checkpoint.state["segments"])
+        del scan_calls[:]
+        segment_stats = restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(args.table_name, get_recovery_point(), args.aws_profile, total_segments=2,
+                                                                                                   max_workers=2, checkpoint=checkpoint)
+        if any(call["Segment"] == 1 for call in scan_calls):
+            raise Exception("Segment 1 was scanned again although its checkpoint says it is done")
+        if scan_calls[0].get("ExclusiveStartKey") != progress["last_evaluated_key"]:
+            raise Exception("Segment 0 restarted from %s instead of %s" % (scan_calls[0].get("ExclusiveStartKey"), progress["last_evaluated_key"]))
+        # Totals carry over from the first run, so every record is counted once
+        if sum(stats["scanned"] for stats in segment_stats) != 60 or sum(stats["deleted"] for stats in segment_stats) != 40:
+            raise Exception("Expected 60 records scanned and 40 deleted over both runs, got %s" % segment_stats)
+        expect_records(args.table_name, ["before-%s" % index for index in range(20)], args.aws_profile)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        client.page_size = page_size
+        if client.__dict__.get("scan") is failing_scan:
+            del client.scan
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+def get_counter(name, table_name):
+    return sum(counter["value"] for counter in metrics.get_report()["counters"] if counter["name"] == name and counter["table"] == table_name)
+
+def test_scan_throttles_counted(args):
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
+    scan = client.scan
+    pages = {"count": 0}
+
+    def retried_scan(**kwargs):
+        # A scan the SDK had to retry twice before it got through
+        pages["count"] += 1
+        return dict(scan(**kwargs), ResponseMetadata={"RetryAttempts": 2})
+
+    try:
+        logging.info("############-test_scan_throttles_counted-#############")
+        create_table(args.table_name, [make_record("record%s" % index, 60) for index in range(10)], args.aws_profile)
+        metrics.reset()
+        client.scan = retried_scan
+        restore_dynamodb.delete_records_with_last_updated_time_after_recovery_point(args.table_name, get_recovery_point(), args.aws_profile, total_segments=4, max_workers=4)
+        throttles = get_counter(metrics.THROTTLES, args.table_name)
+        retries = get_counter(metrics.RETRIES, args.table_name)
+        if not pages["count"] or throttles != pages["count"] or retries != 2 * pages["count"]:
+            raise Exception("Expected %s throttles and %s retries for %s retried scan pages, got %s and %s" % (pages["count"], 2 * pages["count"], pages["count"], throttles, retries))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        if client.__dict__.get("scan") is retried_scan:
+            del client.scan
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+TESTS = [
+    test_index_arguments_checked_before_restore,
+    test_truncate_with_index,
+    test_segmented_truncation,
+    test_cutoff_boundary,
+    test_bulk_delete_reports_failures,
+    test_deletes_share_one_pool,
+    test_resume_after_crash_while_issuing_restore
+]
+# These replace client methods the stand-in's paginators call, boto3 paginators go around them
+OFFLINE_TESTS = [
+    test_truncation_resumes_from_checkpoint,
+    test_scan_throttles_counted
+]
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient(creating_seconds=1))
+
+    statuses = [(test.__name__, test(args)) for test in TESTS + (OFFLINE_TESTS if args.offline else [])]
+    for test_name, status in statuses:
+        log_test_status_successful_if_0(status, test_name)
+
+    if all(status == 0 for _, status in statuses):
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
@@ -1,5 +1,6 @@
 import argparse
-import boto3
+import aws_clients
+import fake_dynamodb
 import logging
 import restore_dynamodb
 import sys
@@ -17,11 +18,11 @@ def get_args_parser():
     parser.add_argument("--target-client-name", dest="target_client_name", action="store", default='test-pitr-restored')
     parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
     parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
     return parser
 
 def create_tables(table_name, aws_profile):
-    session = boto3.Session(profile_name=aws_profile)
-    dest_dynamo_client = session.client('dynamodb')
+    dest_dynamo_client = aws_clients.get_dynamodb_client(aws_profile)
     logging.info("Dynamo DB table %s creation in progress" %table_name)
     dest_dynamo_client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
     waiter = dest_dynamo_client.get_waiter('table_exists')
@@ -32,18 +33,17 @@ def create_tables(table_name, aws_profile):
 
 def insert_N_records_every_2_seconds_and_return_kth_record_time(table_name, n, k, aws_profile):
     count = 1
+    client = aws_clients.get_dynamodb_client(aws_profile)
     time_for_kth_record = datetime.now(tz=timezone.utc)
     while count < n:
-        session = boto3.Session(profile_name=aws_profile)
-        table = session.resource('dynamodb').Table(table_name)
         current_time = datetime.now(tz=timezone.utc)
         if count == k:
             time_for_kth_record = current_time
         nameValue = "record" + str(count)
         lastUpdatedTimeValue = str(current_time).replace(" ", "T").replace("+00:00", "Z")
-        response = table.put_item(Item={
-            'name': nameValue,
-            'lastUpdatedTime': lastUpdatedTimeValue
+        response = client.put_item(TableName=table_name, Item={
+            'name': {'S': nameValue},
+            'lastUpdatedTime': {'S': lastUpdatedTimeValue}
         })
         logging.info("Inserted name: %s and lastUpdatedTime: %s", nameValue, lastUpdatedTimeValue)
         count = count + 1
@@ -54,8 +54,7 @@ def insert_N_records_every_2_seconds_and_return_kth_record_time(table_name, n, k
 
 def print_table_records(table_name):
     logging.info("Printing recovered table %s records", table_name)
-    session = boto3.Session(profile_name=args.aws_profile)
-    client = session.client('dynamodb')
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
     dynamopaginator = client.get_paginator('scan')
     dynamoresponse = dynamopaginator.paginate(
         TableName = table_name,
@@ -70,8 +69,7 @@ def print_table_records(table_name):
 
 def verify_table_records(expected_records, table_name):
     logging.info("Verifying recovered table %s records. Expected are: %s", table_name, expected_records)
-    session = boto3.Session(profile_name=args.aws_profile)
-    client = session.client('dynamodb')
+    client = aws_clients.get_dynamodb_client(args.aws_profile)
     dynamopaginator = client.get_paginator('scan')
     dynamoresponse = dynamopaginator.paginate(
         TableName = table_name,
@@ -79,15 +77,21 @@ def verify_table_records(expected_records, table_name):
         ReturnConsumedCapacity='NONE',
         ConsistentRead=True
     )
+    all_match = True
+    found_records = set()
     for page in dynamoresponse:
-        all_match = True
         for item in page['Items']:
             logging.info(item)
+            found_records.add(item.get('name').get('S'))
             if (item.get('name').get('S') in expected_records):
                 logging.info("Record %s present in expected records list", item)
             else:
                 logging.info("Record %s NOT present in expected records list", item)
                 all_match = False
+    for record in expected_records:
+        if record not in found_records:
+            logging.info("Expected record %s NOT present in table", record)
+            all_match = False
     if all_match == False:
         raise Exception("Expected and Actual records list not matching")
 
@@ -184,6 +188,8 @@ def log_test_status_successful_if_1(status, test_name):
 
 if __name__ == "__main__":
     args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient(creating_seconds=1, deleting_seconds=1))
     #restore_dynamodb.enable_point_in_time_recovery_on_table("adapter-lro-store-client-wadhe-test-3-staging", args.aws_profile)
 
     test_1_status = test_recovery_point_after_earliest_restorable_point(args)
@@ -0,0 +1,151 @@
+import argparse
+import logging
+import sys
+from datetime import datetime, timezone, timedelta
+import aws_clients
+import metadata_cache
+import utils
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PITR = "pitr"
+BACKUP = "backup"
+AWS_BACKUP = "aws_backup"
+
+OPTIMIZE_FOR_TIME = "time"
+OPTIMIZE_FOR_COST = "cost"
+
+# Rough cost model, only used to rank restore sources against each other
+BYTES_PER_GB = 1024 ** 3
+RESTORE_BASE_SECONDS = 300
+RESTORE_SECONDS_PER_GB = 60
+RESTORE_USD_PER_GB = 0.15
+SCAN_ITEMS_PER_SECOND_PER_SEGMENT = 2000
+DELETES_PER_SECOND = 2000
+READ_REQUEST_USD = 0.125 / 1000000
+WRITE_REQUEST_USD = 0.625 / 1000000
+PITR_WINDOW_SECONDS = 35 * 24 * 60 * 60
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to print the restore plan of the LRO store of a client without restoring anything")
+    parser.add_argument("--source-client-name", dest="source_client_name", action="store", required=True)
+    parser.add_argument("--restore-datetime", dest="restore_datetime", action="store", help="Format: yyyy-mm-dd hh:mm:ss in UTC", required=True)
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--scan-segments", dest="scan_segments", action="store", type=int, default=8)
+    parser.add_argument("--aws-backup-role-arn", dest="aws_backup_role_arn", action="store", default=None, help="IAM role AWS Backup restores with, recovery points in backup vaults are only considered when it is set")
+    parser.add_argument("--max-backup-staleness-seconds", dest="max_backup_staleness_seconds", action="store", type=int, default=0, help="How long before the restore time a backup may have been taken and still be restored as is")
+    parser.add_argument("--optimize-for", dest="optimize_for", action="store", choices=[OPTIMIZE_FOR_TIME, OPTIMIZE_FOR_COST], default=OPTIMIZE_FOR_TIME)
+    return parser
+
+def make_candidate(source, restore_time, truncate, arn=None, name=None):
+    return {"source": source, "arn": arn, "name": name, "restore_time": restore_time.timestamp(), "restore_datetime": restore_time.isoformat(), "truncate": truncate}
+
+def get_backup_candidate(source, arn, name, created_at, restore_datetime_utc, max_backup_staleness_seconds):
+    # A backup taken after the restore time is truncated like a restore at the earliest restorable point,
+    # one taken shortly before it is only usable as is, and older ones would lose too many writes
+    if created_at >= restore_datetime_utc:
+        return make_candidate(source, created_at, True, arn, name)
+    if (restore_datetime_utc - created_at).total_seconds() <= max_backup_staleness_seconds:
+        return make_candidate(source, created_at, False, arn, name)
+    return None
+
+def list_pitr_candidates(table_name, aws_profile, restore_datetime_utc, seconds_to_add_in_erp):
+    pitr_description = metadata_cache.describe_continuous_backups(table_name, aws_profile)['PointInTimeRecoveryDescription']
+    if pitr_description['PointInTimeRecoveryStatus'] != "ENABLED":
+        logging.info("Point in time recovery of %s is %s", table_name, pitr_description['PointInTimeRecoveryStatus'])
+        return []
+    earliest_restorable_point = utils.convert_datetime_to_utc_tz(pitr_description['EarliestRestorableDateTime']) + timedelta(seconds=seconds_to_add_in_erp)
+    if restore_datetime_utc > earliest_restorable_point:
+        return [make_candidate(PITR, restore_datetime_utc, False)]
+    return [make_candidate(PITR, earliest_restorable_point, True)]
+
+def list_backup_candidates(table_name, aws_profile, restore_datetime_utc, max_backup_staleness_seconds):
+    # BackupType ALL also returns the AWS Backup recovery points of tables without advanced backup features
+    dynamodb_client = aws_clients.get_dynamodb_client(aws_profile)
+    candidates = []
+    for page in dynamodb_client.get_paginator('list_backups').paginate(TableName=table_name, BackupType='ALL'):
+        for backup in page['BackupSummaries']:
+            if backup['BackupStatus'] != "AVAILABLE":
+                continue
+            candidate = get_backup_candidate(BACKUP, backup['BackupArn'], backup['BackupName'], utils.convert_datetime_to_utc_tz(backup['BackupCreationDateTime']),
+                                             restore_datetime_utc, max_backup_staleness_seconds)
+            if candidate is not None:
+                candidates.append(candidate)
+    return candidates
+
+def list_aws_backup_candidates(table_name, aws_profile, restore_datetime_utc, max_backup_staleness_seconds):
+    # Recovery points of tables with advanced backup features live in backup vaults and are restored through AWS Backup
+    backup_client = aws_clients.get_client('backup', aws_profile)
+    table_arn = metadata_cache.describe_table(table_name, aws_profile)["TableArn"]
+    candidates = []
+    for page in backup_client.get_paginator('list_recovery_points_by_resource').paginate(ResourceArn=table_arn):
+        for recovery_point in page['RecoveryPoints']:
+            if recovery_point['Status'] != "COMPLETED" or not recovery_point['RecoveryPointArn'].startswith("arn:aws:backup:"):
+                continue
+            candidate = get_backup_candidate(AWS_BACKUP, recovery_point['RecoveryPointArn'], recovery_point.get('BackupVaultName'),
+                                             utils.convert_datetime_to_utc_tz(recovery_point['CreationDate']), restore_datetime_utc, max_backup_staleness_seconds)
+            if candidate is not None:
+                candidates.append(candidate)
+    return candidates
+
+def estimate_candidate(candidate, table_size_bytes, item_count, restore_datetime_utc, scan_segments):
+    # Truncation deletes what was written between the restore time and the candidate's time, assuming
+    # writes are spread evenly over the PITR window
+    size_gb = table_size_bytes / BYTES_PER_GB
+    estimated_seconds = RESTORE_BASE_SECONDS + size_gb * RESTORE_SECONDS_PER_GB
+    estimated_cost_usd = size_gb * RESTORE_USD_PER_GB
+    estimated_deletes = 0
+    if candidate["truncate"]:
+        window_seconds = candidate["restore_time"] - restore_datetime_utc.timestamp()
+        estimated_deletes = int(item_count * min(1, window_seconds / PITR_WINDOW_SECONDS))
+        estimated_seconds += item_count / (SCAN_ITEMS_PER_SECOND_PER_SEGMENT * scan_segments) + estimated_deletes / DELETES_PER_SECOND
+        estimated_cost_usd += table_size_bytes / 4096 * READ_REQUEST_USD + estimated_deletes * WRITE_REQUEST_USD
+    return dict(candidate, estimated_seconds=round(estimated_seconds, 1), estimated_cost_usd=round(estimated_cost_usd, 4), estimated_deletes=estimated_deletes)
+
+def plan_restore(source_table, restore_datetime, aws_profile='default', seconds_to_add_in_erp=0, scan_segments=8, aws_backup_role_arn=None, max_backup_staleness_seconds=0,
+                 optimize_for=OPTIMIZE_FOR_TIME):
+    restore_datetime_utc = datetime.strptime(restore_datetime, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    table = metadata_cache.describe_table(source_table, aws_profile)
+    candidates = list_pitr_candidates(source_table, aws_profile, restore_datetime_utc, seconds_to_add_in_erp)
+    candidates += list_backup_candidates(source_table, aws_profile, restore_datetime_utc, max_backup_staleness_seconds)
+    if aws_backup_role_arn is not None:
+        candidates += list_aws_backup_candidates(source_table, aws_profile, restore_datetime_utc, max_backup_staleness_seconds)
+    candidates = [estimate_candidate(candidate, table["TableSizeBytes"], table["ItemCount"], restore_datetime_utc, scan_segments) for candidate in candidates]
+    # On a tie the source closest to the restore time wins, it leaves the least to truncate or the least stale data
+    if optimize_for == OPTIMIZE_FOR_COST:
+        candidates.sort(key=lambda candidate: (candidate["estimated_cost_usd"], candidate["estimated_seconds"], abs(candidate["restore_time"] - restore_datetime_utc.timestamp())))
+    else:
+        candidates.sort(key=lambda candidate: (candidate["estimated_seconds"], candidate["estimated_cost_usd"], abs(candidate["restore_time"] - restore_datetime_utc.timestamp())))
+    return {
+        "source_table": source_table,
+        "restore_datetime": restore_datetime,
+        "table_size_bytes": table["TableSizeBytes"],
+        "item_count": table["ItemCount"],
+        "optimize_for": optimize_for,
+        "aws_backup_role_arn": aws_backup_role_arn,
+        "chosen": candidates[0] if candidates else None,
+        "candidates": candidates
+    }
+
+def format_plan(plan):
+    lines = ["Restore plan for %s at %s (%s items, %s bytes), optimized for %s:" % (plan["source_table"], plan["restore_datetime"], plan["item_count"],
+                                                                                   plan["table_size_bytes"], plan["optimize_for"])]
+    if not plan["candidates"]:
+        lines.append("  no restore source available")
+    for candidate in plan["candidates"]:
+        lines.append("  %s %-10s %s%s, truncate: %s, ~%s deletes, ~%s seconds, ~%s USD" % (
+            "*" if candidate is plan["chosen"] else " ", candidate["source"], candidate["restore_datetime"], " (%s)" % candidate["name"] if candidate["name"] else "",
+            candidate["truncate"], candidate["estimated_deletes"], candidate["estimated_seconds"], candidate["estimated_cost_usd"]))
+    return "\n".join(lines)
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    plan = plan_restore(utils.get_lro_store_table_name(args.source_client_name, args.env), args.restore_datetime, args.aws_profile, scan_segments=args.scan_segments,
+                        aws_backup_role_arn=args.aws_backup_role_arn, max_backup_staleness_seconds=args.max_backup_staleness_seconds, optimize_for=args.optimize_for)
+    print(format_plan(plan))
+    return 0 if plan["chosen"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import logging
+import metadata_cache
+import restore_dynamodb
+import restore_planner
+import sys
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test choosing the source a table is restored from")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='restore-planner-test')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def create_table(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_dynamodb.delete_table_if_exist(table_name, aws_profile)
+    # Backups outlive their table, the ones of earlier runs would be candidates too
+    for page in client.get_paginator('list_backups').paginate(TableName=table_name, BackupType='USER'):
+        for backup in page['BackupSummaries']:
+            client.delete_backup(BackupArn=backup['BackupArn'])
+    client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+    client.get_waiter('table_exists').wait(TableName=table_name)
+    client.put_item(TableName=table_name, Item={'name': {'S': 'record1'}, 'lastUpdatedTime': {'S': '2024-01-01T00:00:00.000000Z'}})
+
+def get_now_datetime():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def expect_chosen(plan, source, truncate, description):
+    chosen = plan["chosen"]
+    if chosen is None or chosen["source"] != source or chosen["truncate"] != truncate:
+        raise Exception("%s: expected %s with truncate %s chosen, got %s" % (description, source, truncate, restore_planner.format_plan(plan)))
+    logging.info("%s: %s chosen", description, source)
+
+def test_source_choice(args):
+    try:
+        logging.info("############-test_source_choice-#############")
+        metadata_cache.reset()
+        create_table(args.table_name, args.aws_profile)
+        if restore_planner.plan_restore(args.table_name, get_now_datetime(), args.aws_profile)["chosen"] is not None:
+            raise Exception("Expected no restore source without PITR or backups")
+        client = aws_clients.get_dynamodb_client(args.aws_profile)
+        client.create_backup(TableName=args.table_name, BackupName=args.table_name + "-planner")
+        time.sleep(2)
+        restore_datetime = get_now_datetime()
+        # The backup is a second or two older than the restore time
+        expect_chosen(restore_planner.plan_restore(args.table_name, restore_datetime, args.aws_profile, max_backup_staleness_seconds=3600), restore_planner.BACKUP, False,
+                      "Backup within the allowed staleness")
+        if restore_planner.plan_restore(args.table_name, restore_datetime, args.aws_profile)["chosen"] is not None:
+            raise Exception("Expected a backup taken before the restore time not to be used without allowed staleness")
+        time.sleep(2)
+        restore_dynamodb.enable_point_in_time_recovery_on_table(args.table_name, args.aws_profile)
+        expect_chosen(restore_planner.plan_restore(args.table_name, restore_datetime, args.aws_profile), restore_planner.PITR, True,
+                      "PITR enabled after the restore time")
+        expect_chosen(restore_planner.plan_restore(args.table_name, restore_datetime, args.aws_profile, max_backup_staleness_seconds=3600), restore_planner.BACKUP, False,
+                      "Stale backup against truncating PITR")
+        time.sleep(2)
+        restore_datetime = get_now_datetime()
+        # Both restore the table as it was, PITR is at the exact restore time and wins the tie
+        expect_chosen(restore_planner.plan_restore(args.table_name, restore_datetime, args.aws_profile, max_backup_staleness_seconds=3600), restore_planner.PITR, False,
+                      "PITR covering the restore time")
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_source_choice(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_source_choice")
+
+    if test_1_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
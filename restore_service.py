@@ -0,0 +1,275 @@
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import metadata_cache
+import metrics
+import restore_dynamodb
+import utils
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RESTORE = "restore"
+ENABLE_PITR = "enable_pitr"
+BACKUP = "backup"
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+DEFAULT_PORT = 8080
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_QUEUED_JOBS = 100
+DEFAULT_JOB_RETENTION_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_FINISHED_JOBS = 1000
+
+# The only params a request may set, the AWS profile, environment, scan settings and checkpoint directory come from the service's own arguments
+REQUIRED_PARAMS = {
+    RESTORE: ["source_client", "target_client", "restore_datetime"],
+    ENABLE_PITR: ["table_name"],
+    BACKUP: ["table_name", "backup_name"]
+}
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Service running restore, PITR and backup jobs submitted over HTTP")
+    parser.add_argument("--host", dest="host", action="store", default="127.0.0.1")
+    parser.add_argument("--port", dest="port", action="store", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-workers", dest="max_workers", action="store", type=int, default=DEFAULT_MAX_WORKERS, help="Number of jobs running at the same time")
+    parser.add_argument("--max-queued-jobs", dest="max_queued_jobs", action="store", type=int, default=DEFAULT_MAX_QUEUED_JOBS, help="Jobs waiting for a worker beyond this are rejected")
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--env", dest="env", action="store", default='staging')
+    parser.add_argument("--checkpoint-dir", dest="checkpoint_dir", action="store", default=restore_dynamodb.DEFAULT_CHECKPOINT_DIR)
+    parser.add_argument("--scan-segments", dest="scan_segments", action="store", type=int, default=restore_dynamodb.DEFAULT_SCAN_SEGMENTS)
+    parser.add_argument("--scan-workers", dest="scan_workers", action="store", type=int, default=restore_dynamodb.DEFAULT_SCAN_WORKERS)
+    parser.add_argument("--job-retention-seconds", dest="job_retention_seconds", action="store", type=int, default=DEFAULT_JOB_RETENTION_SECONDS, help="How long finished jobs can still be polled")
+    parser.add_argument("--max-finished-jobs", dest="max_finished_jobs", action="store", type=int, default=DEFAULT_MAX_FINISHED_JOBS, help="Finished jobs kept beyond this are dropped oldest first")
+    return parser
+
+class JobConflictException(Exception):
+    pass
+
+class QueueFullException(Exception):
+    pass
+
+class RestoreService:
+    """Runs restore, PITR and backup jobs on a bounded worker pool, with at most one active job per table.
+
+    Clients, the metadata cache and metrics are shared by every job since the process stays up between them.
+    """
+
+    def __init__(self, aws_profile='default', env='staging', max_workers=DEFAULT_MAX_WORKERS, max_queued_jobs=DEFAULT_MAX_QUEUED_JOBS, checkpoint_dir=None,
+                 scan_segments=restore_dynamodb.DEFAULT_SCAN_SEGMENTS, scan_workers=restore_dynamodb.DEFAULT_SCAN_WORKERS, job_retention_seconds=DEFAULT_JOB_RETENTION_SECONDS,
+                 max_finished_jobs=DEFAULT_MAX_FINISHED_JOBS):
+        self.aws_profile = aws_profile
+        self.env = env
+        self.max_queued_jobs = max_queued_jobs
+        self.checkpoint_dir = checkpoint_dir
+        self.scan_segments = scan_segments
+        self.scan_workers = scan_workers
+        self.job_retention_seconds = job_retention_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        # Tables written by an active job, and the jobs reading each table restores are running from
+        self._locked_tables = {}
+        self._read_tables = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def get_locked_tables(self, job_type, params):
+        # Returns the table the job changes, which no other active job may use, and the table a restore reads,
+        # which other restores may read too but no job may change
+        if job_type == RESTORE:
+            return utils.get_lro_store_table_name(params["target_client"], self.env), utils.get_lro_store_table_name(params["source_client"], self.env)
+        if job_type == ENABLE_PITR:
+            return params["table_name"], None
+        # Backups only read the table, they don't conflict with other jobs
+        return None, None
+
+    def check_conflicts(self, locked_table, read_table):
+        # Called with the lock held
+        if locked_table is not None and locked_table in self._locked_tables:
+            raise JobConflictException("Table %s is already used by job %s" % (locked_table, self._locked_tables[locked_table]))
+        if locked_table is not None and self._read_tables.get(locked_table):
+            raise JobConflictException("Table %s is restored from by job %s" % (locked_table, ", ".join(sorted(self._read_tables[locked_table]))))
+        if read_table is not None and read_table in self._locked_tables:
+            raise JobConflictException("Table %s is already used by job %s" % (read_table, self._locked_tables[read_table]))
+
+    def validate(self, job_type, params):
+        if not isinstance(job_type, str) or job_type not in REQUIRED_PARAMS:
+            raise ValueError("Unknown job type %s, expected one of %s" % (job_type, ", ".join(REQUIRED_PARAMS)))
+        if not isinstance(params, dict):
+            raise ValueError("Job params must be an object")
+        unknown_params = sorted(name for name in params if name not in REQUIRED_PARAMS[job_type])
+        if unknown_params:
+            raise ValueError("Job %s doesn't take %s" % (job_type, ", ".join(unknown_params)))
+        missing_params = [name for name in REQUIRED_PARAMS[job_type] if not isinstance(params.get(name), str) or not params[name]]
+        if missing_params:
+            raise ValueError("Job %s is missing %s, expected non-empty strings" % (job_type, ", ".join(missing_params)))
+        # A restore deletes its target before restoring from its source
+        if job_type == RESTORE and params["source_client"] == params["target_client"]:
+            raise ValueError("Job restore can't restore client %s onto itself" % params["source_client"])
+
+    def expire_jobs(self, now):
+        # Called with the lock held. Finished jobs can be polled for job_retention_seconds, and at most max_finished_jobs of them are kept
+        finished_jobs = sorted((job for job in self.jobs.values() if job["finished_at"] is not None), key=lambda job: job["finished_at"])
+        expired_count = max(0, len(finished_jobs) - self.max_finished_jobs)
+        for index, job in enumerate(finished_jobs):
+            if index < expired_count or job["finished_at"] < now - self.job_retention_seconds:
+                del self.jobs[job["job_id"]]
+
+    def submit(self, job_type, params):
+        self.validate(job_type, params)
+        locked_table, read_table = self.get_locked_tables(job_type, params)
+        with self._lock:
+            self.expire_jobs(time.time())
+            self.check_conflicts(locked_table, read_table)
+            if sum(1 for job in self.jobs.values() if job["status"] == QUEUED) >= self.max_queued_jobs:
+                raise QueueFullException("%s jobs are already queued" % self.max_queued_jobs)
+            job = {"job_id": str(uuid.uuid4()), "type": job_type, "params": params, "table": locked_table, "source_table": read_table, "status": QUEUED, "result": None, "error": None,
+                   "submitted_at": time.time(), "started_at": None, "finished_at": None}
+            self.jobs[job["job_id"]] = job
+            if locked_table is not None:
+                self._locked_tables[locked_table] = job["job_id"]
+            if read_table is not None:
+                self._read_tables.setdefault(read_table, set()).add(job["job_id"])
+        logging.info("Job %s (%s) queued: %s", job["job_id"], job_type, params)
+        self._executor.submit(self.run_job, job)
+        return dict(job)
+
+    def run_job(self, job):
+        with self._lock:
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+        try:
+            result = self.execute(job["type"], job["params"])
+            status = SUCCEEDED
+            error = None
+        except Exception as err:
+            logging.exception("Job %s failed", job["job_id"])
+            result = None
+            status = FAILED
+            error = str(err)
+        with self._lock:
+            job.update(status=status, result=result, error=error, finished_at=time.time())
+            if job["table"] is not None:
+                self._locked_tables.pop(job["table"], None)
+            if job["source_table"] is not None:
+                readers = self._read_tables.get(job["source_table"], set())
+                readers.discard(job["job_id"])
+                if not readers:
+                    self._read_tables.pop(job["source_table"], None)
+            self.expire_jobs(job["finished_at"])
+        logging.info("Job %s %s in %.1f seconds", job["job_id"], status, job["finished_at"] - job["started_at"])
+
+    def execute(self, job_type, params):
+        aws_profile = self.aws_profile
+        if job_type == RESTORE:
+            status = restore_dynamodb.recover_lro_store(params["source_client"], params["target_client"], params["restore_datetime"], self.env, aws_profile,
+                                                        scan_segments=self.scan_segments, scan_workers=self.scan_workers, checkpoint_dir=self.checkpoint_dir)
+            if status != 0:
+                raise Exception("Restore of %s to %s failed, see the service log" % (params["source_client"], params["target_client"]))
+            return {"status": status}
+        if job_type == ENABLE_PITR:
+            restore_dynamodb.enable_pitr(params["table_name"], aws_profile)
+            return {"table_name": params["table_name"]}
+        backup_arn = restore_dynamodb.on_demand_backup(params["table_name"], params["backup_name"], aws_profile)
+        restore_dynamodb.wait_for_backup_to_be_available(params["backup_name"], backup_arn, aws_profile)
+        return {"backup_arn": backup_arn}
+
+    def get_job(self, job_id):
+        with self._lock:
+            self.expire_jobs(time.time())
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list_jobs(self):
+        with self._lock:
+            self.expire_jobs(time.time())
+            return [dict(job) for job in sorted(self.jobs.values(), key=lambda job: job["submitted_at"])]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+class RestoreRequestHandler(BaseHTTPRequestHandler):
+    """POST /jobs submits a job, GET /jobs and GET /jobs/<id> return their status, GET /metrics the run metrics."""
+
+    def send_json(self, status_code, body):
+        payload = json.dumps(body, indent=2, default=str).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "metadata_cache": metadata_cache.get_stats()})
+        elif self.path == "/metrics":
+            payload = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        elif self.path == "/jobs":
+            self.send_json(200, service.list_jobs())
+        elif self.path.startswith("/jobs/"):
+            job = service.get_job(self.path[len("/jobs/"):])
+            if job is None:
+                self.send_json(404, {"error": "Unknown job"})
+            else:
+                self.send_json(200, job)
+        else:
+            self.send_json(404, {"error": "Unknown path %s" % self.path})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self.send_json(404, {"error": "Unknown path %s" % self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Request body must be a JSON object")
+            job = self.server.service.submit(request.get("type"), request.get("params", {}))
+        except ValueError as err:
+            self.send_json(400, {"error": str(err)})
+        except JobConflictException as err:
+            self.send_json(409, {"error": str(err)})
+        except QueueFullException as err:
+            self.send_json(503, {"error": str(err)})
+        else:
+            self.send_json(202, job)
+
+    def log_message(self, format, *args):
+        logging.info("%s %s", self.address_string(), format % args)
+
+def serve(service, host="127.0.0.1", port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), RestoreRequestHandler)
+    server.service = service
+    logging.info("Restore service listening on %s:%s", host, server.server_address[1])
+    return server
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    service = RestoreService(args.aws_profile, args.env, args.max_workers, args.max_queued_jobs, args.checkpoint_dir, args.scan_segments, args.scan_workers,
+                             args.job_retention_seconds, args.max_finished_jobs)
+    server = serve(service, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down, waiting for running jobs")
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import json
+import logging
+import restore_dynamodb
+import restore_service
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+POLL_TIMEOUT_SECONDS = 30
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test the restore service HTTP API")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='restore-service-test')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+class BlockingRestoreService(restore_service.RestoreService):
+    """Holds every job until release() is called, so tests can submit jobs while others are still running."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.released = threading.Event()
+
+    def execute(self, job_type, params):
+        self.released.wait(POLL_TIMEOUT_SECONDS)
+        return {"type": job_type}
+
+    def release(self):
+        self.released.set()
+
+def start_server(service):
+    server = restore_service.serve(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%s" % server.server_address[1]
+
+def stop_server(server, service):
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+def call(base_url, method, path, body=None):
+    data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(base_url + path, method=method, data=data)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+def expect_status(response, expected_status, description):
+    status, body = response
+    if status != expected_status:
+        raise Exception("%s: expected HTTP %s, got %s %s" % (description, expected_status, status, body))
+    return body
+
+def wait_for_job(base_url, job_id, statuses=(restore_service.SUCCEEDED, restore_service.FAILED)):
+    deadline = time.monotonic() + POLL_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        job = expect_status(call(base_url, "GET", "/jobs/" + job_id), 200, "Polling job %s" % job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.1)
+    raise Exception("Job %s did not reach %s in %s seconds" % (job_id, " or ".join(statuses), POLL_TIMEOUT_SECONDS))
+
+def restore_request(target_client, source_client="source"):
+    return {"type": "restore", "params": {"source_client": source_client, "target_client": target_client, "restore_datetime": "2024-01-01 00:00:00"}}
+
+def test_invalid_requests(args):
+    service = BlockingRestoreService()
+    server, base_url = start_server(service)
+    try:
+        logging.info("############-test_invalid_requests-#############")
+        expect_status(call(base_url, "POST", "/jobs", {"type": ["restore"]}), 400, "Job type that isn't a string")
+        expect_status(call(base_url, "POST", "/jobs", {"type": "restore", "params": ["source"]}), 400, "Params that aren't an object")
+        expect_status(call(base_url, "POST", "/jobs", [1]), 400, "Body that isn't an object")
+        expect_status(call(base_url, "POST", "/jobs", "{not json"), 400, "Body that isn't JSON")
+        expect_status(call(base_url, "POST", "/jobs", {"type": "drop_table"}), 400, "Unknown job type")
+        expect_status(call(base_url, "POST", "/jobs", {"type": "enable_pitr", "params": {}}), 400, "Missing params")
+        expect_status(call(base_url, "POST", "/jobs", {"type": "enable_pitr", "params": {"table_name": "table", "aws_profile": "production"}}), 400,
+                      "Params the service takes from its own arguments")
+        expect_status(call(base_url, "POST", "/jobs", restore_request("source")), 400, "Restore of a client onto itself")
+        expect_status(call(base_url, "GET", "/jobs/unknown-job"), 404, "Unknown job")
+        expect_status(call(base_url, "GET", "/unknown-path"), 404, "Unknown path")
+        if service.list_jobs():
+            raise Exception("Invalid requests were queued: %s" % service.list_jobs())
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        service.release()
+        stop_server(server, service)
+
+def test_conflicts_and_queue_limit(args):
+    service = BlockingRestoreService(max_workers=1, max_queued_jobs=1)
+    server, base_url = start_server(service)
+    try:
+        logging.info("############-test_conflicts_and_queue_limit-#############")
+        running_job = expect_status(call(base_url, "POST", "/jobs", restore_request("client1")), 202, "First restore")
+        # Until the worker picks it up the first job still counts against the queue limit
+        wait_for_job(base_url, running_job["job_id"], [restore_service.RUNNING])
+        expect_status(call(base_url, "POST", "/jobs", restore_request("client1")), 409, "Second restore of the same target")
+        expect_status(call(base_url, "POST", "/jobs", {"type": "enable_pitr", "params": {"table_name": running_job["table"]}}), 409, "Enabling PITR on the restored table")
+        expect_status(call(base_url, "POST", "/jobs", restore_request("client4", "client1")), 409, "Restore from the table being restored")
+        expect_status(call(base_url, "POST", "/jobs", restore_request("source", "client5")), 409, "Restore into the table being restored from")
+        expect_status(call(base_url, "POST", "/jobs", {"type": "enable_pitr", "params": {"table_name": running_job["source_table"]}}), 409,
+                      "Enabling PITR on the table being restored from")
+        # Restores may read the same source at the same time
+        queued_job = expect_status(call(base_url, "POST", "/jobs", restore_request("client2")), 202, "Restore of another target")
+        expect_status(call(base_url, "POST", "/jobs", restore_request("client3")), 503, "Restore beyond the queue limit")
+        jobs = expect_status(call(base_url, "GET", "/jobs"), 200, "Listing jobs")
+        if [job["job_id"] for job in jobs] != [running_job["job_id"], queued_job["job_id"]]:
+            raise Exception("Expected the two accepted jobs listed, got %s" % jobs)
+        service.release()
+        for job in (running_job, queued_job):
+            if wait_for_job(base_url, job["job_id"])["status"] != restore_service.SUCCEEDED:
+                raise Exception("Job %s did not succeed" % job["job_id"])
+        # The table locks go with the finished jobs
+        later_job = expect_status(call(base_url, "POST", "/jobs", restore_request("client1")), 202, "Restore of a target whose earlier job finished")
+        wait_for_job(base_url, later_job["job_id"])
+        expect_status(call(base_url, "POST", "/jobs", {"type": "enable_pitr", "params": {"table_name": running_job["source_table"]}}), 202,
+                      "Enabling PITR on a source whose restores finished")
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        service.release()
+        stop_server(server, service)
+
+def test_finished_jobs_expire(args):
+    service = BlockingRestoreService(max_finished_jobs=1)
+    service.release()
+    server, base_url = start_server(service)
+    try:
+        logging.info("############-test_finished_jobs_expire-#############")
+        first_job = expect_status(call(base_url, "POST", "/jobs", restore_request("client1")), 202, "First restore")
+        wait_for_job(base_url, first_job["job_id"])
+        second_job = expect_status(call(base_url, "POST", "/jobs", restore_request("client2")), 202, "Second restore")
+        wait_for_job(base_url, second_job["job_id"])
+        expect_status(call(base_url, "GET", "/jobs/" + first_job["job_id"]), 404, "Job beyond --max-finished-jobs")
+        service.job_retention_seconds = 0
+        time.sleep(0.01)
+        if expect_status(call(base_url, "GET", "/jobs"), 200, "Listing jobs"):
+            raise Exception("Expected finished jobs past their retention to be dropped")
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        stop_server(server, service)
+
+def test_enable_pitr_job(args):
+    service = restore_service.RestoreService(aws_profile=args.aws_profile)
+    server, base_url = start_server(service)
+    try:
+        logging.info("############-test_enable_pitr_job-#############")
+        client = aws_clients.get_dynamodb_client(args.aws_profile)
+        restore_dynamodb.delete_table_if_exist(args.table_name, args.aws_profile)
+        client.create_table(TableName = args.table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+        client.get_waiter('table_exists').wait(TableName=args.table_name)
+        job = expect_status(call(base_url, "POST", "/jobs", {"type": "enable_pitr", "params": {"table_name": args.table_name}}), 202, "Enabling PITR")
+        job = wait_for_job(base_url, job["job_id"])
+        if job["status"] != restore_service.SUCCEEDED:
+            raise Exception("Enabling PITR failed: %s" % job)
+        pitr_status = client.describe_continuous_backups(TableName=args.table_name)['ContinuousBackupsDescription']['PointInTimeRecoveryDescription']['PointInTimeRecoveryStatus']
+        if pitr_status != "ENABLED":
+            raise Exception("Expected PITR enabled on %s, it is %s" % (args.table_name, pitr_status))
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        stop_server(server, service)
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_invalid_requests(args)
+    test_2_status = test_conflicts_and_queue_limit(args)
+    test_3_status = test_finished_jobs_expire(args)
+    test_4_status = test_enable_pitr_job(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_invalid_requests")
+    log_test_status_successful_if_0(test_2_status, "test_conflicts_and_queue_limit")
+    log_test_status_successful_if_0(test_3_status, "test_finished_jobs_expire")
+    log_test_status_successful_if_0(test_4_status, "test_enable_pitr_job")
+
+    if test_1_status == 0 and test_2_status == 0 and test_3_status == 0 and test_4_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
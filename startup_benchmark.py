@@ -0,0 +1,134 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ENTRY_POINTS = ["restore_cli", "restore_dynamodb", "restore_dynamodb_batch", "restore_planner", "verify_restore", "table_transfer", "backup_manager", "k8s_control",
+                "restore_service"]
+# Modules that must not be loaded before a command actually talks to AWS or Kubernetes
+HEAVY_MODULES = ["boto3", "botocore", "dateutil", "kubernetes", "asyncio"]
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE_PERCENT = 25
+# Timings this close to the baseline are noise whatever the percentage
+MIN_REGRESSION_SECONDS = 0.02
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import %s
+print(json.dumps({"seconds": time.perf_counter() - start, "heavy_modules": sorted(name for name in %r if name in sys.modules)}))
+"""
+
+FIRST_API_CALL_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import aws_clients, metadata_cache, restore_dynamodb
+from botocore.stub import Stubber
+client = aws_clients.get_dynamodb_client()
+with Stubber(client) as stubber:
+    stubber.add_response("describe_table", {"Table": {"TableName": "startup-benchmark", "TableStatus": "ACTIVE"}}, {"TableName": "startup-benchmark"})
+    metadata_cache.describe_table("startup-benchmark")
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Benchmark of the startup time of the CLI entry points, checked against a saved baseline")
+    parser.add_argument("--repeat", dest="repeat", action="store", type=int, default=DEFAULT_REPEAT, help="Runs per measurement, the fastest is reported")
+    parser.add_argument("--output", dest="output", action="store", default="startup_benchmark.json", help="File the JSON results are written to")
+    parser.add_argument("--baseline", dest="baseline", action="store", default=None, help="Results of an earlier run, timings slower than it by more than --tolerance-percent fail the run")
+    parser.add_argument("--tolerance-percent", dest="tolerance_percent", action="store", type=float, default=DEFAULT_TOLERANCE_PERCENT)
+    parser.add_argument("--save-baseline", dest="save_baseline", action="store_true", help="Also write the results to --baseline")
+    return parser
+
+def get_environment(config_dir):
+    # The first API call is answered by a botocore Stubber, the profile only has to exist for the session to start
+    config_path = os.path.join(config_dir, "config")
+    credentials_path = os.path.join(config_dir, "credentials")
+    with open(config_path, "w") as config_file:
+        config_file.write("[default]\nregion = us-east-1\n")
+    with open(credentials_path, "w") as credentials_file:
+        credentials_file.write("[default]\naws_access_key_id = startup-benchmark\naws_secret_access_key = startup-benchmark\n")
+    environment = dict(os.environ, AWS_CONFIG_FILE=config_path, AWS_SHARED_CREDENTIALS_FILE=credentials_path, PYTHONDONTWRITEBYTECODE="")
+    environment.pop("AWS_PROFILE", None)
+    return environment
+
+def run_python(arguments, environment):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable] + arguments, cwd=os.path.dirname(os.path.abspath(__file__)), env=environment, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise Exception("%s exited with %s: %s" % (" ".join(arguments), completed.returncode, completed.stderr.strip()[-2000:]))
+    return seconds, completed.stdout
+
+def measure(arguments, environment, repeat, reported=False):
+    # With reported=True the child prints its own timing as JSON, which leaves interpreter startup out.
+    # The fastest run is the one least disturbed by the rest of the machine, so it is what gets compared
+    runs = []
+    for _ in range(repeat):
+        seconds, stdout = run_python(arguments, environment)
+        runs.append(json.loads(stdout.strip().splitlines()[-1]) if reported else {"seconds": seconds})
+    result = {"seconds": round(min(run["seconds"] for run in runs), 4)}
+    if reported and "heavy_modules" in runs[0]:
+        result["heavy_modules"] = runs[0]["heavy_modules"]
+    return result
+
+def run_benchmark(repeat):
+    with tempfile.TemporaryDirectory() as config_dir:
+        environment = get_environment(config_dir)
+        results = {"python": sys.version.split()[0], "repeat": repeat, "interpreter": measure(["-c", "pass"], environment, repeat), "entry_points": {}}
+        for entry_point in ENTRY_POINTS:
+            results["entry_points"][entry_point] = {
+                "help": measure([entry_point + ".py", "--help"], environment, repeat),
+                "import": measure(["-c", IMPORT_SCRIPT % (entry_point, HEAVY_MODULES)], environment, repeat, reported=True)
+            }
+            logging.info("%s: --help in %.3f seconds, import in %.3f seconds", entry_point, results["entry_points"][entry_point]["help"]["seconds"],
+                         results["entry_points"][entry_point]["import"]["seconds"])
+        results["first_api_call"] = measure(["-c", FIRST_API_CALL_SCRIPT], environment, repeat, reported=True)
+        logging.info("First API call %.3f seconds after startup", results["first_api_call"]["seconds"])
+    return results
+
+def get_timings(results):
+    timings = {"first_api_call": results["first_api_call"]["seconds"]}
+    for entry_point, measurements in results["entry_points"].items():
+        for name, measurement in measurements.items():
+            timings["%s.%s" % (entry_point, name)] = measurement["seconds"]
+    return timings
+
+def find_regressions(results, baseline, tolerance_percent):
+    # Heavy imports are a regression whatever the machine, timings only against a baseline taken on the same one
+    regressions = ["%s imports %s" % (entry_point, ", ".join(measurements["import"]["heavy_modules"]))
+                   for entry_point, measurements in results["entry_points"].items() if measurements["import"]["heavy_modules"]]
+    if baseline is not None:
+        baseline_timings = get_timings(baseline)
+        for name, seconds in get_timings(results).items():
+            limit = baseline_timings.get(name)
+            if limit is not None and seconds > max(limit * (1 + tolerance_percent / 100), limit + MIN_REGRESSION_SECONDS):
+                regressions.append("%s took %.3f seconds, baseline %.3f" % (name, seconds, limit))
+    return regressions
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    results = run_benchmark(args.repeat)
+    baseline = None
+    if args.baseline and not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    results["regressions"] = find_regressions(results, baseline, args.tolerance_percent)
+    for regression in results["regressions"]:
+        logging.info("Regression: %s", regression)
+    print(json.dumps(results, indent=2))
+    outputs = [args.output] + ([args.baseline] if args.baseline and args.save_baseline else [])
+    for output in outputs:
+        with open(output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    return 1 if results["regressions"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
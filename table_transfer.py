@@ -0,0 +1,314 @@
+import argparse
+import base64
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import aws_clients
+import metrics
+import rate_limiter
+import restore_dynamodb
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_SEGMENTS = 8
+DEFAULT_WORKERS = 8
+DEFAULT_ITEMS_PER_SHARD = 500000
+PARQUET_ROW_GROUP_SIZE = 10000
+FORMATS = ["ndjson", "parquet"]
+COMPRESSIONS = ["zstd", "gzip", "none"]
+MANIFEST_FILE_NAME = "manifest.json"
+PROGRESS_INTERVAL_SECONDS = 10
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to export and import DynamoDB tables as local snapshot shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Stream a table into compressed NDJSON or Parquet shards")
+    export_parser.add_argument("--table-name", dest="table_name", action="store", required=True)
+    export_parser.add_argument("--output-dir", dest="output_dir", action="store", required=True)
+    export_parser.add_argument("--format", dest="file_format", action="store", choices=FORMATS, default="ndjson")
+    export_parser.add_argument("--compression", dest="compression", action="store", choices=COMPRESSIONS, default="gzip")
+    export_parser.add_argument("--segments", dest="segments", action="store", type=int, default=DEFAULT_SEGMENTS, help="Number of parallel scan segments, every segment writes its own shards")
+    export_parser.add_argument("--workers", dest="workers", action="store", type=int, default=DEFAULT_WORKERS)
+    export_parser.add_argument("--items-per-shard", dest="items_per_shard", action="store", type=int, default=DEFAULT_ITEMS_PER_SHARD)
+    export_parser.add_argument("--target-rcu-percent", dest="target_rcu_percent", action="store", type=float, default=rate_limiter.DEFAULT_TARGET_PERCENT, help="Share of the provisioned (or maximum on-demand) read capacity the export may use")
+    export_parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+
+    import_parser = subparsers.add_parser("import", help="Load NDJSON or Parquet snapshot shards into a table")
+    import_parser.add_argument("--table-name", dest="table_name", action="store", required=True)
+    import_parser.add_argument("--input-dir", dest="input_dir", action="store", required=True)
+    import_parser.add_argument("--workers", dest="workers", action="store", type=int, default=DEFAULT_WORKERS)
+    import_parser.add_argument("--wcu-budget", dest="wcu_budget", action="store", type=float, default=None, help="Write capacity units per second the import may use. Defaults to --target-wcu-percent of the provisioned (or maximum on-demand) capacity")
+    import_parser.add_argument("--target-wcu-percent", dest="target_wcu_percent", action="store", type=float, default=rate_limiter.DEFAULT_TARGET_PERCENT)
+    import_parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    return parser
+
+def encode_binary(value):
+    # Binary (B/BS) attribute values come back from boto3 as bytes
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+def serialize_item(item):
+    return json.dumps({"Item": item}, default=encode_binary, separators=(",", ":"))
+
+def get_shard_extension(file_format, compression):
+    extension = ".ndjson" if file_format == "ndjson" else ".parquet"
+    if file_format == "ndjson" and compression == "gzip":
+        extension += ".gz"
+    elif file_format == "ndjson" and compression == "zstd":
+        extension += ".zst"
+    return extension
+
+def open_text_shard(path, compression):
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("zstd compression requires the zstandard package, install it with: pip install zstandard")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, "wb")), encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("Parquet shards require the pyarrow package, install it with: pip install pyarrow")
+    return pyarrow
+
+class ShardWriter:
+    """Writes serialized items of one scan segment, starting a new shard every items_per_shard items."""
+
+    def __init__(self, output_dir, table_name, segment, file_format, compression, items_per_shard):
+        self.output_dir = output_dir
+        self.table_name = table_name
+        self.segment = segment
+        self.file_format = file_format
+        self.compression = compression
+        self.items_per_shard = items_per_shard
+        self.shards = []
+        self._file = None
+        self._parquet_writer = None
+        self._rows = []
+        self._shard_item_count = 0
+
+    def _open_shard(self):
+        shard_name = "%s-segment-%05d-part-%05d%s" % (self.table_name, self.segment, len(self.shards), get_shard_extension(self.file_format, self.compression))
+        path = os.path.join(self.output_dir, shard_name)
+        self.shards.append({"file": shard_name, "items": 0})
+        self._shard_item_count = 0
+        if self.file_format == "ndjson":
+            self._file = open_text_shard(path, self.compression)
+        else:
+            pyarrow = import_pyarrow()
+            schema = pyarrow.schema([("Item", pyarrow.string())])
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(path, schema, compression=self.compression if self.compression != "none" else None)
+
+    def _flush_rows(self):
+        if self._rows:
+            pyarrow = import_pyarrow()
+            self._parquet_writer.write_table(pyarrow.table({"Item": self._rows}))
+            self._rows = []
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._parquet_writer is not None:
+            self._flush_rows()
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self.shards:
+            self.shards[-1]["items"] = self._shard_item_count
+
+    def write(self, item):
+        if self._shard_item_count >= self.items_per_shard:
+            self._close_shard()
+        if self._file is None and self._parquet_writer is None:
+            self._open_shard()
+        if self.file_format == "ndjson":
+            self._file.write(serialize_item(item) + "\n")
+        else:
+            self._rows.append(serialize_item(item))
+            if len(self._rows) >= PARQUET_ROW_GROUP_SIZE:
+                self._flush_rows()
+        self._shard_item_count += 1
+
+    def close(self):
+        self._close_shard()
+        return self.shards
+
+def export_segment(client, table_name, output_dir, segment, total_segments, file_format, compression, items_per_shard):
+    # Only one scan page per worker is held in memory, items are written out as soon as they are read
+    writer = ShardWriter(output_dir, table_name, segment, file_format, compression, items_per_shard)
+    item_count = 0
+    try:
+        dynamopaginator = client.get_paginator('scan')
+        dynamoresponse = rate_limiter.limit_pages(dynamopaginator.paginate(
+            TableName = table_name,
+            Select='ALL_ATTRIBUTES',
+            ReturnConsumedCapacity='TOTAL',
+            Segment=segment,
+            TotalSegments=total_segments
+        ), table_name)
+        for page in dynamoresponse:
+            metrics.record_response(table_name, page, metrics.READ_CAPACITY_UNITS)
+            for item in page['Items']:
+                writer.write(item)
+                item_count += 1
+    finally:
+        shards = writer.close()
+    logging.info("Segment %s/%s of %s: exported %s records into %s shards", segment, total_segments, table_name, item_count, len(shards))
+    return {"segment": segment, "items": item_count, "shards": shards}
+
+def export_table(table_name, output_dir, aws_profile='default', file_format="ndjson", compression="gzip", total_segments=DEFAULT_SEGMENTS, max_workers=DEFAULT_WORKERS,
+                 items_per_shard=DEFAULT_ITEMS_PER_SHARD, target_rcu_percent=rate_limiter.DEFAULT_TARGET_PERCENT):
+    os.makedirs(output_dir, exist_ok=True)
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    rate_limiter.configure(table_name, aws_profile, target_rcu_percent)
+    logging.info("Exporting table %s to %s as %s (%s) with %s segments", table_name, output_dir, file_format, compression, total_segments)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(export_segment, client, table_name, output_dir, segment, total_segments, file_format, compression, items_per_shard)
+                   for segment in range(total_segments)]
+        segment_stats = [future.result() for future in futures]
+    duration_seconds = time.perf_counter() - start
+    item_count = sum(stats["items"] for stats in segment_stats)
+    manifest = {
+        "table_name": table_name,
+        "format": file_format,
+        "compression": compression,
+        "items": item_count,
+        "duration_seconds": round(duration_seconds, 3),
+        "shards": [shard for stats in segment_stats for shard in stats["shards"]]
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE_NAME), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    logging.info("Exported %s records of %s in %.1f seconds (%.0f records/s)", item_count, table_name, duration_seconds, item_count / max(duration_seconds, 0.001))
+    return manifest
+
+def decode_binary(attribute_value):
+    if "B" in attribute_value:
+        return {"B": base64.b64decode(attribute_value["B"])}
+    if "BS" in attribute_value:
+        return {"BS": [base64.b64decode(value) for value in attribute_value["BS"]]}
+    if "M" in attribute_value:
+        return {"M": {name: decode_binary(value) for name, value in attribute_value["M"].items()}}
+    if "L" in attribute_value:
+        return {"L": [decode_binary(value) for value in attribute_value["L"]]}
+    return attribute_value
+
+def deserialize_item(line):
+    item = json.loads(line)["Item"]
+    return {name: decode_binary(value) for name, value in item.items()}
+
+def list_shards(input_dir):
+    manifest_path = os.path.join(input_dir, MANIFEST_FILE_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            return [os.path.join(input_dir, shard["file"]) for shard in json.load(manifest_file)["shards"]]
+    return sorted(os.path.join(input_dir, file_name) for file_name in os.listdir(input_dir)
+                  if file_name.endswith((".ndjson", ".ndjson.gz", ".ndjson.zst", ".parquet")))
+
+def open_text_shard_for_reading(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("zstd compression requires the zstandard package, install it with: pip install zstandard")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+def read_shard_lines(path):
+    # Yields serialized items one at a time so a shard is never loaded into memory as a whole
+    if path.endswith(".parquet"):
+        pyarrow = import_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=PARQUET_ROW_GROUP_SIZE, columns=["Item"]):
+            for line in batch.column(0).to_pylist():
+                yield line
+    else:
+        with open_text_shard_for_reading(path) as shard_file:
+            for line in shard_file:
+                if line.strip():
+                    yield line
+
+def import_batch(client, table_name, lines):
+    written_count = restore_dynamodb.batch_write_records(client, table_name, [{'PutRequest': {'Item': deserialize_item(line)}} for line in lines])
+    metrics.increment(metrics.ITEMS_WRITTEN, table_name, written_count)
+    return written_count
+
+def import_table(table_name, input_dir, aws_profile='default', max_workers=DEFAULT_WORKERS, wcu_budget=None, target_wcu_percent=rate_limiter.DEFAULT_TARGET_PERCENT):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    # batch_write_records takes its write capacity from this table's shared limiter
+    rate_limiter.configure(table_name, aws_profile, target_wcu_percent, write_units_per_second=wcu_budget)
+    shards = list_shards(input_dir)
+    logging.info("Importing %s shards from %s into table %s", len(shards), input_dir, table_name)
+
+    progress = {"items": 0}
+    progress_lock = threading.Lock()
+    # Bounds the batches read ahead of the workers so memory doesn't grow with the snapshot size
+    pending_batches = threading.BoundedSemaphore(max_workers * 2)
+    start = time.perf_counter()
+    last_progress_log = start
+
+    def on_batch_done(future):
+        pending_batches.release()
+        if future.exception() is None:
+            with progress_lock:
+                progress["items"] += future.result()
+
+    def submit(batch):
+        pending_batches.acquire()
+        # Futures are only kept to surface errors, completed ones are checked and dropped right away
+        for done_future in [future for future in futures if future.done()]:
+            done_future.result()
+            futures.remove(done_future)
+        future = executor.submit(import_batch, client, table_name, batch)
+        future.add_done_callback(on_batch_done)
+        futures.append(future)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        batch = []
+        for shard in shards:
+            for line in read_shard_lines(shard):
+                batch.append(line)
+                if len(batch) == restore_dynamodb.BATCH_WRITE_MAX_ITEMS:
+                    submit(batch)
+                    batch = []
+                if time.perf_counter() - last_progress_log >= PROGRESS_INTERVAL_SECONDS:
+                    last_progress_log = time.perf_counter()
+                    logging.info("Imported %s records into %s (%.0f records/s)", progress["items"], table_name, progress["items"] / (last_progress_log - start))
+        if batch:
+            submit(batch)
+        for future in futures:
+            future.result()
+
+    duration_seconds = time.perf_counter() - start
+    logging.info("Imported %s records into %s in %.1f seconds (%.0f records/s)", progress["items"], table_name, duration_seconds, progress["items"] / max(duration_seconds, 0.001))
+    return {"table_name": table_name, "items": progress["items"], "duration_seconds": round(duration_seconds, 3),
+            "items_per_second": round(progress["items"] / max(duration_seconds, 0.001), 1)}
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    if args.command == "export":
+        export_table(args.table_name, args.output_dir, args.aws_profile, args.file_format, args.compression, args.segments, args.workers, args.items_per_shard, args.target_rcu_percent)
+    elif args.command == "import":
+        import_table(args.table_name, args.input_dir, args.aws_profile, args.workers, args.wcu_budget, args.target_wcu_percent)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
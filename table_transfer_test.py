@@ -0,0 +1,108 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import importlib.util
+import json
+import logging
+import os
+import restore_dynamodb
+import shutil
+import sys
+import table_transfer
+import tempfile
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Format, compression and the package it needs besides the standard library
+TRANSFER_FORMATS = [("ndjson", "gzip", None), ("ndjson", "none", None), ("ndjson", "zstd", "zstandard"), ("parquet", "zstd", "pyarrow"), ("parquet", "none", "pyarrow")]
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test exporting a table to snapshot shards and importing it again")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='table-transfer-test')
+    parser.add_argument("--item-count", dest="item_count", action="store", type=int, default=230)
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def create_table(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_dynamodb.delete_table_if_exist(table_name, aws_profile)
+    client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+def make_item(index):
+    # Every attribute type, binary ones nested too since they are base64 encoded in the shards
+    return {
+        'name': {'S': "record-%05d" % index},
+        'lastUpdatedTime': {'S': "2024-01-01T12:00:00.%06dZ" % index},
+        'count': {'N': str(index)},
+        'payload': {'B': bytes([index % 256, 0, 255])},
+        'checksums': {'BS': [b"a%d" % index, b"b%d" % index]},
+        'tags': {'SS': ["tag-%d" % (index % 3), "all"]},
+        'sizes': {'NS': ["1", str(index + 2)]},
+        'deleted': {'BOOL': index % 2 == 0},
+        'parent': {'NULL': True},
+        'details': {'M': {'owner': {'S': "tenant-%d" % (index % 5)}, 'raw': {'B': b"\x00\x01"}, 'history': {'L': [{'N': "1"}, {'B': b"\x02"}]}}}
+    }
+
+def get_items(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    return {item['name']['S']: item for page in client.get_paginator('scan').paginate(TableName=table_name) for item in page['Items']}
+
+def test_export_import_round_trip(args):
+    snapshot_dir = tempfile.mkdtemp()
+    try:
+        logging.info("############-test_export_import_round_trip-#############")
+        source_table = args.table_name
+        target_table = args.table_name + "-imported"
+        create_table(source_table, args.aws_profile)
+        client = aws_clients.get_dynamodb_client(args.aws_profile)
+        for index in range(args.item_count):
+            client.put_item(TableName=source_table, Item=make_item(index))
+        source_items = get_items(source_table, args.aws_profile)
+        for file_format, compression, required_package in TRANSFER_FORMATS:
+            if required_package is not None and importlib.util.find_spec(required_package) is None:
+                logging.info("Skipping %s (%s), %s isn't installed", file_format, compression, required_package)
+                continue
+            output_dir = os.path.join(snapshot_dir, "%s-%s" % (file_format, compression))
+            manifest = table_transfer.export_table(source_table, output_dir, args.aws_profile, file_format, compression, total_segments=3, max_workers=3, items_per_shard=50)
+            with open(os.path.join(output_dir, table_transfer.MANIFEST_FILE_NAME)) as manifest_file:
+                if json.load(manifest_file) != manifest:
+                    raise Exception("manifest.json doesn't match the manifest returned by the export")
+            if manifest["items"] != args.item_count or sum(shard["items"] for shard in manifest["shards"]) != args.item_count or len(manifest["shards"]) < 5:
+                raise Exception("Expected %s items over at least 5 shards in the %s (%s) manifest, got %s" % (args.item_count, file_format, compression, manifest))
+            create_table(target_table, args.aws_profile)
+            stats = table_transfer.import_table(target_table, output_dir, args.aws_profile, max_workers=3)
+            if stats["items"] != args.item_count:
+                raise Exception("Expected %s items imported from %s (%s), got %s" % (args.item_count, file_format, compression, stats))
+            if get_items(target_table, args.aws_profile) != source_items:
+                raise Exception("Items imported from %s (%s) differ from the exported table" % (file_format, compression))
+            logging.info("%s (%s) round trip matches", file_format, compression)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_export_import_round_trip(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_export_import_round_trip")
+
+    if test_1_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
@@ -1,7 +1,7 @@
 import os
 import logging
-from dateutil import parser
-from dateutil.tz import UTC
+import k8s_control
+from datetime import datetime, timezone
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,35 +9,31 @@ logger.setLevel(logging.INFO)
 def scale_down_pod(dest_client, config, deployment):
 
     logging.info("Scaling down %s pod" %(deployment))
-    cmd = 'kubectl scale --replicas=0 deployment/%s -n %s --kubeconfig %s' % (deployment, dest_client, config)
-    execute_kubectl(cmd)
+    apps_api, _ = k8s_control.get_apis(config)
+    k8s_control.scale_deployment(apps_api, dest_client, deployment, 0)
 
 def scale_up_pod(dest_client, config, deployment):
 
     logging.info("Scaling up %s pod" %(deployment))
-    cmd = 'kubectl scale --replicas=1 deployment/%s -n %s --kubeconfig %s' % (deployment, dest_client, config)
-    execute_kubectl(cmd)
+    apps_api, _ = k8s_control.get_apis(config)
+    k8s_control.scale_deployment(apps_api, dest_client, deployment, 1)
 
 def get_orchestrator_deployments(dest_client, config):
-    cmd = 'kubectl get deployments --no-headers -o custom-columns=":metadata.name" -n %s --kubeconfig %s | grep "orchestrator-deployment"' % (dest_client, config)
-    orchestrator_deployments = execute_kubectl(cmd)
-    return orchestrator_deployments.split('\n')
+    apps_api, _ = k8s_control.get_apis(config)
+    return k8s_control.select_deployments(k8s_control.list_deployments(apps_api, dest_client), [k8s_control.ORCHESTRATOR_DEPLOYMENT])
 
 
 def get_pod(dest_client, config, deployment):
-    cmd = 'kubectl get pods --no-headers -o custom-columns=":metadata.name" -n %s --kubeconfig %s | grep %s' % (dest_client, config, deployment)
-    pod = execute_kubectl(cmd)
-    return pod.replace('\n','')
+    _, core_api = k8s_control.get_apis(config)
+    return ''.join(k8s_control.list_pods(core_api, dest_client, deployment))
 
 def get_offline_query_deployments(dest_client, config):
-    cmd = 'kubectl get deployments --no-headers -o custom-columns=":metadata.name" -n %s --kubeconfig %s | grep "offline-query-data-sync-deployment"' % (dest_client, config)
-    offline_query_deployments = execute_kubectl(cmd)
-    return offline_query_deployments.split('\n')
+    apps_api, _ = k8s_control.get_apis(config)
+    return k8s_control.select_deployments(k8s_control.list_deployments(apps_api, dest_client), [k8s_control.OFFLINE_QUERY_DEPLOYMENT])
 
 def delete_pvc(pvc, dest_client, config):
-    cmd = 'kubectl delete pvc %s -n %s --kubeconfig %s' % (pvc, dest_client, config)
-    print(cmd)
-    execute_kubectl(cmd)
+    _, core_api = k8s_control.get_apis(config)
+    k8s_control.delete_pvc(core_api, dest_client, pvc)
 
 def execute_kubectl(command, exception_enabled=True):
     stdout = os.popen(command)
@@ -48,9 +44,9 @@ def restart_pods(dest_client, orchestrator_offline_deployments, config):
     logging.info("Restarting pods")
     logging.info(orchestrator_offline_deployments)
     if len(orchestrator_offline_deployments) != 0:
-        for deployment in orchestrator_offline_deployments:
-            scale_down_pod(dest_client, config, deployment)
-            scale_up_pod(dest_client, config, deployment)
+        # All deployments go down together and come back together, returning once they are ready again
+        apps_api, core_api = k8s_control.get_apis(config)
+        return k8s_control.restart_deployments(apps_api, core_api, dest_client, orchestrator_offline_deployments)
 
 def get_dynamodb_tables(client, env):
 
@@ -66,4 +62,8 @@ def get_lro_store_table_name(client, env):
     return "adapter-lro-store-" + client + "-" + env
 
 def convert_datetime_to_utc_tz(date_time_object):
-    return parser.parse(date_time_object).astimezone(UTC)
\ No newline at end of file
+    if isinstance(date_time_object, datetime):
+        return date_time_object.astimezone(timezone.utc)
+    # dateutil is only needed for strings, which most callers never pass
+    from dateutil import parser
+    return parser.parse(date_time_object).astimezone(timezone.utc)
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import aws_clients
+import metadata_cache
+import metrics
+import rate_limiter
+import restore_dynamodb
+import table_transfer
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_BUCKETS = 4096
+DEFAULT_SEGMENTS = 8
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_REPORTED_KEYS = 1000
+TREE_FANOUT = 16
+SOURCE = "source"
+TARGET = "target"
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to verify a restored DynamoDB table against its source as of the restore time")
+    parser.add_argument("--source-table", dest="source_table", action="store", required=True)
+    parser.add_argument("--target-table", dest="target_table", action="store", required=True)
+    parser.add_argument("--restore-datetime", dest="restore_datetime", action="store", help="Format: yyyy-mm-dd hh:mm:ss in UTC, source records updated after it are not compared", required=True)
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--segments", dest="segments", action="store", type=int, default=DEFAULT_SEGMENTS, help="Number of parallel scan segments per table")
+    parser.add_argument("--workers", dest="workers", action="store", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--buckets", dest="buckets", action="store", type=int, default=DEFAULT_BUCKETS, help="Number of key hash ranges digested separately, more buckets make the second pass over mismatches cheaper")
+    parser.add_argument("--max-reported-keys", dest="max_reported_keys", action="store", type=int, default=DEFAULT_MAX_REPORTED_KEYS)
+    parser.add_argument("--target-rcu-percent", dest="target_rcu_percent", action="store", type=float, default=rate_limiter.DEFAULT_TARGET_PERCENT)
+    parser.add_argument("--report-output", dest="report_output", action="store", default="verify_report.json")
+    return parser
+
+def canonicalize(attribute_value):
+    # Sets come back in no particular order, so they are sorted before hashing
+    (attribute_type, value), = attribute_value.items()
+    if attribute_type in ("SS", "NS"):
+        return {attribute_type: sorted(value)}
+    if attribute_type == "BS":
+        return {attribute_type: sorted(bytes(element) for element in value)}
+    if attribute_type == "M":
+        return {attribute_type: {name: canonicalize(element) for name, element in value.items()}}
+    if attribute_type == "L":
+        return {attribute_type: [canonicalize(element) for element in value]}
+    return attribute_value
+
+def get_key(item, key_attributes):
+    return json.dumps({name: item[name] for name in key_attributes}, default=table_transfer.encode_binary, sort_keys=True, separators=(",", ":"))
+
+def get_item_digest(item):
+    canonical_item = {name: canonicalize(value) for name, value in item.items()}
+    return hashlib.sha256(json.dumps(canonical_item, default=table_transfer.encode_binary, sort_keys=True, separators=(",", ":")).encode("utf-8")).digest()
+
+def get_bucket(key, bucket_count):
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big") % bucket_count
+
+def is_after_cutoff(item, recovery_point_utc):
+    last_updated_time = item.get("lastUpdatedTime", {}).get("S")
+    return last_updated_time is not None and restore_dynamodb.is_updated_after_recovery_point(last_updated_time, recovery_point_utc)
+
+def scan_pages(client, table_name, segment, total_segments):
+    return rate_limiter.limit_pages(client.get_paginator('scan').paginate(
+        TableName = table_name,
+        Select='ALL_ATTRIBUTES',
+        ReturnConsumedCapacity='TOTAL',
+        ConsistentRead=True,
+        Segment=segment,
+        TotalSegments=total_segments
+    ), table_name)
+
+def digest_segment(client, table_name, side, key_attributes, recovery_point_utc, segment, total_segments, bucket_count, max_reported_keys):
+    # Items are folded into their bucket with XOR, which doesn't depend on the order the scan returns them in
+    buckets = [0] * bucket_count
+    counts = {"items": 0, "skipped": 0}
+    skipped_buckets = set()
+    skipped_keys = []
+    for page in scan_pages(client, table_name, segment, total_segments):
+        metrics.record_response(table_name, page, metrics.READ_CAPACITY_UNITS)
+        for item in page['Items']:
+            key = get_key(item, key_attributes)
+            bucket = get_bucket(key, bucket_count)
+            if is_after_cutoff(item, recovery_point_utc):
+                # The source only has the newer version of these records, the bucket is compared item by item instead.
+                # The target must not have any, they are the records truncation should have deleted
+                counts["skipped"] += 1
+                skipped_buckets.add(bucket)
+                if side == TARGET and len(skipped_keys) < max_reported_keys:
+                    skipped_keys.append(key)
+                continue
+            counts["items"] += 1
+            buckets[bucket] ^= int.from_bytes(hashlib.sha256(key.encode("utf-8") + get_item_digest(item)).digest(), "big")
+    return buckets, counts, skipped_buckets, skipped_keys
+
+def digest_table(client, table_name, side, key_attributes, recovery_point_utc, total_segments, max_workers, bucket_count, max_reported_keys=DEFAULT_MAX_REPORTED_KEYS):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(digest_segment, client, table_name, side, key_attributes, recovery_point_utc, segment, total_segments, bucket_count, max_reported_keys)
+                   for segment in range(total_segments)]
+        results = [future.result() for future in futures]
+    buckets = [0] * bucket_count
+    counts = {"items": 0, "skipped": 0}
+    skipped_buckets = set()
+    skipped_keys = []
+    for segment_buckets, segment_counts, segment_skipped_buckets, segment_skipped_keys in results:
+        buckets = [bucket ^ segment_bucket for bucket, segment_bucket in zip(buckets, segment_buckets)]
+        counts["items"] += segment_counts["items"]
+        counts["skipped"] += segment_counts["skipped"]
+        skipped_buckets.update(segment_skipped_buckets)
+        skipped_keys += segment_skipped_keys
+    logging.info("Digested %s records of %s (%s skipped as updated after the restore time)", counts["items"], table_name, counts["skipped"])
+    return buckets, counts, skipped_buckets, sorted(skipped_keys)[:max_reported_keys]
+
+def build_tree(leaves):
+    # Every level hashes TREE_FANOUT children of the level below, the last level holds the root
+    levels = [[leaf.to_bytes(32, "big") for leaf in leaves]]
+    while len(levels[-1]) > 1:
+        children = levels[-1]
+        levels.append([hashlib.sha256(b"".join(children[start:start + TREE_FANOUT])).digest() for start in range(0, len(children), TREE_FANOUT)])
+    return levels
+
+def find_mismatched_buckets(source_tree, target_tree):
+    # Descends only into subtrees whose digests differ, so matching tables are settled by the root alone
+    mismatched = [0]
+    for level in range(len(source_tree) - 1, 0, -1):
+        children = []
+        for node in mismatched:
+            for child in range(node * TREE_FANOUT, min((node + 1) * TREE_FANOUT, len(source_tree[level - 1]))):
+                if source_tree[level - 1][child] != target_tree[level - 1][child]:
+                    children.append(child)
+        mismatched = children
+    return set(node for node in mismatched if source_tree[0][node] != target_tree[0][node])
+
+def collect_segment(client, table_name, side, key_attributes, recovery_point_utc, segment, total_segments, bucket_count, buckets):
+    items = {}
+    skipped_keys = set()
+    for page in scan_pages(client, table_name, segment, total_segments):
+        metrics.record_response(table_name, page, metrics.READ_CAPACITY_UNITS)
+        for item in page['Items']:
+            key = get_key(item, key_attributes)
+            if get_bucket(key, bucket_count) not in buckets:
+                continue
+            if is_after_cutoff(item, recovery_point_utc):
+                skipped_keys.add(key)
+            else:
+                items[key] = get_item_digest(item)
+    return items, skipped_keys
+
+def collect_buckets(client, table_name, side, key_attributes, recovery_point_utc, total_segments, max_workers, bucket_count, buckets):
+    # Only the records of mismatched buckets are kept, so memory is bounded by the size of the difference
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(collect_segment, client, table_name, side, key_attributes, recovery_point_utc, segment, total_segments, bucket_count, buckets)
+                   for segment in range(total_segments)]
+        items = {}
+        skipped_keys = set()
+        for future in futures:
+            segment_items, segment_skipped_keys = future.result()
+            items.update(segment_items)
+            skipped_keys.update(segment_skipped_keys)
+    return items, skipped_keys
+
+def diff_items(source_items, target_items, source_skipped_keys):
+    # Target records of keys the source updated after the restore time hold the older version, which the source no longer has.
+    # Target records updated after the restore time are never in target_items, they are reported on their own
+    missing = sorted(key for key in source_items if key not in target_items)
+    extra = sorted(key for key in target_items if key not in source_items and key not in source_skipped_keys)
+    differing = sorted(key for key in source_items if key in target_items and source_items[key] != target_items[key])
+    return missing, extra, differing
+
+def verify_restore(source_table, target_table, restore_datetime, aws_profile='default', total_segments=DEFAULT_SEGMENTS, max_workers=DEFAULT_WORKERS, bucket_count=DEFAULT_BUCKETS,
+                   max_reported_keys=DEFAULT_MAX_REPORTED_KEYS, target_rcu_percent=rate_limiter.DEFAULT_TARGET_PERCENT):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    recovery_point_utc = datetime.strptime(restore_datetime, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    key_attributes = [key["AttributeName"] for key in metadata_cache.describe_table(source_table, aws_profile)["KeySchema"]]
+    for table_name in (source_table, target_table):
+        rate_limiter.configure(table_name, aws_profile, target_rcu_percent)
+    start = time.perf_counter()
+
+    with metrics.span("verify_digest", target_table):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source_future = executor.submit(digest_table, client, source_table, SOURCE, key_attributes, recovery_point_utc, total_segments, max_workers, bucket_count,
+                                            max_reported_keys)
+            target_future = executor.submit(digest_table, client, target_table, TARGET, key_attributes, recovery_point_utc, total_segments, max_workers, bucket_count,
+                                            max_reported_keys)
+            source_buckets, source_counts, source_skipped_buckets, _ = source_future.result()
+            target_buckets, target_counts, target_skipped_buckets, updated_after_restore_time = target_future.result()
+    skipped_buckets = source_skipped_buckets | target_skipped_buckets
+    mismatched_buckets = find_mismatched_buckets(build_tree(source_buckets), build_tree(target_buckets))
+    logging.info("%s of %s buckets differ, %s more hold records updated after the restore time", len(mismatched_buckets), bucket_count,
+                 len(skipped_buckets - mismatched_buckets))
+
+    missing, extra, differing = [], [], []
+    buckets_to_compare = mismatched_buckets | skipped_buckets
+    if buckets_to_compare:
+        with metrics.span("verify_compare", target_table):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                source_future = executor.submit(collect_buckets, client, source_table, SOURCE, key_attributes, recovery_point_utc, total_segments, max_workers, bucket_count,
+                                                buckets_to_compare)
+                target_future = executor.submit(collect_buckets, client, target_table, TARGET, key_attributes, recovery_point_utc, total_segments, max_workers, bucket_count,
+                                                buckets_to_compare)
+                source_items, source_skipped_keys = source_future.result()
+                target_items, _ = target_future.result()
+        missing, extra, differing = diff_items(source_items, target_items, source_skipped_keys)
+
+    report = {
+        "source_table": source_table,
+        "target_table": target_table,
+        "restore_datetime": restore_datetime,
+        "match": not (missing or extra or differing or target_counts["skipped"]),
+        "source_items": source_counts["items"],
+        "source_items_updated_after_restore_time": source_counts["skipped"],
+        "target_items": target_counts["items"],
+        "target_items_updated_after_restore_time": target_counts["skipped"],
+        "buckets": bucket_count,
+        "mismatched_buckets": len(mismatched_buckets),
+        "missing_count": len(missing),
+        "extra_count": len(extra),
+        "differing_count": len(differing),
+        "missing": missing[:max_reported_keys],
+        "extra": extra[:max_reported_keys],
+        "differing": differing[:max_reported_keys],
+        "updated_after_restore_time": updated_after_restore_time,
+        "duration_seconds": round(time.perf_counter() - start, 3)
+    }
+    logging.info("Verification of %s against %s: %s missing, %s extra, %s differing records, %s records updated after the restore time", target_table, source_table,
+                 len(missing), len(extra), len(differing), target_counts["skipped"])
+    return report
+
+def write_report(report, report_output):
+    with open(report_output, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    logging.info("Verification report written to %s", report_output)
+
+def main(argv=None):
+    args = get_args_parser().parse_args(argv)
+    report = verify_restore(args.source_table, args.target_table, args.restore_datetime, args.aws_profile, args.segments, args.workers, args.buckets,
+                            args.max_reported_keys, args.target_rcu_percent)
+    write_report(report, args.report_output)
+    return 0 if report["match"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
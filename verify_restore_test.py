@@ -0,0 +1,109 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import logging
+import restore_dynamodb
+import sys
+import verify_restore
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RESTORE_DATETIME = "2024-01-01 12:00:00"
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test verifying a restored DynamoDB table against its source")
+    parser.add_argument("--source-table", dest="source_table", action="store", default='verify-restore-test-source')
+    parser.add_argument("--target-table", dest="target_table", action="store", default='verify-restore-test-target')
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def get_last_updated_time(seconds_from_restore_time):
+    restore_datetime_utc = datetime.strptime(RESTORE_DATETIME, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return (restore_datetime_utc + timedelta(seconds=seconds_from_restore_time)).strftime(restore_dynamodb.LAST_UPDATED_TIME_FORMAT)
+
+def make_record(name, seconds_from_restore_time, state="SUCCEEDED"):
+    return {'name': {'S': name}, 'lastUpdatedTime': {'S': get_last_updated_time(seconds_from_restore_time)}, 'state': {'S': state}}
+
+def create_table(table_name, records, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    restore_dynamodb.delete_table_if_exist(table_name, aws_profile)
+    client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+    client.get_waiter('table_exists').wait(TableName=table_name)
+    for record in records:
+        client.put_item(TableName=table_name, Item=record)
+
+def get_restored_records():
+    return [make_record("record%s" % index, -600 + index) for index in range(100)]
+
+def run_verification(args, source_records, target_records):
+    create_table(args.source_table, source_records, args.aws_profile)
+    create_table(args.target_table, target_records, args.aws_profile)
+    return verify_restore.verify_restore(args.source_table, args.target_table, RESTORE_DATETIME, args.aws_profile, total_segments=4, max_workers=4, bucket_count=64)
+
+def test_matching_tables(args):
+    try:
+        logging.info("############-test_matching_tables-#############")
+        # record0 was updated after the restore time, the target holds the version from before it
+        source_records = [make_record("record0", 60, "FAILED")] + get_restored_records()[1:] + [make_record("record-new", 120)]
+        report = run_verification(args, source_records, get_restored_records())
+        if not report["match"]:
+            raise Exception("Expected matching tables, got %s" % report)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_record_left_after_failed_truncation(args):
+    try:
+        logging.info("############-test_record_left_after_failed_truncation-#############")
+        source_records = get_restored_records() + [make_record("record-new", 120)]
+        report = run_verification(args, source_records, source_records)
+        if report["match"] or report["target_items_updated_after_restore_time"] != 1 or report["updated_after_restore_time"] != ['{"name":{"S":"record-new"}}']:
+            raise Exception("Expected record-new reported as updated after the restore time, got %s" % report)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_missing_and_differing_records(args):
+    try:
+        logging.info("############-test_missing_and_differing_records-#############")
+        target_records = get_restored_records()[1:]
+        target_records[0] = make_record("record1", -599, "FAILED")
+        report = run_verification(args, get_restored_records(), target_records)
+        if report["match"] or report["missing_count"] != 1 or report["differing_count"] != 1 or report["extra_count"] != 0:
+            raise Exception("Expected 1 missing and 1 differing record, got %s" % report)
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient())
+
+    test_1_status = test_matching_tables(args)
+    test_2_status = test_record_left_after_failed_truncation(args)
+    test_3_status = test_missing_and_differing_records(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_matching_tables")
+    log_test_status_successful_if_0(test_2_status, "test_record_left_after_failed_truncation")
+    log_test_status_successful_if_0(test_3_status, "test_missing_and_differing_records")
+
+    if test_1_status == 0 and test_2_status == 0 and test_3_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)
@@ -0,0 +1,160 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+import aws_clients
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TABLE = "table"
+BACKUP = "backup"
+PITR = "pitr"
+RESTORE_JOB = "restore_job"
+
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+TIMED_OUT = "TIMED_OUT"
+
+NOT_FOUND = "NOT_FOUND"
+
+BASE_DELAY_SECONDS = 1
+MAX_DELAY_SECONDS = 30
+MAX_CONCURRENT_CALLS = 16
+DEFAULT_DEADLINE_SECONDS = {TABLE: 24 * 60 * 60, BACKUP: 4 * 60 * 60, PITR: 30 * 60, RESTORE_JOB: 24 * 60 * 60}
+
+# States after which a resource can never reach the expected state, NOT_FOUND is one too unless it is the expected state
+FAILURE_STATES = {TABLE: {"INACCESSIBLE_ENCRYPTION_CREDENTIALS", "ARCHIVED"}, BACKUP: {"DELETED"}, PITR: set(), RESTORE_JOB: {"ABORTED", "FAILED"}}
+
+_loop = None
+_executor = None
+_loop_lock = threading.Lock()
+
+class WaitTarget(NamedTuple):
+    kind: str
+    name: str
+    expected_state: str
+    aws_profile: str = 'default'
+    deadline_seconds: Optional[float] = None
+
+class WaitResult(NamedTuple):
+    kind: str
+    name: str
+    status: str
+    state: Optional[str]
+    attempts: int
+    elapsed_seconds: float
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self):
+        return self.status == SUCCEEDED
+
+def table_active(table_name, aws_profile='default', deadline_seconds=None):
+    return WaitTarget(TABLE, table_name, "ACTIVE", aws_profile, deadline_seconds)
+
+def table_not_exists(table_name, aws_profile='default', deadline_seconds=None):
+    return WaitTarget(TABLE, table_name, NOT_FOUND, aws_profile, deadline_seconds)
+
+def backup_available(backup_arn, aws_profile='default', deadline_seconds=None):
+    return WaitTarget(BACKUP, backup_arn, "AVAILABLE", aws_profile, deadline_seconds)
+
+def pitr_enabled(table_name, aws_profile='default', deadline_seconds=None):
+    return WaitTarget(PITR, table_name, "ENABLED", aws_profile, deadline_seconds)
+
+def restore_job_completed(restore_job_id, aws_profile='default', deadline_seconds=None):
+    return WaitTarget(RESTORE_JOB, restore_job_id, "COMPLETED", aws_profile, deadline_seconds)
+
+def get_state(target):
+    if target.kind == RESTORE_JOB:
+        # AWS Backup restore jobs are tracked by the backup service, not by DynamoDB
+        return aws_clients.get_client('backup', target.aws_profile).describe_restore_job(RestoreJobId=target.name)["Status"]
+    dynamodb_client = aws_clients.get_dynamodb_client(target.aws_profile)
+    try:
+        if target.kind == TABLE:
+            return dynamodb_client.describe_table(TableName=target.name)["Table"]["TableStatus"]
+        if target.kind == BACKUP:
+            return dynamodb_client.describe_backup(BackupArn=target.name)["BackupDescription"]["BackupDetails"]["BackupStatus"]
+        if target.kind == PITR:
+            response = dynamodb_client.describe_continuous_backups(TableName=target.name)
+            return response["ContinuousBackupsDescription"]["PointInTimeRecoveryDescription"]["PointInTimeRecoveryStatus"]
+    except (dynamodb_client.exceptions.ResourceNotFoundException, dynamodb_client.exceptions.TableNotFoundException,
+            dynamodb_client.exceptions.BackupNotFoundException):
+        return NOT_FOUND
+    raise ValueError("Unknown wait target kind %s" % target.kind)
+
+def get_backoff_delay(attempt):
+    # Exponential backoff with equal jitter so many waiters started together don't poll in lockstep
+    delay = min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def import_asyncio():
+    # asyncio takes a large share of the import time, and commands that never wait don't need it
+    import asyncio
+    return asyncio
+
+def get_loop():
+    # One event loop thread for the whole process, waits submitted from any thread are polled there together
+    # and share one pool of threads for the describe calls
+    global _loop, _executor
+    with _loop_lock:
+        if _loop is None:
+            _loop = import_asyncio().new_event_loop()
+            _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS, thread_name_prefix="waiters")
+            threading.Thread(target=_loop.run_forever, name="waiters-loop", daemon=True).start()
+        return _loop
+
+def is_failure_state(target, state):
+    return state in FAILURE_STATES[target.kind] or (state == NOT_FOUND and target.expected_state != NOT_FOUND)
+
+async def wait_for(target, semaphore):
+    asyncio = import_asyncio()
+    loop = asyncio.get_running_loop()
+    deadline_seconds = target.deadline_seconds or DEFAULT_DEADLINE_SECONDS[target.kind]
+    start = time.monotonic()
+    attempts = 0
+    state = None
+    while True:
+        attempts += 1
+        try:
+            async with semaphore:
+                state = await loop.run_in_executor(_executor, get_state, target)
+        except Exception as err:
+            logging.info("Failed to get %s %s state: %s", target.kind, target.name, err)
+            return WaitResult(target.kind, target.name, FAILED, state, attempts, time.monotonic() - start, str(err))
+        elapsed_seconds = time.monotonic() - start
+        if state == target.expected_state:
+            logging.info("%s %s is %s after %.1f seconds", target.kind, target.name, state, elapsed_seconds)
+            return WaitResult(target.kind, target.name, SUCCEEDED, state, attempts, elapsed_seconds)
+        if is_failure_state(target, state):
+            logging.info("%s %s reached failure state %s", target.kind, target.name, state)
+            return WaitResult(target.kind, target.name, FAILED, state, attempts, elapsed_seconds, "Unexpected state %s" % state)
+        delay = get_backoff_delay(attempts - 1)
+        if elapsed_seconds + delay > deadline_seconds:
+            logging.info("%s %s still %s after %.1f seconds, giving up", target.kind, target.name, state, elapsed_seconds)
+            return WaitResult(target.kind, target.name, TIMED_OUT, state, attempts, elapsed_seconds, "Deadline of %s seconds exceeded" % deadline_seconds)
+        logging.info("%s %s status is %s, checking again in %.1f seconds", target.kind, target.name, state, delay)
+        await asyncio.sleep(delay)
+
+async def wait_for_all(targets, max_concurrent_calls=MAX_CONCURRENT_CALLS):
+    # Waiting happens in the event loop, threads are only held for the duration of a describe call
+    asyncio = import_asyncio()
+    semaphore = asyncio.Semaphore(max_concurrent_calls)
+    return await asyncio.gather(*(wait_for(target, semaphore) for target in targets))
+
+def submit(targets, max_concurrent_calls=MAX_CONCURRENT_CALLS):
+    # Returns a concurrent.futures.Future of the results, the caller's thread is free until it asks for them
+    loop = get_loop()
+    return import_asyncio().run_coroutine_threadsafe(wait_for_all(list(targets), max_concurrent_calls), loop)
+
+def wait(targets, max_concurrent_calls=MAX_CONCURRENT_CALLS):
+    return submit(targets, max_concurrent_calls).result()
+
+def wait_or_raise(targets, max_concurrent_calls=MAX_CONCURRENT_CALLS):
+    results = wait(targets, max_concurrent_calls)
+    failed_results = [result for result in results if not result.succeeded]
+    if failed_results:
+        raise Exception("Wait failed for %s" % ", ".join("%s %s (%s: %s)" % (result.kind, result.name, result.status, result.error) for result in failed_results))
+    return results
@@ -0,0 +1,99 @@
+import argparse
+import aws_clients
+import fake_dynamodb
+import logging
+import restore_dynamodb
+import sys
+import threading
+import time
+import waiters
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Utility to test waiting for DynamoDB tables")
+    parser.add_argument("--table-name", dest="table_name", action="store", default='waiters-test')
+    parser.add_argument("--table-count", dest="table_count", action="store", type=int, default=8)
+    parser.add_argument("--aws-profile", dest="aws_profile", action="store", default='default')
+    parser.add_argument("--offline", dest="offline", action="store_true", help="Run against the in-process DynamoDB stand-in instead of AWS")
+    return parser
+
+def create_table(table_name, aws_profile):
+    client = aws_clients.get_dynamodb_client(aws_profile)
+    client.create_table(TableName = table_name, AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}], KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}], BillingMode="PAY_PER_REQUEST")
+
+def get_loop_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "waiters-loop"]
+
+def test_missing_table_fails(args):
+    try:
+        logging.info("############-test_missing_table_fails-#############")
+        table_name = args.table_name + "-missing"
+        restore_dynamodb.delete_table_if_exist(table_name, args.aws_profile)
+        start = time.monotonic()
+        result = waiters.wait([waiters.table_active(table_name, args.aws_profile)])[0]
+        if result.status != waiters.FAILED or result.state != waiters.NOT_FOUND or result.attempts != 1:
+            raise Exception("Expected waiting for a missing table to fail on the first check, got %s" % (result,))
+        if time.monotonic() - start > 5:
+            raise Exception("Waiting for a missing table took %.1f seconds" % (time.monotonic() - start))
+        if not waiters.wait([waiters.table_not_exists(table_name, args.aws_profile)])[0].succeeded:
+            raise Exception("Expected table_not_exists to succeed for a missing table")
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def test_waits_from_many_threads_share_one_loop(args):
+    try:
+        logging.info("############-test_waits_from_many_threads_share_one_loop-#############")
+        table_names = ["%s-%s" % (args.table_name, index) for index in range(args.table_count)]
+        for table_name in table_names:
+            restore_dynamodb.delete_table_if_exist(table_name, args.aws_profile)
+            create_table(table_name, args.aws_profile)
+        results = {}
+
+        def wait_for_table(table_name):
+            results[table_name] = waiters.wait([waiters.table_active(table_name, args.aws_profile)])[0]
+
+        threads = [threading.Thread(target=wait_for_table, args=(table_name,)) for table_name in table_names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        failed_results = [result for result in results.values() if not result.succeeded]
+        if len(results) != len(table_names) or failed_results:
+            raise Exception("Expected every table active, got %s" % list(results.values()))
+        if len(get_loop_threads()) != 1:
+            raise Exception("Expected one event loop thread for all waits, got %s" % len(get_loop_threads()))
+        future = waiters.submit([waiters.table_active(table_name, args.aws_profile) for table_name in table_names])
+        if not all(result.succeeded for result in future.result()):
+            raise Exception("Expected the submitted waits to succeed, got %s" % future.result())
+        logging.info("Test Successful!")
+        return 0
+    except Exception:
+        logging.exception("Test Failed!")
+        return 1
+
+def log_test_status_successful_if_0(status, test_name):
+    if status == 1:
+        logging.info("%s FAILED", test_name)
+    else:
+        logging.info("%s SUCCESSFUL", test_name)
+
+if __name__ == "__main__":
+    args = get_args_parser().parse_args()
+    if args.offline:
+        fake_dynamodb.install(fake_dynamodb.FakeDynamoDBClient(creating_seconds=2))
+
+    test_1_status = test_missing_table_fails(args)
+    test_2_status = test_waits_from_many_threads_share_one_loop(args)
+
+    log_test_status_successful_if_0(test_1_status, "test_missing_table_fails")
+    log_test_status_successful_if_0(test_2_status, "test_waits_from_many_threads_share_one_loop")
+
+    if test_1_status == 0 and test_2_status == 0:
+        logging.info("Test Case Succeeded!")
+        sys.exit(0)
+    sys.exit(1)